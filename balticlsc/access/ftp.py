@@ -1,8 +1,16 @@
+import os
+import posixpath
+import threading
+import time
+from contextlib import contextmanager
 from ftplib import FTP, error_perm
-from typing import IO
+from tempfile import SpooledTemporaryFile
+from typing import IO, Dict, List, Tuple, Iterator, Union
 
 from balticlsc.configs.credential.ftp import FTPCredential
+from balticlsc.scheme import metrics
 from balticlsc.scheme.logger import logger
+from balticlsc.scheme.tracing import span
 # Hacking the FTP library
 _old_makepasv = FTP.makepasv
 
@@ -16,39 +24,361 @@ def _new_makepasv(self):
 FTP.makepasv = _new_makepasv
 # Hacking the FTP library
 MAX_CONNECTING_RETRIES = 10
+SYS_FTP_POOL_SIZE = int(os.getenv('SYS_FTP_POOL_SIZE', 4))
+SYS_FTP_POOL_IDLE_TIME = float(os.getenv('SYS_FTP_POOL_IDLE_TIME', 60.0))
+SYS_FTP_POOL_CHECK_INTERVAL = float(os.getenv('SYS_FTP_POOL_CHECK_INTERVAL', 1.0))
+SYS_FTP_SPOOL_THRESHOLD = int(os.getenv('SYS_FTP_SPOOL_THRESHOLD', 64 * 1024 * 1024))
+SYS_FTP_BLOCK_SIZE = int(os.getenv('SYS_FTP_BLOCK_SIZE', 64 * 1024))
+transferred_bytes = metrics.counter('balticlsc_ftp_transferred_bytes_total',
+                                    'Bytes transferred over FTP.', ['direction'])
+transfer_time = metrics.histogram('balticlsc_ftp_transfer_seconds', 'Time of FTP file transfers.', ['direction'])
 
 
-def upload_file(filename: str, dir_name: str, ftp: FTP, file: IO) -> None:
-    chdir(dir_name, ftp)
-    ftp.storbinary('STOR ' + filename, file)
+class CachingFTP(FTP):
+    """FTP connection remembering its working directory and the directories known to exist.
+
+    Changing to the current working directory does not reach the server.
+    Relative paths are resolved against the working directory once it is
+    known (after `pwd` or a `cwd` to an absolute path).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.current_dir: Union[str, None] = None
+        self.known_dirs = set()
+
+    def resolve(self, path: str) -> Union[str, None]:
+        if posixpath.isabs(path):
+            return posixpath.normpath(path)
+
+        if self.current_dir is None:
+            return None
+
+        return posixpath.normpath(posixpath.join(self.current_dir, path))
+
+    def cwd(self, dirname: str) -> str:
+        path = self.resolve(dirname)
+
+        if path is not None and path == self.current_dir:
+            return '250 working directory unchanged'
+
+        response = super().cwd(dirname)
+        self.current_dir = path
+
+        if path is not None:
+            self.known_dirs.add(path)
+
+        return response
+
+    def pwd(self) -> str:
+        if self.current_dir is None:
+            self.current_dir = super().pwd()
+            self.known_dirs.add(self.current_dir)
+
+        return self.current_dir
+
+    def mkd(self, dirname: str) -> str:
+        response = super().mkd(dirname)
+        path = self.resolve(dirname)
+
+        if path is not None:
+            self.known_dirs.add(path)
+
+        return response
+
+    def rmd(self, dirname: str) -> str:
+        response = super().rmd(dirname)
+        path = self.resolve(dirname)
+
+        if path is None:
+            self.known_dirs.clear()
+        else:
+            self.known_dirs = {known for known in self.known_dirs
+                               if known != path and not known.startswith(path.rstrip('/') + '/')}
+
+        return response
+
+
+def upload_file(filename: str, dir_name: str, ftp: FTP, file: IO, blocksize: int = SYS_FTP_BLOCK_SIZE) -> None:
+    # the file is stored by its path, the working directory of the connection does not change
+    with span('ftp upload'):
+        make_dir(dir_name, ftp)
+        started_at = time.monotonic()
+        ftp.storbinary('STOR ' + posixpath.join(dir_name, filename), file, blocksize,
+                       callback=lambda block: transferred_bytes.inc(len(block), direction='upload'))
+        transfer_time.observe(time.monotonic() - started_at, direction='upload')
+
+
+def upload_buffer(filename: str, dir_name: str, ftp: FTP, data: Union[bytes, bytearray, memoryview, IO],
+                  blocksize: int = SYS_FTP_BLOCK_SIZE) -> None:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = _MemoryReader(data)
+
+    upload_file(filename, dir_name, ftp, data, blocksize)
+
+
+def download_buffer(path: str, ftp: FTP, buffer: Union[IO, None] = None,
+                    max_memory_size: int = SYS_FTP_SPOOL_THRESHOLD, blocksize: int = SYS_FTP_BLOCK_SIZE) -> IO:
+    """Download a file into memory without touching the disk.
+
+    The given buffer (e.g. a `BytesIO` reused between files) is rewound and
+    truncated before the download. Without a buffer, the file is kept in a
+    `SpooledTemporaryFile` moving to the disk above `max_memory_size` bytes.
+    The returned buffer is rewound to the beginning.
+    """
+    if buffer is None:
+        buffer = SpooledTemporaryFile(max_size=max_memory_size)
+    else:
+        buffer.seek(0)
+        buffer.truncate()
+
+    with span('ftp download'):
+        started_at = time.monotonic()
+        ftp.retrbinary('RETR ' + path, buffer.write, blocksize)
+        transfer_time.observe(time.monotonic() - started_at, direction='download')
+
+    transferred_bytes.inc(buffer.tell(), direction='download')
+    buffer.seek(0)
+    return buffer
+
+
+class _MemoryReader:
+    # file-like view of a buffer, the chunks passed to the socket are not copied
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
+        self._view = memoryview(data).cast('B')
+        self._position = 0
+
+    def read(self, size: int = -1) -> memoryview:
+        start = self._position
+        end = len(self._view) if size < 0 else min(start + size, len(self._view))
+        self._position = end
+        return self._view[start:end]
 
 
 def chdir(dir_name: str, ftp: FTP) -> None:
+    make_dir(dir_name, ftp)
+    ftp.cwd(dir_name)
+
+
+def make_dir(dir_name: str, ftp: FTP) -> None:
+    path = ftp.resolve(dir_name) if isinstance(ftp, CachingFTP) else None
+
+    if path is not None and path in ftp.known_dirs:
+        return
+
     try:
         ftp.mkd(dir_name)
     except error_perm as ep:
-        if 'exists' not in str(ep) and 'Create directory operation failed' not in str(ep):
-            raise error_perm
+        if 'exists' in str(ep) or 'Create directory operation failed' in str(ep):
+            if path is not None:
+                ftp.known_dirs.add(path)
 
-    ftp.cwd(dir_name)
+            return
+
+        parent = posixpath.dirname(dir_name.rstrip('/'))
+
+        if parent in ('', '/', dir_name):
+            raise
+
+        # creating the missing parent directories
+        make_dir(parent, ftp)
+        ftp.mkd(dir_name)
 
 
-def get_connection(credential: FTPCredential) -> FTP:
+def get_connection(credential: FTPCredential) -> CachingFTP:
     retries = 0
 
     while retries < MAX_CONNECTING_RETRIES:
         retries += 1
 
         try:
-            connection = FTP()
+            connection = CachingFTP()
             connection.connect(credential.host, credential.port)
             connection.sendcmd('USER ' + credential.user)
             connection.sendcmd('PASS ' + credential.password)
             return connection
         except BaseException as exception:
-            error_msg = 'connecting to FTP ' + str(retries) + ' retries, exception:' + str(exception)
-            logger.warning(error_msg)
+            logger.warning('connecting to FTP %d retries, exception: %s', retries, exception)
 
     error_msg = 'connecting to FTP exceeded max retries = ' + str(retries)
     logger.error(error_msg)
     raise RuntimeError(error_msg)
+
+
+class FTPConnectionPool:
+    """Thread safe pool of logged in connections to one FTP server.
+
+    Idle connections are checked with NOOP before being handed out (unless
+    they were used within the last `check_interval` seconds) and closed
+    after `max_idle_time` seconds. At most `max_size` connections are open
+    at the same time, `acquire` waits for a free one above that limit.
+    """
+
+    def __init__(self, credential: FTPCredential, max_size: int = SYS_FTP_POOL_SIZE,
+                 max_idle_time: float = SYS_FTP_POOL_IDLE_TIME, check_interval: float = SYS_FTP_POOL_CHECK_INTERVAL):
+        if max_size < 1:
+            raise ValueError(f'FTP pool needs at least one connection, got {max_size}')
+
+        self.credential = credential
+        self._max_size = max_size
+        self._max_idle_time = max_idle_time
+        self._check_interval = check_interval
+        self._condition = threading.Condition()
+        # (connection, home directory, time of release)
+        self._idle: List[Tuple[FTP, str, float]] = []
+        self._connection_to_home: Dict[FTP, str] = {}
+        self._size = 0
+
+    def acquire(self, timeout: float = None) -> FTP:
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            idle = self._take_idle(deadline, timeout)
+
+            if idle is None:
+                break
+
+            connection, home, released_at = idle
+
+            if time.monotonic() - released_at < self._check_interval or self._is_alive(connection):
+                self._connection_to_home[connection] = home
+                return connection
+
+            self._discard(connection)
+
+        connection = None
+
+        try:
+            connection = get_connection(self.credential)
+            self._connection_to_home[connection] = connection.pwd()
+            return connection
+        except BaseException:
+            if connection is not None:
+                # logged in, but not usable
+                connection.close()
+
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection: FTP, discard: bool = False) -> None:
+        home = self._connection_to_home.pop(connection, None)
+
+        if home is None:
+            raise ValueError('the connection does not belong to the pool')
+
+        if not discard:
+            try:
+                connection.cwd(home)
+            except BaseException as exception:
+                logger.warning('discarding FTP connection, exception: %s', exception)
+                discard = True
+
+        if discard:
+            self._discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, home, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: float = None) -> Iterator[FTP]:
+        connection = self.acquire(timeout)
+
+        try:
+            yield connection
+        except BaseException:
+            # the state of the connection is unknown after an error
+            self.release(connection, discard=True)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self) -> None:
+        with self._condition:
+            idle, self._idle = self._idle, []
+
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+    # returns an idle connection or None when a new one can be opened
+    def _take_idle(self, deadline: float, timeout: float) -> Union[Tuple[FTP, str, float], None]:
+        with self._condition:
+            while True:
+                self._close_expired()
+
+                if self._idle:
+                    return self._idle.pop()
+
+                if self._size < self._max_size:
+                    self._size += 1
+                    return None
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+
+                if remaining is not None and remaining <= 0:
+                    raise RuntimeError(f'no free FTP connection to {self.credential.host} within {timeout}s')
+
+                self._condition.wait(remaining)
+
+    def _close_expired(self) -> None:
+        now = time.monotonic()
+        expired = [item[0] for item in self._idle if now - item[2] > self._max_idle_time]
+
+        if expired:
+            self._idle = [item for item in self._idle if now - item[2] <= self._max_idle_time]
+            self._size -= len(expired)
+
+            # the server has probably dropped them already, closing the sockets without QUIT
+            for connection in expired:
+                connection.close()
+
+    def _discard(self, connection: FTP) -> None:
+        _quit(connection)
+
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _is_alive(connection: FTP) -> bool:
+        try:
+            connection.voidcmd('NOOP')
+            return True
+        except BaseException:
+            return False
+
+
+def _quit(connection: FTP) -> None:
+    try:
+        connection.quit()
+    except BaseException:
+        connection.close()
+
+
+__pools: Dict[Tuple[str, int, str], FTPConnectionPool] = {}
+__pools_lock = threading.Lock()
+
+
+def get_pool(credential: FTPCredential) -> FTPConnectionPool:
+    key = (credential.host, int(credential.port), credential.user)
+
+    with __pools_lock:
+        pool = __pools.get(key)
+
+        if pool is None:
+            pool = FTPConnectionPool(credential)
+            __pools[key] = pool
+        else:
+            # new connections are opened with the latest credential
+            pool.credential = credential
+
+        return pool
+
+
+@contextmanager
+def pooled_connection(credential: FTPCredential, timeout: float = None) -> Iterator[FTP]:
+    with get_pool(credential).connection(timeout) as connection:
+        yield connection
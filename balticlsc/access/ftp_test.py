@@ -0,0 +1,257 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+from ftplib import parse257, error_perm
+from io import BytesIO
+from unittest import mock
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.ioloop import IOLoop
+from pyftpdlib.servers import ThreadedFTPServer
+
+from balticlsc.access import ftp as ftp_module
+from balticlsc.access.ftp import FTPConnectionPool, get_pool, pooled_connection, upload_buffer, download_buffer, \
+    get_connection, make_dir, chdir
+from balticlsc.configs.credential.ftp import FTPCredential
+
+# the server logs every command
+logging.getLogger('pyftpdlib').addHandler(logging.NullHandler())
+logging.getLogger('pyftpdlib').propagate = False
+
+
+class LocalFTPServer:
+    """FTP server serving the root directory on a free local port."""
+
+    def __init__(self, root: str, **handler_attributes):
+        authorizer = DummyAuthorizer()
+        authorizer.add_user('user', 'password', root, perm='elradfmwMT')
+        handler = type('Handler', (FTPHandler,), dict(handler_attributes, authorizer=authorizer))
+        # a loop of its own, the shared one is closed with the previous server
+        self._server = ThreadedFTPServer(('127.0.0.1', 0), handler, ioloop=IOLoop())
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ftp server')
+        self._thread.daemon = True
+        self._thread.start()
+        host, port = self._server.address
+        self.credential = FTPCredential(host, 'user', 'password', port)
+
+    def close(self) -> None:
+        self._server.close()
+        # the stopping server signals its connections to exit, the next one must not start before
+        self._thread.join(5)
+
+
+class TestFTPConnectionPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.TemporaryDirectory()
+        cls.server = LocalFTPServer(cls.root.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        cls.root.cleanup()
+
+    def test_reuses_released_connection(self):
+        pool = FTPConnectionPool(self.server.credential, max_size=2)
+
+        with pool.connection() as first:
+            first.mkd('/reused')
+            first.cwd('/reused')
+
+        with pool.connection() as second:
+            self.assertIs(second, first)
+            # the released connection is back in its home directory
+            self.assertEqual(parse257(second.sendcmd('PWD')), '/')
+
+        pool.close()
+
+    def test_discards_connection_after_error(self):
+        pool = FTPConnectionPool(self.server.credential, max_size=1)
+
+        with self.assertRaises(RuntimeError):
+            with pool.connection() as first:
+                raise RuntimeError('processing failed')
+
+        with pool.connection(timeout=5) as second:
+            self.assertIsNot(second, first)
+
+        pool.close()
+
+    def test_evicts_idle_and_dead_connections(self):
+        pool = FTPConnectionPool(self.server.credential, max_size=1, max_idle_time=0.05, check_interval=0.0)
+
+        with pool.connection() as first:
+            pass
+
+        time.sleep(0.1)
+
+        with pool.connection() as second:
+            self.assertIsNot(second, first)
+            self.assertIsNone(first.sock)
+
+        # dropped without the pool knowing, the NOOP check fails
+        second.close()
+
+        with pool.connection() as third:
+            self.assertIsNot(third, second)
+            third.voidcmd('NOOP')
+
+        pool.close()
+
+    def test_waits_for_free_connection(self):
+        pool = FTPConnectionPool(self.server.credential, max_size=1)
+        first = pool.acquire()
+
+        with self.assertRaises(RuntimeError):
+            pool.acquire(timeout=0.1)
+
+        release = threading.Timer(0.1, pool.release, (first,))
+        release.start()
+        self.assertIs(pool.acquire(timeout=5), first)
+        release.join()
+        pool.release(first)
+        pool.close()
+
+    def test_closes_connection_failing_after_login(self):
+        pool = FTPConnectionPool(self.server.credential, max_size=1)
+        connections = []
+
+        def get_failing_connection(credential):
+            connection = get_connection(credential)
+            connection.pwd = mock.Mock(side_effect=error_perm('550 no home directory'))
+            connections.append(connection)
+            return connection
+
+        with mock.patch.object(ftp_module, 'get_connection', get_failing_connection):
+            with self.assertRaises(error_perm):
+                pool.acquire()
+
+        self.assertIsNone(connections[0].sock)
+
+        # the slot of the failed connection is free again
+        with pool.connection(timeout=5) as connection:
+            self.assertIsNot(connection, connections[0])
+
+        pool.close()
+
+    def test_pool_is_shared_per_server_and_user(self):
+        credential = FTPCredential(self.server.credential.host, 'user', 'password', str(self.server.credential.port))
+        self.assertIs(get_pool(credential), get_pool(self.server.credential))
+
+        with pooled_connection(self.server.credential) as first:
+            pass
+
+        with pooled_connection(credential) as second:
+            self.assertIs(second, first)
+
+
+class TestCachingFTP(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.TemporaryDirectory()
+        cls.server = LocalFTPServer(cls.root.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        cls.root.cleanup()
+
+    def setUp(self):
+        self.ftp = get_connection(self.server.credential)
+        self.commands = []
+        put_command = self.ftp.putcmd
+
+        # every command of ftplib is sent through it
+        def record(command: str) -> None:
+            self.commands.append(command.split()[0])
+            put_command(command)
+
+        self.ftp.putcmd = record
+
+    def tearDown(self):
+        self.ftp.close()
+
+    def test_unchanged_directory_is_not_changed_again(self):
+        self.assertEqual(self.ftp.pwd(), '/')
+        chdir('/cached/dir', self.ftp)
+        self.ftp.cwd('/cached/dir')
+        self.ftp.cwd('.')
+        self.ftp.cwd('../dir')
+        self.assertEqual(self.commands, ['PWD', 'MKD', 'MKD', 'MKD', 'CWD'])
+        self.assertEqual(self.ftp.pwd(), '/cached/dir')
+
+    def test_relative_path_before_pwd_reaches_server(self):
+        make_dir('/relative', self.ftp)
+        self.ftp.cwd('relative')
+        self.ftp.cwd('..')
+        self.assertIsNone(self.ftp.current_dir)
+        self.assertEqual(self.commands, ['MKD', 'CWD', 'CDUP'])
+        self.assertEqual(self.ftp.pwd(), '/')
+
+    def test_removed_directory_is_created_again(self):
+        make_dir('/removed/child', self.ftp)
+        make_dir('/removed/child', self.ftp)
+        self.assertEqual(self.commands.count('MKD'), 3)
+
+        self.ftp.rmd('/removed/child')
+        self.ftp.rmd('/removed')
+        self.assertNotIn('/removed/child', self.ftp.known_dirs)
+
+        make_dir('/removed/child', self.ftp)
+        self.assertEqual(self.commands.count('MKD'), 6)
+        self.assertTrue(os.path.isdir(os.path.join(self.root.name, 'removed', 'child')))
+
+
+class TestBuffers(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.TemporaryDirectory()
+        cls.server = LocalFTPServer(cls.root.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        cls.root.cleanup()
+
+    def _read(self, path: str) -> bytes:
+        with open(os.path.join(self.root.name, path), 'rb') as file:
+            return file.read()
+
+    def test_uploads_buffers(self):
+        data = bytearray(os.urandom(100 * 1024))
+
+        with pooled_connection(self.server.credential) as ftp:
+            upload_buffer('bytes.bin', '/buffers/nested', ftp, bytes(data), blocksize=4096)
+            upload_buffer('view.bin', '/buffers/nested', ftp, memoryview(data)[1024:])
+            upload_buffer('file.bin', '/buffers', ftp, BytesIO(b'file'))
+            upload_buffer('empty.bin', '/buffers', ftp, b'')
+
+        self.assertEqual(self._read('buffers/nested/bytes.bin'), data)
+        self.assertEqual(self._read('buffers/nested/view.bin'), data[1024:])
+        self.assertEqual(self._read('buffers/file.bin'), b'file')
+        self.assertEqual(self._read('buffers/empty.bin'), b'')
+
+    def test_downloads_into_buffer(self):
+        data = os.urandom(10 * 1024)
+
+        with open(os.path.join(self.root.name, 'download.bin'), 'wb') as file:
+            file.write(data)
+
+        buffer = BytesIO(b'previous file, longer than the downloaded one' * 1024)
+
+        with pooled_connection(self.server.credential) as ftp:
+            self.assertIs(download_buffer('/download.bin', ftp, buffer), buffer)
+            self.assertEqual(buffer.tell(), 0)
+            self.assertEqual(buffer.getvalue(), data)
+
+            # spooled to a temporary file above the memory size
+            with download_buffer('/download.bin', ftp, max_memory_size=1024) as spooled:
+                self.assertEqual(spooled.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
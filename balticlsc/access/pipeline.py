@@ -0,0 +1,154 @@
+import contextvars
+import os
+import posixpath
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Iterator, Iterable, Tuple, List, Deque, Union, IO
+
+from balticlsc.access.ftp import pooled_connection, upload_buffer, download_buffer, SYS_FTP_SPOOL_THRESHOLD
+from balticlsc.configs.credential.ftp import FTPCredential
+from balticlsc.scheme.logger import logger
+from balticlsc.scheme.tracing import span
+
+SYS_FTP_PREFETCH = int(os.getenv('SYS_FTP_PREFETCH', 4))
+SYS_FTP_DOWNLOAD_WORKERS = int(os.getenv('SYS_FTP_DOWNLOAD_WORKERS', 2))
+SYS_FTP_UPLOAD_WORKERS = int(os.getenv('SYS_FTP_UPLOAD_WORKERS', 2))
+
+
+class FTPPipeline:
+    """Overlaps FTP transfers with the processing of files.
+
+    While the module processes the current file, the next `prefetch` files
+    are downloaded by `download_workers` threads and the finished results
+    are uploaded by `upload_workers` threads, each transfer over its own
+    pooled connection. Usage:
+
+        with FTPPipeline(input_credential, input_folder, output_credential, output_folder) as pipeline:
+            for filename, file in pipeline.files(pipeline.list()):
+                pipeline.upload(filename, process(file.read()))
+
+    The files are kept in memory, the ones larger than `max_memory_size`
+    bytes in temporary files. A yielded file is closed when the iteration
+    moves on, a file passed to `upload` is closed after the upload.
+    Leaving the context waits for the pending uploads and raises the
+    first upload error, if any.
+    """
+
+    def __init__(self, input_credential: FTPCredential, input_folder: str,
+                 output_credential: Union[FTPCredential, None] = None, output_folder: Union[str, None] = None,
+                 prefetch: int = SYS_FTP_PREFETCH, download_workers: int = SYS_FTP_DOWNLOAD_WORKERS,
+                 upload_workers: int = SYS_FTP_UPLOAD_WORKERS, max_memory_size: int = SYS_FTP_SPOOL_THRESHOLD):
+        if prefetch < 1 or download_workers < 1 or upload_workers < 1:
+            raise ValueError(f'pipeline limits have to be positive, got prefetch={prefetch}, '
+                             f'download_workers={download_workers}, upload_workers={upload_workers}')
+
+        self._input_credential = input_credential
+        self._input_folder = input_folder
+        self._output_credential = input_credential if output_credential is None else output_credential
+        self._output_folder = output_folder
+        self._prefetch = prefetch
+        self._max_memory_size = max_memory_size
+        self._downloads = ThreadPoolExecutor(download_workers, thread_name_prefix='ftp download')
+        self._uploads = ThreadPoolExecutor(upload_workers, thread_name_prefix='ftp upload')
+        # limits the number of results kept in memory while waiting for upload
+        self._upload_slots = threading.BoundedSemaphore(upload_workers + prefetch)
+        self._upload_futures: List[Future] = []
+
+    def __enter__(self) -> 'FTPPipeline':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            if exc_type is None:
+                self.wait_for_uploads()
+        finally:
+            self._downloads.shutdown(wait=True)
+            self._uploads.shutdown(wait=True)
+
+    def list(self) -> List[str]:
+        with pooled_connection(self._input_credential) as ftp:
+            return [posixpath.basename(path) for path in ftp.nlst(self._input_folder)]
+
+    def files(self, filenames: Iterable[str]) -> Iterator[Tuple[str, IO]]:
+        pending: Deque[Tuple[str, Future]] = deque()
+        filenames = iter(filenames)
+
+        def fill():
+            while len(pending) < self._prefetch:
+                filename = next(filenames, None)
+
+                if filename is None:
+                    return
+
+                # traced (and logged) as a part of the token being processed
+                pending.append((filename, self._downloads.submit(contextvars.copy_context().run, self._download,
+                                                                 filename)))
+
+        fill()
+
+        try:
+            while pending:
+                filename, future = pending.popleft()
+                fill()
+                # the time the processing waits for the prefetched file
+                with span('ftp download wait'):
+                    file = future.result()
+
+                try:
+                    yield filename, file
+                finally:
+                    file.close()
+        finally:
+            # the consumer stopped early, dropping the prefetched files
+            for _, future in pending:
+                if not future.cancel() and future.exception() is None:
+                    future.result().close()
+
+    def upload(self, filename: str, data: Union[bytes, bytearray, memoryview, IO]) -> None:
+        if self._output_folder is None:
+            raise ValueError('output folder of the pipeline is not set')
+
+        self._raise_upload_error()
+        self._upload_slots.acquire()
+
+        try:
+            future = self._uploads.submit(contextvars.copy_context().run, self._upload, filename, data)
+        except BaseException:
+            self._upload_slots.release()
+            raise
+
+        future.add_done_callback(lambda _: self._upload_slots.release())
+        self._upload_futures.append(future)
+
+    def wait_for_uploads(self) -> None:
+        futures, self._upload_futures = self._upload_futures, []
+
+        for future in futures:
+            future.result()
+
+    def _raise_upload_error(self) -> None:
+        done = [future for future in self._upload_futures if future.done()]
+
+        if done:
+            self._upload_futures = [future for future in self._upload_futures if not future.done()]
+
+            for future in done:
+                future.result()
+
+    def _download(self, filename: str) -> IO:
+        logger.info('downloading file "%s"', filename)
+
+        with span('ftp download'), pooled_connection(self._input_credential) as ftp:
+            return download_buffer(posixpath.join(self._input_folder, filename), ftp,
+                                   max_memory_size=self._max_memory_size)
+
+    def _upload(self, filename: str, data: Union[bytes, bytearray, memoryview, IO]) -> None:
+        logger.info('uploading file "%s" into %s', filename, self._output_folder)
+
+        try:
+            with span('ftp upload'), pooled_connection(self._output_credential) as ftp:
+                upload_buffer(filename, self._output_folder, ftp, data)
+        finally:
+            if hasattr(data, 'close'):
+                data.close()
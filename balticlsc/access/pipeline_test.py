@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from ftplib import error_perm
+
+from balticlsc.access.ftp_test import LocalFTPServer
+from balticlsc.access.pipeline import FTPPipeline
+from balticlsc.scheme.tracing import trace_token
+
+
+class TestFTPPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.TemporaryDirectory()
+        cls.server = LocalFTPServer(cls.root.name)
+        os.mkdir(os.path.join(cls.root.name, 'in'))
+
+        for index in range(5):
+            with open(os.path.join(cls.root.name, 'in', f'{index}.txt'), 'wb') as file:
+                file.write(f'file {index}'.encode())
+
+        # the output folder can not be created, a file has its name
+        with open(os.path.join(cls.root.name, 'blocker'), 'wb'):
+            pass
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        cls.root.cleanup()
+
+    def test_processes_all_files(self):
+        with FTPPipeline(self.server.credential, '/in', output_folder='/out', prefetch=2) as pipeline:
+            for filename, file in pipeline.files(sorted(pipeline.list())):
+                pipeline.upload(filename, file.read().upper())
+
+        output_folder = os.path.join(self.root.name, 'out')
+        self.assertEqual(sorted(os.listdir(output_folder)), [f'{index}.txt' for index in range(5)])
+
+        with open(os.path.join(output_folder, '3.txt'), 'rb') as file:
+            self.assertEqual(file.read(), b'FILE 3')
+
+    def test_transfers_are_traced_as_part_of_token(self):
+        with trace_token('1') as root:
+            with FTPPipeline(self.server.credential, '/in', output_folder='/traced', prefetch=2) as pipeline:
+                for filename, file in pipeline.files(['0.txt', '1.txt']):
+                    pipeline.upload(filename, file.read())
+
+        names = [child['name'] for child in root.to_dict()['children']]
+        self.assertEqual(names.count('ftp download'), 2)
+        self.assertEqual(names.count('ftp upload'), 2)
+        self.assertEqual(names.count('ftp download wait'), 2)
+
+    def test_raises_upload_error(self):
+        with self.assertRaises(error_perm):
+            with FTPPipeline(self.server.credential, '/in', output_folder='/blocker') as pipeline:
+                for filename, file in pipeline.files(pipeline.list()):
+                    pipeline.upload(filename, file.read())
+
+    def test_wait_for_uploads_raises_upload_error(self):
+        with FTPPipeline(self.server.credential, '/in', output_folder='/blocker') as pipeline:
+            pipeline.upload('a.txt', b'a')
+
+            with self.assertRaises(error_perm):
+                pipeline.wait_for_uploads()
+
+            # the error is raised once
+            pipeline.wait_for_uploads()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import os
+import time
+from ftplib import FTP, error_perm, error_temp
+from typing import IO, Callable, Iterator, Union, TYPE_CHECKING
+
+from balticlsc.access.ftp import pooled_connection, transferred_bytes, transfer_time, SYS_FTP_BLOCK_SIZE
+from balticlsc.configs.credential.ftp import FTPCredential
+from balticlsc.scheme.logger import logger
+from balticlsc.scheme.status import ComputationStatus
+
+if TYPE_CHECKING:
+    from balticlsc.scheme.job_rest_client import JobRestClient
+
+SYS_FTP_TRANSFER_RETRIES = int(os.getenv('SYS_FTP_TRANSFER_RETRIES', 5))
+# errors after which the transfer is resumed on a new connection
+_TRANSFER_ERRORS = (OSError, EOFError, error_temp)
+# called with the number of bytes transferred so far and the total size (None when unknown)
+ProgressCallback = Callable[[int, Union[int, None]], None]
+
+
+def iter_chunks(credential: FTPCredential, path: str, chunk_size: int = SYS_FTP_BLOCK_SIZE, offset: int = 0,
+                progress: Union[ProgressCallback, None] = None,
+                retries: int = SYS_FTP_TRANSFER_RETRIES) -> Iterator[bytes]:
+    """Download a file chunk by chunk without loading it whole into memory.
+
+    When the connection drops, the download is resumed with REST from the
+    last received byte on a new connection, at most `retries` times.
+    """
+    total = None
+    failures = 0
+    started_at = time.monotonic()
+
+    while True:
+        try:
+            with pooled_connection(credential) as ftp:
+                if total is None:
+                    total = _get_size(ftp, path)
+
+                ftp.voidcmd('TYPE I')
+
+                with ftp.transfercmd('RETR ' + path, rest=offset or None) as data_connection:
+                    while True:
+                        chunk = data_connection.recv(chunk_size)
+
+                        if not chunk:
+                            break
+
+                        offset += len(chunk)
+                        transferred_bytes.inc(len(chunk), direction='download')
+                        yield chunk
+
+                        if progress is not None:
+                            progress(offset, total)
+
+                ftp.voidresp()
+                transfer_time.observe(time.monotonic() - started_at, direction='download')
+                return
+        except _TRANSFER_ERRORS as exception:
+            failures += 1
+
+            if failures > retries:
+                raise
+
+            logger.warning('downloading "%s" interrupted at byte %d, resuming, exception: %s', path, offset, exception)
+
+
+def download_resumable(credential: FTPCredential, path: str, file: IO,
+                       progress: Union[ProgressCallback, None] = None,
+                       retries: int = SYS_FTP_TRANSFER_RETRIES) -> int:
+    written = 0
+
+    for chunk in iter_chunks(credential, path, progress=progress, retries=retries):
+        written += file.write(chunk)
+
+    return written
+
+
+def upload_resumable(credential: FTPCredential, path: str, file: IO,
+                     progress: Union[ProgressCallback, None] = None, retries: int = SYS_FTP_TRANSFER_RETRIES,
+                     blocksize: int = SYS_FTP_BLOCK_SIZE) -> None:
+    """Upload a seekable file from its current position.
+
+    When the connection drops, the size of the partially stored file is
+    read from the server and the upload continues from there with REST.
+    """
+    start = file.tell()
+    file.seek(0, os.SEEK_END)
+    total = file.tell() - start
+    offset = 0
+    failures = 0
+    started_at = time.monotonic()
+
+    while True:
+        try:
+            with pooled_connection(credential) as ftp:
+                if failures:
+                    offset = _get_size(ftp, path) or 0
+
+                file.seek(start + offset)
+                transferred = offset
+
+                def on_block(block: bytes):
+                    nonlocal transferred
+                    transferred += len(block)
+                    transferred_bytes.inc(len(block), direction='upload')
+
+                    if progress is not None:
+                        progress(transferred, total)
+
+                ftp.storbinary('STOR ' + path, file, blocksize, callback=on_block, rest=offset or None)
+                transfer_time.observe(time.monotonic() - started_at, direction='upload')
+                return
+        except _TRANSFER_ERRORS as exception:
+            failures += 1
+
+            if failures > retries:
+                raise
+
+            logger.warning('uploading "%s" interrupted, resuming, exception: %s', path, exception)
+
+
+def report_progress(rest_client: 'JobRestClient') -> ProgressCallback:
+    """Progress callback updating the job progress (0.0 - 1.0) of the module."""
+    def callback(transferred: int, total: Union[int, None]):
+        if total:
+            rest_client.update_status(status=ComputationStatus.Working, job_progress=transferred / total)
+
+    return callback
+
+
+def _get_size(ftp: FTP, path: str) -> Union[int, None]:
+    try:
+        ftp.voidcmd('TYPE I')
+        return ftp.size(path)
+    except error_perm:
+        return None
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+from ftplib import error_temp
+from io import BytesIO
+
+from pyftpdlib.filesystems import AbstractedFS
+
+from balticlsc.access.ftp_test import LocalFTPServer
+from balticlsc.access.resumable import download_resumable, upload_resumable, iter_chunks
+
+_SIZE = 300 * 1024
+_INTERRUPTED_AT = 100 * 1024
+
+
+class _InterruptedFile:
+    # fails reading at the given position, as a dropped connection
+    def __init__(self, file, fail_at: int):
+        self._file = file
+        self._fail_at = fail_at
+        self.failed = False
+        self.resumed_at = None
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.failed and self._file.tell() >= self._fail_at:
+            self.failed = True
+            raise OSError('connection reset')
+
+        if self.failed and self.resumed_at is None:
+            self.resumed_at = self._file.tell()
+
+        if not self.failed:
+            size = self._fail_at - self._file.tell() if size < 0 else min(size, self._fail_at - self._file.tell())
+
+        return self._file.read(size)
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
+
+
+class _InterruptingFS(AbstractedFS):
+    # the first download of every file is aborted by the server
+    opened = set()
+
+    def open(self, filename: str, mode: str):
+        file = super().open(filename, mode)
+
+        if 'r' in mode and filename not in self.opened:
+            self.opened.add(filename)
+            return _InterruptedFile(file, _INTERRUPTED_AT)
+
+        return file
+
+
+class TestResumable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.TemporaryDirectory()
+        # the file is read by the server, not sent by sendfile
+        cls.server = LocalFTPServer(cls.root.name, abstracted_fs=_InterruptingFS, use_sendfile=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+        cls.root.cleanup()
+
+    def setUp(self):
+        _InterruptingFS.opened = set()
+        self.data = os.urandom(_SIZE)
+
+    def test_resumes_interrupted_download(self):
+        with open(os.path.join(self.root.name, 'input.bin'), 'wb') as file:
+            file.write(self.data)
+
+        progress = []
+        file = BytesIO()
+        written = download_resumable(self.server.credential, '/input.bin', file,
+                                     progress=lambda transferred, total: progress.append((transferred, total)))
+
+        self.assertEqual(written, _SIZE)
+        self.assertEqual(file.getvalue(), self.data)
+        self.assertEqual(progress[-1], (_SIZE, _SIZE))
+        # the bytes before the interruption are not downloaded again
+        self.assertEqual(sorted(progress), progress)
+
+    def test_gives_up_after_retries(self):
+        with open(os.path.join(self.root.name, 'input.bin'), 'wb') as file:
+            file.write(self.data)
+
+        with self.assertRaises(error_temp):
+            list(iter_chunks(self.server.credential, '/input.bin', retries=0))
+
+    def test_resumes_interrupted_upload(self):
+        file = _InterruptedFile(BytesIO(self.data), _INTERRUPTED_AT)
+        upload_resumable(self.server.credential, '/output.bin', file, blocksize=8 * 1024)
+
+        self.assertTrue(file.failed)
+        # continued from the size of the partially stored file
+        self.assertEqual(file.resumed_at, _INTERRUPTED_AT)
+
+        with open(os.path.join(self.root.name, 'output.bin'), 'rb') as output:
+            self.assertEqual(output.read(), self.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import abc
+import mmap
+import os
+import posixpath
+from io import BytesIO
+from typing import List, Iterator, Union, IO, Dict, Callable, Any
+
+from balticlsc.access.ftp import pooled_connection, download_buffer, upload_buffer, SYS_FTP_BLOCK_SIZE
+from balticlsc.access.resumable import iter_chunks
+from balticlsc.configs.credential.ftp import FTPCredential
+from balticlsc.scheme.pin import Pin, PinAttribute, AccessType
+from balticlsc.scheme.utils import camel_to_snake
+
+Data = Union[bytes, bytearray, memoryview, IO]
+
+
+class Storage(metaclass=abc.ABCMeta):
+    """Access to the data of a pin, independent of the way it is stored."""
+
+    @abc.abstractmethod
+    def list(self, folder: str) -> List[str]:
+        """Names of the files in the folder."""
+        pass
+
+    @abc.abstractmethod
+    def get(self, path: str) -> Union[bytes, memoryview]:
+        """Whole content of the file."""
+        pass
+
+    @abc.abstractmethod
+    def put(self, path: str, data: Data) -> None:
+        """Store the data under the path, creating the missing parent folder."""
+        pass
+
+    @abc.abstractmethod
+    def stream(self, path: str, chunk_size: int = SYS_FTP_BLOCK_SIZE) -> Iterator[Union[bytes, memoryview]]:
+        """Content of the file chunk by chunk."""
+        pass
+
+
+class FTPStorage(Storage):
+    def __init__(self, credential: FTPCredential):
+        self._credential = credential
+
+    def list(self, folder: str) -> List[str]:
+        with pooled_connection(self._credential) as ftp:
+            return [posixpath.basename(path) for path in ftp.nlst(folder)]
+
+    def get(self, path: str) -> bytes:
+        with pooled_connection(self._credential) as ftp:
+            return download_buffer(path, ftp, BytesIO()).getvalue()
+
+    def put(self, path: str, data: Data) -> None:
+        dir_name, filename = posixpath.split(path)
+
+        with pooled_connection(self._credential) as ftp:
+            upload_buffer(filename, dir_name, ftp, data)
+
+    def stream(self, path: str, chunk_size: int = SYS_FTP_BLOCK_SIZE) -> Iterator[bytes]:
+        return iter_chunks(self._credential, path, chunk_size)
+
+
+class LocalStorage(Storage):
+    """Files of the local filesystem, e.g. a volume shared with the data source.
+
+    The files are read through mmap, `get` and `stream` return views of
+    the mapped file without copying it into the process memory.
+    """
+
+    def __init__(self, root: str = '/'):
+        self._root = os.path.abspath(root)
+
+    def list(self, folder: str) -> List[str]:
+        folder_path = self._get_local_path(folder)
+        return sorted(name for name in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, name)))
+
+    def get(self, path: str) -> memoryview:
+        with open(self._get_local_path(path), 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return memoryview(b'')
+
+            # the mapping stays open as long as the returned view is referenced
+            return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def put(self, path: str, data: Data) -> None:
+        local_path = self._get_local_path(path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+        with open(local_path, 'wb') as file:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                file.write(data)
+            else:
+                while True:
+                    chunk = data.read(SYS_FTP_BLOCK_SIZE)
+
+                    if not chunk:
+                        break
+
+                    file.write(chunk)
+
+    def stream(self, path: str, chunk_size: int = SYS_FTP_BLOCK_SIZE) -> Iterator[memoryview]:
+        view = self.get(path)
+
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    def _get_local_path(self, path: str) -> str:
+        local_path = os.path.normpath(os.path.join(self._root, path.lstrip('/')))
+
+        if local_path != self._root and not local_path.startswith(self._root.rstrip(os.sep) + os.sep):
+            raise ValueError(f'path "{path}" is outside of the storage root "{self._root}"')
+
+        return local_path
+
+
+def _create_ftp_storage(credential: Dict[str, Any]) -> Storage:
+    return FTPStorage(FTPCredential(**credential))
+
+
+def _create_local_storage(credential: Union[Dict[str, Any], None]) -> Storage:
+    return LocalStorage(**(credential or {}))
+
+
+__access_type_to_storage_factory: Dict[str, Callable[[Union[Dict[str, Any], None]], Storage]] = {
+    AccessType.FTP: _create_ftp_storage,
+    AccessType.LOCAL: _create_local_storage,
+}
+
+
+def register_storage(access_type: str, factory: Callable[[Union[Dict[str, Any], None]], Storage]) -> None:
+    """Add a storage for the access type, the factory gets the access credential of a pin."""
+    __access_type_to_storage_factory[access_type] = factory
+
+
+def get_storage(pin: Pin) -> Storage:
+    access_type = pin.getattr(PinAttribute.ACCESS_TYPE)
+
+    if access_type not in __access_type_to_storage_factory:
+        raise ValueError(f'unknown access type = "{access_type}" of pin {pin.getattr(PinAttribute.NAME)}')
+
+    credential = pin.getattr(PinAttribute.ACCESS_CREDENTIAL)
+
+    if credential is not None:
+        credential = {camel_to_snake(key): value for key, value in credential.items()}
+
+    return __access_type_to_storage_factory[access_type](credential)
@@ -0,0 +1,36 @@
+import tempfile
+import unittest
+from io import BytesIO
+
+from balticlsc.access.storage import get_storage, LocalStorage
+from balticlsc.scheme.pin import Pin, PinAttribute, AccessType, PinType
+
+
+class TestLocalStorage(unittest.TestCase):
+    def test_put_and_get(self):
+        with tempfile.TemporaryDirectory() as root:
+            pin = Pin({
+                PinAttribute.NAME: 'Input',
+                PinAttribute.TYPE: PinType.INPUT,
+                PinAttribute.ACCESS_TYPE: AccessType.LOCAL,
+                PinAttribute.ACCESS_CREDENTIAL: {'Root': root},
+            })
+            storage = get_storage(pin)
+            self.assertIsInstance(storage, LocalStorage)
+            storage.put('/in/a.bin', b'abc')
+            storage.put('/in/b.bin', BytesIO(b'defgh'))
+            storage.put('/in/empty.bin', b'')
+            self.assertEqual(storage.list('/in'), ['a.bin', 'b.bin', 'empty.bin'])
+            self.assertEqual(bytes(storage.get('/in/a.bin')), b'abc')
+            self.assertEqual(bytes(storage.get('/in/empty.bin')), b'')
+            self.assertEqual([bytes(chunk) for chunk in storage.stream('/in/b.bin', chunk_size=2)],
+                             [b'de', b'fg', b'h'])
+
+    def test_path_outside_of_root(self):
+        with tempfile.TemporaryDirectory() as root:
+            with self.assertRaises(ValueError):
+                LocalStorage(root).get('/../etc/passwd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,3 +4,7 @@ class FTPCredential:
         self.user = user
         self.password = password
         self.port = port
+
+    def __repr__(self) -> str:
+        # the password is never logged
+        return f'FTPCredential(host={self.host!r}, user={self.user!r}, password=***, port={self.port!r})'
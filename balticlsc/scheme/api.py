@@ -1,134 +1,66 @@
-import copy
-import threading
-import json
+import atexit
 import os
-from typing import Union, Type, Any
-
-from flask import Flask, request, Response
+from typing import Union, Type, TYPE_CHECKING
 
+from balticlsc.scheme import metrics
+from balticlsc.scheme.dispatcher import TokenDispatcher
+from balticlsc.scheme.executor import get_worker_rest_client
 from balticlsc.scheme.processing import ProcessingInterface
-from balticlsc.scheme.status import ComputationStatus
-from balticlsc.scheme.token import InputToken
 from balticlsc.scheme.job_rest_client import JobRestClient
-from balticlsc.scheme.pin import _load_pins, PinType, PinAttribute, ValuesAttribute, Pin
-from balticlsc.scheme.logger import logger
-from balticlsc.scheme.utils import camel_to_snake
+from balticlsc.scheme.utils import dumps
+
+if TYPE_CHECKING:
+    from flask import Flask
 
 SYS_APP_IP = os.getenv('SYS_APP_IP', '0.0.0.0')
 SYS_APP_PORT = os.getenv('SYS_APP_PORT', 9100)
-SYS_MODULE_INSTANCE_UID = os.getenv('SYS_MODULE_INSTANCE_UID', 'module_uid')
-SYS_BATCH_MANAGER_TOKEN_ENDPOINT = os.getenv('SYS_BATCH_MANAGER_TOKEN_ENDPOINT', 'http://127.0.0.1:7000/token')
-SYS_BATCH_MANAGER_ACK_ENDPOINT = os.getenv('SYS_BATCH_MANAGER_ACK_ENDPOINT', 'http://127.0.0.1:7000/ack')
 SYS_MODULE_NAME = os.getenv('SYS_MODULE_NAME', 'BalticLSC module')
 SYS_MODULE_DESCRIPTION = os.getenv('SYS_MODULE_DESCRIPTION', 'BalticLSC module instance.')
-SYS_PIN_CONFIG_FILE_PATH = os.getenv('SYS_PIN_CONFIG_FILE_PATH', '/app/module/configs/pins.json')
-
-
-class __ApiState:
-    def __init__(self, processing: Type[ProcessingInterface]):
-        self.processing = processing
-        self.rest_client = JobRestClient(
-            url_token=SYS_BATCH_MANAGER_TOKEN_ENDPOINT,
-            url_ack=SYS_BATCH_MANAGER_ACK_ENDPOINT,
-            sender_uid=SYS_MODULE_INSTANCE_UID)
-        logger.info('working on path=' + os.getcwd())
-
-        try:
-            self.pins = _load_pins(SYS_PIN_CONFIG_FILE_PATH)
-            self.input_pin_name_to_value = self.pins.get_name_to_pin(PinType.INPUT)
-            self.output_pin_name_to_value = self.pins.get_name_to_pin(PinType.OUTPUT)
-            logger.info('input pins from config:' + str(self.input_pin_name_to_value))
-        except BaseException as exception:
-            error_msg = 'error while loading pins: ' + str(exception)
-            logger.error(error_msg)
-            self.rest_client.send_ack_token(
-                msg_uids=['empty'],
-                is_final=True,
-                is_failed=True,
-                note=error_msg,
-            )
-
-
-__api_state: Union[__ApiState, None] = None
 
+__dispatcher: Union[TokenDispatcher, None] = None
 
-def __load_input_pin_attribute(input_pin: Pin, attribute_name: str, value_from_token: Any):
-    input_attribute_value = input_pin.getattr(attribute_name)
 
-    if input_attribute_value is None:
-        input_attribute_value = value_from_token
-        logger.info(f'using input "{attribute_name}" from token values = {input_attribute_value}')
-    else:
-        logger.info(f'using input "{attribute_name}" from config = {input_attribute_value}')
+def init_baltic_api(processing: Type[ProcessingInterface]) -> ('Flask', JobRestClient):
+    global __dispatcher
+    worker_rest_client = get_worker_rest_client()
 
-    if type(input_attribute_value) == dict:
-        input_attribute_value = {camel_to_snake(key): value for key, value in input_attribute_value.items()}
+    if worker_rest_client is not None:
+        # the module is imported by a worker process, the tokens are dispatched by the api process
+        from flask import Flask
+        return Flask(SYS_MODULE_NAME), worker_rest_client
 
-    input_pin.set_opt_attr(attribute_name, input_attribute_value)
+    __dispatcher = TokenDispatcher(processing)
+    # the workers tear down their processing when the module exits
+    atexit.register(__dispatcher.shutdown)
+    # imported once the worker threads are setting up their processing, so the two overlap
+    from flask import Flask, request, Response
 
-
-def init_baltic_api(processing: Type[ProcessingInterface]) -> (Flask, JobRestClient):
-    global __api_state
-    __api_state = __ApiState(processing)
     app = Flask(SYS_MODULE_NAME)
 
     @app.route('/token', methods=['POST'])
     def process_token():
-        logger.info('received the following token: ' + str(request.json))
-
-        try:
-            input_token = InputToken(**{camel_to_snake(key): value for key, value in request.json.items()})
-        except TypeError as type_error:
-            error_msg = 'error while loading input token: ' + str(type_error)
-            logger.error(error_msg)
-            __api_state.rest_client.send_ack_token(
-                msg_uids=['empty'],
-                is_final=True,
-                is_failed=True,
-                note=error_msg,
-            )
-            return Response(json.dumps({'success': False, 'data': error_msg}), status=200,
-                            mimetype='application/json')
-
-        logger.info('input token: ' + str(input_token))
-        input_token_values = {camel_to_snake(key): value for key, value in json.loads(input_token.get_values()).items()}
-
-        if input_token.get_pin_name() not in __api_state.input_pin_name_to_value:
-            logger.info('missing pin with name: ' + input_token.get_pin_name())
-            return Response(json.dumps(
-                {'success': False, 'data': 'missing pin with name ' + input_token.get_pin_name() + ' in the config'}),
-                 status=400, mimetype='application/json')
-        else:
-            try:
-                input_pin = copy.deepcopy(__api_state.input_pin_name_to_value[input_token.get_pin_name()])
-                __load_input_pin_attribute(input_pin, PinAttribute.ACCESS_CREDENTIAL,
-                                           input_token_values.get(PinAttribute.ACCESS_CREDENTIAL))
-                __load_input_pin_attribute(input_pin, PinAttribute.ACCESS_PATH,
-                                           input_token_values.get(ValuesAttribute.RESOURCE_PATH))
-                __load_input_pin_attribute(input_pin, PinAttribute.ACCESS_TYPE,
-                                           input_token_values.get(PinAttribute.ACCESS_TYPE))
-                module_processing = __api_state.processing(__api_state.output_pin_name_to_value)
-                logger.info('running token on pin with name=' + input_token.get_pin_name())
-                __api_state.rest_client.update_status(status=ComputationStatus.Working)
-                pin_task = threading.Thread(target=module_processing.run,
-                                            name=input_token.get_pin_name() + ' pin, id = ' + input_token.get_msg_uid(),
-                                            args=(input_token.get_msg_uid(), input_pin))
-                pin_task.daemon = True
-                pin_task.start()
-            except BaseException as exception:
-                error_msg = f'processing data error: {str(exception)}'
-                logger.error(error_msg)
-                __api_state.rest_client.send_ack_token(
-                    msg_uids=[input_token.get_msg_uid()],
-                    is_final=True,
-                    is_failed=True,
-                    note=error_msg,
-                )
-
-        return Response(status=200)
+        result = __dispatcher.dispatch(request.get_data())
+
+        if not result.body:
+            return Response(status=result.status, headers=result.headers)
+
+        return Response(result.body, status=result.status, headers=result.headers, mimetype='application/json')
 
     @app.route('/status', methods=['GET'])
     def get_status():
-        return __api_state.rest_client.get_job_status().to_json()
+        return Response(dumps(__dispatcher.get_status()), status=200, mimetype='application/json')
+
+    @app.route('/health', methods=['GET'])
+    def get_health():
+        return Response(dumps({'Healthy': True}), status=200, mimetype='application/json')
+
+    @app.route('/ready', methods=['GET'])
+    def get_ready():
+        ready = __dispatcher.is_ready()
+        return Response(dumps({'Ready': ready}), status=200 if ready else 503, mimetype='application/json')
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        return Response(metrics.REGISTRY.render(), status=200, mimetype='text/plain; version=0.0.4')
 
-    return app, __api_state.rest_client
+    return app, __dispatcher.rest_client
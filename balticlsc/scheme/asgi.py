@@ -0,0 +1,115 @@
+import asyncio
+from typing import Type, Callable, Awaitable, Dict, Any, List, Tuple
+
+from balticlsc.scheme import metrics
+from balticlsc.scheme.dispatcher import TokenDispatcher
+from balticlsc.scheme.executor import get_worker_rest_client
+from balticlsc.scheme.job_rest_client import JobRestClient
+from balticlsc.scheme.logger import logger
+from balticlsc.scheme.processing import ProcessingInterface
+from balticlsc.scheme.utils import dumps
+
+ASGIApp = Callable[[Dict[str, Any], Callable[[], Awaitable[dict]], Callable[[dict], Awaitable[None]]],
+                   Awaitable[None]]
+# seconds given to the queued batch manager messages on shutdown
+_SHUTDOWN_FLUSH_TIMEOUT = 5.0
+
+
+def init_baltic_asgi(processing: Type[ProcessingInterface]) -> (ASGIApp, JobRestClient):
+    """ASGI counterpart of `init_baltic_api`, run it with any ASGI server, e.g. `uvicorn module:app`.
+
+    Tokens are accepted in the default executor of the event loop and handed off to the configured
+    executor, the messages to the batch manager are always sent by the background thread.
+    """
+    worker_rest_client = get_worker_rest_client()
+
+    if worker_rest_client is not None:
+        # the module is imported by a worker process, the tokens are dispatched by the api process
+        return _serve_worker, worker_rest_client
+
+    dispatcher = TokenDispatcher(processing, asynchronous=True)
+    return create_asgi_app(dispatcher), dispatcher.rest_client
+
+
+def create_asgi_app(dispatcher: TokenDispatcher) -> ASGIApp:
+    async def app(scope: Dict[str, Any], receive, send) -> None:
+        if scope['type'] == 'lifespan':
+            await _serve_lifespan(dispatcher, receive, send)
+            return
+
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path']
+        method = scope['method']
+
+        if path == '/token':
+            if method != 'POST':
+                await _respond(send, 405, b'', headers=[(b'allow', b'POST')])
+                return
+
+            body = await _read_body(receive)
+            # parsing, the journal and the result cache block, the event loop keeps serving other requests
+            result = await asyncio.get_running_loop().run_in_executor(None, dispatcher.dispatch, body)
+            headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                       for name, value in result.headers.items()]
+            await _respond(send, result.status, result.body.encode('utf-8'), b'application/json', headers)
+        elif path == '/status':
+            await _respond(send, 200, dumps(dispatcher.get_status()).encode('utf-8'), b'application/json')
+        elif path == '/health':
+            await _respond(send, 200, dumps({'Healthy': True}).encode('utf-8'), b'application/json')
+        elif path == '/ready':
+            ready = dispatcher.is_ready()
+            await _respond(send, 200 if ready else 503, dumps({'Ready': ready}).encode('utf-8'), b'application/json')
+        elif path == '/metrics':
+            await _respond(send, 200, metrics.REGISTRY.render().encode('utf-8'), b'text/plain; version=0.0.4')
+        else:
+            await _respond(send, 404, b'')
+
+    return app
+
+
+async def _serve_worker(scope: Dict[str, Any], receive, send) -> None:
+    # the app of a worker process is not served
+    if scope['type'] == 'http':
+        await _respond(send, 503, b'')
+
+
+async def _serve_lifespan(dispatcher: TokenDispatcher, receive, send) -> None:
+    while True:
+        message = await receive()
+
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, dispatcher.shutdown)
+            flushed = await loop.run_in_executor(None, dispatcher.rest_client.flush, _SHUTDOWN_FLUSH_TIMEOUT)
+
+            if not flushed:
+                logger.warning('not all the messages were sent to the batch manager before shutdown')
+
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def _respond(send, status: int, body: bytes, content_type: bytes = b'text/plain',
+                   headers: List[Tuple[bytes, bytes]] = None) -> None:
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode('latin-1'))]
+        + (headers or []),
+    })
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from typing import Dict
+from unittest import mock
+
+from balticlsc.scheme import dispatcher as dispatcher_module
+from balticlsc.scheme.asgi import create_asgi_app
+from balticlsc.scheme.dispatcher import TokenDispatcher
+from balticlsc.scheme.job_rest_client_test import LocalBatchManager
+from balticlsc.scheme.pin import Pin, PinAttribute
+from balticlsc.scheme.processing import ProcessingInterface
+
+
+class _Processing(ProcessingInterface):
+    def process(self, msg_uid: str, input_pin: Pin, output_pin_name_to_value: Dict[str, Pin]) -> None:
+        self._rest_client.send_ack_token(msg_uids=[msg_uid], is_final=True,
+                                         note=input_pin.getattr(PinAttribute.ACCESS_PATH))
+
+
+def _request(app, method: str, path: str, body: bytes = b''):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app({'type': 'http', 'method': method, 'path': path}, receive, send))
+    return messages[0]['status'], messages[1]['body']
+
+
+class TestAsgiApp(unittest.TestCase):
+    def setUp(self):
+        self.batch_manager = LocalBatchManager()
+        self.addCleanup(self.batch_manager.close)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as config_file:
+            json.dump([{'PinName': 'Input', 'PinType': 'input', 'AccessType': 'ftp'},
+                       {'PinName': 'Output', 'PinType': 'output', 'AccessType': 'ftp'}], config_file)
+
+        try:
+            with mock.patch.multiple(dispatcher_module,
+                                     SYS_BATCH_MANAGER_TOKEN_ENDPOINT=self.batch_manager.url + '/token',
+                                     SYS_BATCH_MANAGER_ACK_ENDPOINT=self.batch_manager.url + '/ack'):
+                self.dispatcher = TokenDispatcher(_Processing, asynchronous=True,
+                                                  pin_config_file_path=config_file.name)
+        finally:
+            os.remove(config_file.name)
+
+        self.addCleanup(self.dispatcher.shutdown)
+        self.app = create_asgi_app(self.dispatcher)
+
+    def test_token_is_processed(self):
+        status, _ = _request(self.app, 'POST', '/token', json.dumps({
+            'MsgUid': '1', 'PinName': 'Input', 'Values': '{"ResourcePath": "/in"}'}).encode())
+        self.assertEqual(status, 200)
+        self.dispatcher.shutdown()
+        self.assertTrue(self.dispatcher.rest_client.flush(timeout=5))
+        self.assertEqual([message['Note'] for path, message in self.batch_manager.messages if path == '/ack'],
+                         ['/in'])
+
+    def test_missing_pin(self):
+        status, body = _request(self.app, 'POST', '/token', json.dumps({
+            'MsgUid': '2', 'PinName': 'Other', 'Values': '{}'}).encode())
+        self.assertEqual(status, 400)
+        self.assertFalse(json.loads(body)['success'])
+
+    def test_ready_after_setup(self):
+        for _ in range(50):
+            if self.dispatcher.is_ready():
+                break
+
+            time.sleep(0.1)
+
+        status, body = _request(self.app, 'GET', '/ready')
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['Ready'])
+
+    def test_status_and_unknown_path(self):
+        status, body = _request(self.app, 'GET', '/status')
+        self.assertEqual(status, 200)
+        self.assertIn('QueueDepth', json.loads(body))
+        self.assertEqual(_request(self.app, 'GET', '/unknown')[0], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Any, Hashable, Union, Deque
+
+from balticlsc.scheme.executor import QueueFull
+from balticlsc.scheme.logger import logger
+
+
+class _Batch:
+    def __init__(self, deadline: float):
+        self.items: List[Any] = []
+        self.deadline = deadline
+
+
+class TokenBatcher:
+    """Groups the tokens of a sequence into batches.
+
+    A batch is submitted when it has `max_size` tokens, when the final
+    token of the sequence arrives or `window` seconds after its first
+    token. Batches are submitted by a background thread, which retries
+    while the executor is full. At most `max_pending` tokens wait in the
+    batcher, above that `add` raises `QueueFull`. A batch failing to be
+    submitted for another reason is passed to `on_failed` with the error.
+    """
+
+    def __init__(self, submit: Callable[[List[Any]], None], max_size: int, window: float, max_pending: int,
+                 on_failed: Union[Callable[[List[Any], BaseException], None], None] = None):
+        self._submit = submit
+        self._on_failed = on_failed
+        self._max_size = max_size
+        self._window = window
+        self._max_pending = max_pending
+        self._condition = threading.Condition()
+        self._key_to_batch: Dict[Hashable, _Batch] = {}
+        self._ready: Deque[_Batch] = deque()
+        self._pending = 0
+        self._thread = None
+
+    def add(self, key: Hashable, item: Any, is_final: bool = False) -> None:
+        with self._condition:
+            if self._pending >= self._max_pending:
+                raise QueueFull(self._max_pending)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name='token batcher')
+                self._thread.daemon = True
+                self._thread.start()
+
+            batch = self._key_to_batch.get(key)
+
+            if batch is None:
+                batch = self._key_to_batch[key] = _Batch(time.monotonic() + self._window)
+
+            batch.items.append(item)
+            self._pending += 1
+
+            if is_final or len(batch.items) >= self._max_size:
+                # the next tokens of the sequence start a new batch
+                del self._key_to_batch[key]
+                self._ready.append(batch)
+
+            self._condition.notify()
+
+    def get_pending(self) -> int:
+        return self._pending
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                batch = self._take_ready()
+
+                while batch is None:
+                    self._condition.wait(self._get_timeout())
+                    batch = self._take_ready()
+
+            while True:
+                try:
+                    self._submit(batch.items)
+                    break
+                except QueueFull:
+                    time.sleep(0.05)
+                except BaseException as exception:
+                    logger.error('submitting a batch of %d tokens failed: %s', len(batch.items), exception)
+                    self._fail(batch, exception)
+                    break
+
+            with self._condition:
+                self._pending -= len(batch.items)
+
+    def _fail(self, batch: _Batch, exception: BaseException) -> None:
+        if self._on_failed is None:
+            return
+
+        try:
+            self._on_failed(batch.items, exception)
+        except BaseException as callback_exception:
+            logger.error('handling a failed batch failed: %s', callback_exception)
+
+    def _take_ready(self) -> Union[_Batch, None]:
+        now = time.monotonic()
+
+        for key, batch in list(self._key_to_batch.items()):
+            if batch.deadline <= now:
+                del self._key_to_batch[key]
+                self._ready.append(batch)
+
+        return self._ready.popleft() if self._ready else None
+
+    def _get_timeout(self) -> Union[float, None]:
+        if not self._key_to_batch:
+            return None
+
+        return max(0.0, min(batch.deadline for batch in self._key_to_batch.values()) - time.monotonic())
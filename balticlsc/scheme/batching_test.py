@@ -0,0 +1,48 @@
+import queue
+import unittest
+
+from balticlsc.scheme.batching import TokenBatcher
+from balticlsc.scheme.executor import QueueFull
+
+
+class TestTokenBatcher(unittest.TestCase):
+    def setUp(self):
+        self.batches = queue.Queue()
+
+    def test_submits_full_and_final_batches(self):
+        batcher = TokenBatcher(self.batches.put, max_size=2, window=60.0, max_pending=10)
+        batcher.add('seq 1', 1)
+        batcher.add('seq 2', 2, is_final=True)
+        batcher.add('seq 1', 3)
+
+        self.assertEqual(self.batches.get(timeout=5), [2])
+        self.assertEqual(self.batches.get(timeout=5), [1, 3])
+
+    def test_submits_after_window(self):
+        batcher = TokenBatcher(self.batches.put, max_size=10, window=0.05, max_pending=10)
+        batcher.add('seq', 1)
+        batcher.add('seq', 2)
+
+        self.assertEqual(self.batches.get(timeout=5), [1, 2])
+
+    def test_rejects_when_too_many_tokens_wait(self):
+        batcher = TokenBatcher(self.batches.put, max_size=10, window=60.0, max_pending=1)
+        batcher.add('seq', 1)
+
+        with self.assertRaises(QueueFull):
+            batcher.add('seq', 2)
+
+    def test_failed_batch_is_passed_on(self):
+        def submit(batch):
+            raise RuntimeError('executor is shut down')
+
+        batcher = TokenBatcher(submit, max_size=2, window=60.0, max_pending=10,
+                               on_failed=lambda batch, exception: self.batches.put((batch, str(exception))))
+        batcher.add('seq', 1)
+        batcher.add('seq', 2)
+
+        self.assertEqual(self.batches.get(timeout=5), ([1, 2], 'executor is shut down'))
+
+
+if __name__ == '__main__':
+    unittest.main()
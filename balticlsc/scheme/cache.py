@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple, Union
+
+# values, output pin name and is_final of an output token sent by the processing
+Output = Tuple[Dict[str, Any], str, bool]
+
+
+class TTLCache:
+    """Thread-safe LRU cache with entries expiring `ttl` seconds after they were put."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        if self._max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ResultCache:
+    """Outputs of the processed tokens, recorded from the messages sent through `JobRestClient`.
+
+    The outputs of a token are stored when its final ack is sent and it has not failed,
+    by its msg_uid (to answer a token sent again) and by its cache key, if it has one
+    (to answer a token with the same input).
+    """
+
+    def __init__(self, dedup_size: int, dedup_ttl: float, cache_size: int, cache_ttl: float):
+        self._msg_uid_to_outputs = TTLCache(dedup_size, dedup_ttl)
+        self._key_to_outputs = TTLCache(cache_size, cache_ttl)
+        self._lock = threading.Lock()
+        # msg_uid -> cache key and the outputs sent so far, of the tokens being processed
+        self._pending: Dict[str, Tuple[Union[str, None], List[Output]]] = {}
+
+    def track(self, msg_uid: str, cache_key: Union[str, None]) -> None:
+        with self._lock:
+            self._pending[msg_uid] = (cache_key, [])
+
+    def untrack(self, msg_uid: str) -> None:
+        with self._lock:
+            self._pending.pop(msg_uid, None)
+
+    def get_by_msg_uid(self, msg_uid: str) -> Union[List[Output], None]:
+        return self._msg_uid_to_outputs.get(msg_uid)
+
+    def get_by_key(self, cache_key: str) -> Union[List[Output], None]:
+        return self._key_to_outputs.get(cache_key)
+
+    def on_output(self, base_msg_uid: str, values: Dict[str, Any], output_pin_name: str, is_final: bool) -> None:
+        with self._lock:
+            if base_msg_uid in self._pending:
+                self._pending[base_msg_uid][1].append((dict(values), output_pin_name, is_final))
+
+    def on_ack(self, msg_uids: List[str], is_final: bool, is_failed: bool) -> None:
+        if not is_final:
+            return
+
+        for msg_uid in msg_uids:
+            with self._lock:
+                pending = self._pending.pop(msg_uid, None)
+
+            if pending is None or is_failed:
+                continue
+
+            cache_key, outputs = pending
+            self._msg_uid_to_outputs.put(msg_uid, outputs)
+
+            if cache_key is not None:
+                self._key_to_outputs.put(cache_key, outputs)
@@ -0,0 +1,41 @@
+import time
+import unittest
+
+from balticlsc.scheme.cache import TTLCache, ResultCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(max_size=2, ttl=60.0)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_expires(self):
+        cache = TTLCache(max_size=2, ttl=0.01)
+        cache.put('a', 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+class TestResultCache(unittest.TestCase):
+    def test_records_outputs_on_final_ack(self):
+        results = ResultCache(dedup_size=10, dedup_ttl=60.0, cache_size=10, cache_ttl=60.0)
+        results.track('1', 'key')
+        results.track('2', 'other key')
+        results.on_output('1', {'resource_path': '/out'}, 'Output', True)
+        results.on_output('2', {'resource_path': '/out2'}, 'Output', True)
+        results.on_ack(['1'], is_final=True, is_failed=False)
+        results.on_ack(['2'], is_final=True, is_failed=True)
+
+        self.assertEqual(results.get_by_msg_uid('1'), [({'resource_path': '/out'}, 'Output', True)])
+        self.assertEqual(results.get_by_key('key'), [({'resource_path': '/out'}, 'Output', True)])
+        self.assertIsNone(results.get_by_msg_uid('2'))
+        self.assertIsNone(results.get_by_key('other key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
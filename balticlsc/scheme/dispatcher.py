@@ -0,0 +1,439 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Union, Type, Any, Dict, NamedTuple, List, Tuple
+
+from balticlsc.scheme import metrics
+from balticlsc.scheme.batching import TokenBatcher
+from balticlsc.scheme.cache import ResultCache, Output
+from balticlsc.scheme.executor import TokenExecutor, ProcessTokenExecutor, ExecutorType, QueueFull, \
+    run_in_processing_worker, run_batch_in_processing_worker, run_joined_in_processing_worker, \
+    run_in_processing_thread, run_batch_in_processing_thread, run_joined_in_processing_thread, set_up_worker, \
+    tear_down_worker
+from balticlsc.scheme.processing import ProcessingInterface
+from balticlsc.scheme.status import ComputationStatus
+from balticlsc.scheme.token import InputToken
+from balticlsc.scheme.job_rest_client import JobRestClient
+from balticlsc.scheme.join import JoinTable, JoinEntry, SeqStack
+from balticlsc.scheme.pin import _load_pins, _override_pin, PinType, PinAttribute, ValuesAttribute, Pin
+from balticlsc.scheme.logger import logger
+from balticlsc.scheme.utils import camel_to_snake, snake_to_camel
+
+SYS_MODULE_INSTANCE_UID = os.getenv('SYS_MODULE_INSTANCE_UID', 'module_uid')
+SYS_BATCH_MANAGER_TOKEN_ENDPOINT = os.getenv('SYS_BATCH_MANAGER_TOKEN_ENDPOINT', 'http://127.0.0.1:7000/token')
+SYS_BATCH_MANAGER_ACK_ENDPOINT = os.getenv('SYS_BATCH_MANAGER_ACK_ENDPOINT', 'http://127.0.0.1:7000/ack')
+SYS_BATCH_MANAGER_TIMEOUT = float(os.getenv('SYS_BATCH_MANAGER_TIMEOUT', 10.0))
+SYS_BATCH_MANAGER_RETRIES = int(os.getenv('SYS_BATCH_MANAGER_RETRIES', 3))
+SYS_BATCH_MANAGER_ACK_WINDOW = float(os.getenv('SYS_BATCH_MANAGER_ACK_WINDOW', 0.05))
+SYS_BATCH_MANAGER_ASYNC = os.getenv('SYS_BATCH_MANAGER_ASYNC', 'true').lower() == 'true'
+SYS_PIN_CONFIG_FILE_PATH = os.getenv('SYS_PIN_CONFIG_FILE_PATH', '/app/module/configs/pins.json')
+SYS_PIN_CONFIG_CACHE_PATH = os.getenv('SYS_PIN_CONFIG_CACHE_PATH', '')
+SYS_EXECUTOR_TYPE = os.getenv('SYS_EXECUTOR_TYPE', ExecutorType.THREAD)
+SYS_EXECUTOR_WORKERS = int(os.getenv('SYS_EXECUTOR_WORKERS', os.cpu_count() or 1))
+SYS_EXECUTOR_QUEUE_SIZE = int(os.getenv('SYS_EXECUTOR_QUEUE_SIZE', 64))
+SYS_TOKEN_JOURNAL_PATH = os.getenv('SYS_TOKEN_JOURNAL_PATH', '')
+SYS_TOKEN_JOURNAL_REPLAY_DELAY = float(os.getenv('SYS_TOKEN_JOURNAL_REPLAY_DELAY', 1.0))
+SYS_DEDUP_SIZE = int(os.getenv('SYS_DEDUP_SIZE', 1024))
+SYS_DEDUP_TTL = float(os.getenv('SYS_DEDUP_TTL', 600.0))
+SYS_RESULT_CACHE_SIZE = int(os.getenv('SYS_RESULT_CACHE_SIZE', 0))
+SYS_RESULT_CACHE_TTL = float(os.getenv('SYS_RESULT_CACHE_TTL', 3600.0))
+SYS_BATCH_SIZE = int(os.getenv('SYS_BATCH_SIZE', 1))
+SYS_BATCH_WINDOW = float(os.getenv('SYS_BATCH_WINDOW', 0.1))
+SYS_JOIN_TIMEOUT = float(os.getenv('SYS_JOIN_TIMEOUT', 3600.0))
+SYS_WORKER_START_DELAY = float(os.getenv('SYS_WORKER_START_DELAY', 1.0))
+SYS_SETUP_RETRY_DELAY = float(os.getenv('SYS_SETUP_RETRY_DELAY', 10.0))
+
+_tokens = metrics.counter('balticlsc_tokens_total', 'Tokens received by the module.', ['pin', 'result'])
+
+
+class DispatchResult(NamedTuple):
+    """Http response to a posted token, independent of the web framework."""
+    status: int
+    body: str = ''
+    headers: Dict[str, str] = {}
+
+
+class _ParsedToken(NamedTuple):
+    token: InputToken
+    values: Dict[str, Any]
+
+
+def _error_result(status: int, error_msg: str, headers: Dict[str, str] = None) -> DispatchResult:
+    return DispatchResult(status, json.dumps({'success': False, 'data': error_msg}), headers or {})
+
+
+class TokenDispatcher:
+    """Hands the tokens posted by the batch manager to the executor.
+
+    Shared by the Flask (balticlsc.scheme.api) and the ASGI (balticlsc.scheme.asgi)
+    entry points, it does not block on the batch manager when the rest client is asynchronous.
+
+    With a journal path, the accepted tokens are stored in a `TokenJournal` until their final ack.
+    The unfinished tokens of the previous run are replayed `SYS_TOKEN_JOURNAL_REPLAY_DELAY` seconds
+    after the start, once the module has assigned the objects returned by the init function.
+    For the same reason the worker processes are started (and their processing set up)
+    `SYS_WORKER_START_DELAY` seconds after the start, the worker threads set up at once.
+    """
+
+    def __init__(self, processing: Type[ProcessingInterface], asynchronous: bool = SYS_BATCH_MANAGER_ASYNC,
+                 pin_config_file_path: str = SYS_PIN_CONFIG_FILE_PATH, executor_type: str = SYS_EXECUTOR_TYPE,
+                 journal_path: str = SYS_TOKEN_JOURNAL_PATH):
+        self.processing = processing
+        self.executor_type = executor_type
+        self.rest_client = JobRestClient(
+            url_token=SYS_BATCH_MANAGER_TOKEN_ENDPOINT,
+            url_ack=SYS_BATCH_MANAGER_ACK_ENDPOINT,
+            sender_uid=SYS_MODULE_INSTANCE_UID,
+            timeout=SYS_BATCH_MANAGER_TIMEOUT,
+            retries=SYS_BATCH_MANAGER_RETRIES,
+            ack_window=SYS_BATCH_MANAGER_ACK_WINDOW,
+            asynchronous=asynchronous)
+        self.input_pin_name_to_value = {}
+        self.output_pin_name_to_value = {}
+        logger.info('working on path=%s', os.getcwd())
+
+        try:
+            self.pins = _load_pins(pin_config_file_path, SYS_PIN_CONFIG_CACHE_PATH)
+            self.input_pin_name_to_value = self.pins.get_name_to_pin(PinType.INPUT)
+            self.output_pin_name_to_value = self.pins.get_name_to_pin(PinType.OUTPUT)
+            logger.info('input pins from config: %s', self.input_pin_name_to_value)
+        except BaseException as exception:
+            error_msg = 'error while loading pins: ' + str(exception)
+            logger.error(error_msg)
+            self.rest_client.send_ack_token(
+                msg_uids=['empty'],
+                is_final=True,
+                is_failed=True,
+                note=error_msg,
+            )
+
+        if executor_type == ExecutorType.PROCESS:
+            self.executor = ProcessTokenExecutor(
+                processing=processing,
+                input_pin_name_to_value=self.input_pin_name_to_value,
+                output_pin_name_to_value=self.output_pin_name_to_value,
+                rest_client=self.rest_client,
+                workers=SYS_EXECUTOR_WORKERS,
+                max_queue_size=SYS_EXECUTOR_QUEUE_SIZE,
+                retry_delay=SYS_SETUP_RETRY_DELAY)
+            start = threading.Timer(SYS_WORKER_START_DELAY, self.executor.start)
+            start.daemon = True
+            start.start()
+        elif executor_type == ExecutorType.THREAD:
+            self.executor = TokenExecutor(
+                workers=SYS_EXECUTOR_WORKERS,
+                max_queue_size=SYS_EXECUTOR_QUEUE_SIZE,
+                initializer=set_up_worker,
+                initargs=(processing, self.output_pin_name_to_value, self.rest_client),
+                finalizer=tear_down_worker,
+                retry_delay=SYS_SETUP_RETRY_DELAY)
+        else:
+            raise ValueError(f'unknown executor type = "{executor_type}"')
+
+        metrics.gauge('balticlsc_executor_queue_depth', 'Tokens waiting for a free worker.',
+                      lambda: self.executor.get_stats()['queue_depth'])
+        metrics.gauge('balticlsc_executor_in_flight', 'Tokens being processed.',
+                      lambda: self.executor.get_stats()['in_flight'])
+        self.join_table = None
+
+        # tokens are joined only for the processing which takes them joined
+        if processing.process_joined is not ProcessingInterface.process_joined:
+            self.join_table = JoinTable(self.input_pin_name_to_value, SYS_JOIN_TIMEOUT, self._on_join_expired)
+
+        self.batcher = None
+
+        if SYS_BATCH_SIZE > 1:
+            self.batcher = TokenBatcher(self._submit_batch, SYS_BATCH_SIZE, SYS_BATCH_WINDOW,
+                                        max_pending=(SYS_EXECUTOR_WORKERS + SYS_EXECUTOR_QUEUE_SIZE) * SYS_BATCH_SIZE,
+                                        on_failed=self._on_batch_failed)
+
+        self.results = ResultCache(SYS_DEDUP_SIZE, SYS_DEDUP_TTL, SYS_RESULT_CACHE_SIZE, SYS_RESULT_CACHE_TTL)
+        self.rest_client.add_output_listener(self.results.on_output)
+        self.rest_client.add_ack_listener(self.results.on_ack)
+        self.journal = None
+
+        if journal_path:
+            from balticlsc.scheme.journal import TokenJournal
+            self.journal = TokenJournal(journal_path)
+            self.rest_client.add_ack_listener(self._on_ack)
+            replay = threading.Timer(SYS_TOKEN_JOURNAL_REPLAY_DELAY, self.replay_journal)
+            replay.daemon = True
+            replay.start()
+
+    def replay_journal(self) -> None:
+        tokens = self.journal.get_unfinished()
+        logger.info('replaying %d unfinished tokens from the journal', len(tokens))
+
+        for msg_uid, token_data in tokens:
+            try:
+                result = self.dispatch(token_data, journaled=True)
+
+                # the executor queue may be smaller than the journal
+                while result.status == 503:
+                    time.sleep(0.1)
+                    result = self.dispatch(token_data, journaled=True)
+            except BaseException as exception:
+                logger.error('replaying token with id=%s failed: %s', msg_uid, exception)
+                result = None
+
+            # unlike an accepted one, an invalid token (e.g. of a removed pin) is never acked, error results have a body
+            if result is None or result.status != 200 or result.body:
+                logger.warning('dropping token with id=%s from the journal', msg_uid)
+                self.journal.remove([msg_uid])
+
+    def _on_ack(self, msg_uids: List[str], is_final: bool, is_failed: bool) -> None:
+        if is_final:
+            self.journal.remove(msg_uids)
+
+    def dispatch(self, token_data: Union[str, bytes], journaled: bool = False) -> DispatchResult:
+        parsed = self._parse(token_data)
+
+        if isinstance(parsed, DispatchResult):
+            return parsed
+
+        msg_uid = parsed.token.get_msg_uid()
+        pin_name = parsed.token.get_pin_name()
+
+        if self._deduplicate(msg_uid, pin_name):
+            return DispatchResult(200)
+
+        try:
+            admitted = self._admit(parsed, token_data, journaled)
+
+            if admitted is not None:
+                self._route(parsed.token, *admitted)
+                _tokens.inc(pin=pin_name, result='accepted')
+        except QueueFull as queue_full:
+            return self._reject(msg_uid, pin_name, queue_full, journaled)
+        except BaseException as exception:
+            self._fail(msg_uid, pin_name, exception)
+
+        return DispatchResult(200)
+
+    def _parse(self, token_data: Union[str, bytes]) -> Union[_ParsedToken, DispatchResult]:
+        try:
+            input_token = InputToken.from_json(token_data)
+            parsed = _ParsedToken(input_token, input_token.get_values_dict())
+        except (TypeError, ValueError) as exception:
+            error_msg = 'error while loading input token: ' + str(exception)
+            logger.error(error_msg)
+            _tokens.inc(pin='', result='invalid')
+            self.rest_client.send_ack_token(
+                msg_uids=['empty'],
+                is_final=True,
+                is_failed=True,
+                note=error_msg,
+            )
+            return _error_result(200, error_msg)
+
+        logger.info('received the following token: %s', input_token)
+        pin_name = input_token.get_pin_name()
+
+        if pin_name not in self.input_pin_name_to_value:
+            logger.info('missing pin with name: %s', pin_name)
+            _tokens.inc(pin=pin_name, result='invalid')
+            return _error_result(400, 'missing pin with name ' + pin_name + ' in the config')
+
+        return parsed
+
+    # returns True when the token is a resent one, otherwise it is tracked from now on
+    def _deduplicate(self, msg_uid: str, pin_name: str) -> bool:
+        outputs = self.results.get_by_msg_uid(msg_uid)
+
+        if outputs is not None:
+            logger.info('token with id=%s is already processed, sending its outputs again', msg_uid)
+            _tokens.inc(pin=pin_name, result='duplicate')
+            # the job is already finished and its outputs cached
+            self._send_outputs(msg_uid, outputs, replayed=True)
+            return True
+
+        # tracked (and journaled) before submitting, the token can be acked before submit returns
+        if not self.rest_client.get_job_tracker().start(msg_uid):
+            logger.info('token with id=%s is already being processed, ignoring it', msg_uid)
+            _tokens.inc(pin=pin_name, result='duplicate')
+            return True
+
+        return False
+
+    # the input pin and the pin overrides of the token to process, None when it is answered from the result cache
+    def _admit(self, parsed: _ParsedToken, token_data: Union[str, bytes],
+               journaled: bool) -> Union[Tuple[Pin, Dict[str, Any]], None]:
+        msg_uid = parsed.token.get_msg_uid()
+        pin_name = parsed.token.get_pin_name()
+        configured_pin = self.input_pin_name_to_value[pin_name]
+        pin_overrides = {
+            PinAttribute.ACCESS_CREDENTIAL: _get_input_pin_attribute(
+                configured_pin, PinAttribute.ACCESS_CREDENTIAL, parsed.values.get(PinAttribute.ACCESS_CREDENTIAL)),
+            PinAttribute.ACCESS_PATH: _get_input_pin_attribute(
+                configured_pin, PinAttribute.ACCESS_PATH, parsed.values.get(ValuesAttribute.RESOURCE_PATH)),
+            PinAttribute.ACCESS_TYPE: _get_input_pin_attribute(
+                configured_pin, PinAttribute.ACCESS_TYPE, parsed.values.get(PinAttribute.ACCESS_TYPE)),
+        }
+        input_pin = _override_pin(configured_pin, pin_overrides)
+        cache_key = self._get_cache_key(input_pin)
+
+        if cache_key is not None:
+            outputs = self.results.get_by_key(cache_key)
+
+            if outputs is not None:
+                logger.info('token with id=%s has the same input as a processed one, using its outputs', msg_uid)
+                _tokens.inc(pin=pin_name, result='cached')
+                self._send_outputs(msg_uid, outputs)
+                return None
+
+        logger.info('running token on pin with name=%s', pin_name)
+        self.results.track(msg_uid, cache_key)
+
+        if self.journal is not None and not journaled:
+            self.journal.add(msg_uid, token_data.decode('utf-8') if isinstance(token_data, bytes) else token_data)
+
+        return input_pin, pin_overrides
+
+    def _route(self, input_token: InputToken, input_pin: Pin, pin_overrides: Dict[str, Any]) -> None:
+        msg_uid = input_token.get_msg_uid()
+        pin_name = input_token.get_pin_name()
+        seq_stack = input_token.get_seq_stack()
+        # the worker processes build the pin on their own, only the overrides are sent
+        item = (msg_uid, pin_name, pin_overrides) if self.executor_type == ExecutorType.PROCESS \
+            else (msg_uid, input_pin)
+
+        if self.join_table is not None:
+            self._join(pin_name, seq_stack, item)
+        elif self.batcher is not None and seq_stack:
+            # tokens of the innermost sequence are processed together
+            seq_token = seq_stack[-1]
+            self.batcher.add((pin_name, seq_token.get_seq_uid()), item, is_final=seq_token.is_final())
+        elif self.executor_type == ExecutorType.PROCESS:
+            self.executor.submit(pin_name + ' pin, id = ' + msg_uid, run_in_processing_worker, *item)
+        else:
+            self.executor.submit(pin_name + ' pin, id = ' + msg_uid, run_in_processing_thread, *item)
+
+    def _reject(self, msg_uid: str, pin_name: str, queue_full: QueueFull, journaled: bool) -> DispatchResult:
+        logger.warning('rejecting token with id=%s: %s', msg_uid, queue_full)
+        self.results.untrack(msg_uid)
+        tracker = self.rest_client.get_job_tracker()
+
+        # a replayed token is submitted again until it is accepted
+        if journaled:
+            tracker.forget(msg_uid)
+        else:
+            _tokens.inc(pin=pin_name, result='rejected')
+            tracker.update(msg_uid, ComputationStatus.Rejected)
+
+            if self.journal is not None:
+                # the batch manager sends the rejected token again
+                self.journal.remove([msg_uid])
+
+        return _error_result(503, str(queue_full), {'Retry-After': '1'})
+
+    def _fail(self, msg_uid: str, pin_name: str, exception: BaseException) -> None:
+        error_msg = f'processing data error: {str(exception)}'
+        logger.error(error_msg)
+        _tokens.inc(pin=pin_name, result='failed')
+        self.rest_client.send_ack_token(
+            msg_uids=[msg_uid],
+            is_final=True,
+            is_failed=True,
+            note=error_msg,
+        )
+
+    def _on_join_expired(self, entry: JoinEntry) -> None:
+        self.rest_client.send_ack_token(
+            msg_uids=[msg_uid for msg_uid, *_ in entry.get_items()],
+            is_final=True,
+            is_failed=True,
+            note=f'inputs of the other pins did not arrive within {SYS_JOIN_TIMEOUT} seconds',
+        )
+
+    def _join(self, pin_name: str, seq_stack: SeqStack, item: tuple) -> None:
+        entry = self.join_table.add(pin_name, seq_stack, item)
+
+        if entry is None:
+            return
+
+        inputs = entry.get_inputs()
+        task_name = f'joined tokens, id = {item[0]}'
+
+        try:
+            if self.executor_type == ExecutorType.PROCESS:
+                self.executor.submit(task_name, run_joined_in_processing_worker, inputs)
+            else:
+                self.executor.submit(task_name, run_joined_in_processing_thread, inputs)
+        except QueueFull:
+            # the batch manager sends the rejected token again, completing the inputs
+            self.join_table.restore(entry, item)
+            raise
+
+    def _submit_batch(self, batch: List[tuple]) -> None:
+        task_name = f'batch of {len(batch)} tokens, first id = {batch[0][0]}'
+
+        if self.executor_type == ExecutorType.PROCESS:
+            self.executor.submit(task_name, run_batch_in_processing_worker, batch)
+        else:
+            self.executor.submit(task_name, run_batch_in_processing_thread, batch)
+
+    def _on_batch_failed(self, batch: List[tuple], exception: BaseException) -> None:
+        self.rest_client.send_ack_token(
+            msg_uids=[msg_uid for msg_uid, *_ in batch],
+            is_final=True,
+            is_failed=True,
+            note=f'processing data error: {str(exception)}',
+        )
+
+    def _get_cache_key(self, input_pin: Pin) -> Union[str, None]:
+        if SYS_RESULT_CACHE_SIZE <= 0:
+            return None
+
+        checksums = self.processing.get_input_checksums(input_pin)
+
+        if checksums is None:
+            return None
+
+        key = [input_pin.getattr(PinAttribute.NAME), input_pin.getattr(PinAttribute.ACCESS_PATH), checksums]
+        return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def _send_outputs(self, msg_uid: str, outputs: List[Output], replayed: bool = False) -> None:
+        for values, output_pin_name, is_final in outputs:
+            self.rest_client.send_output_token(base_msg_uid=msg_uid, values=values, output_pin_name=output_pin_name,
+                                               is_final=is_final, replayed=replayed)
+
+        self.rest_client.send_ack_token(msg_uids=[msg_uid], is_final=True, replayed=replayed)
+
+    def is_ready(self) -> bool:
+        """All the workers have set up their processing."""
+        return self.executor.is_ready()
+
+    def shutdown(self) -> None:
+        """Finish the accepted tokens and tear down the processing of the workers."""
+        self.executor.shutdown()
+
+    def get_status(self) -> Dict[str, Any]:
+        status = dict(self.rest_client.get_job_tracker().get_snapshot())
+        status['Ready'] = self.is_ready()
+        status.update({snake_to_camel(key): value for key, value in self.executor.get_stats().items()})
+
+        if self.batcher is not None:
+            status['BatchedTokens'] = self.batcher.get_pending()
+
+        if self.join_table is not None:
+            status['WaitingJoins'] = len(self.join_table)
+
+        return status
+
+
+def _get_input_pin_attribute(input_pin: Pin, attribute_name: str, value_from_token: Any) -> Any:
+    input_attribute_value = input_pin.getattr(attribute_name)
+
+    if input_attribute_value is None:
+        input_attribute_value = value_from_token
+        logger.debug('using input "%s" from token values = %s', attribute_name, input_attribute_value)
+    else:
+        logger.debug('using input "%s" from config = %s', attribute_name, input_attribute_value)
+
+    # a new dict for every token, the configured pin keeps its keys
+    if isinstance(input_attribute_value, dict):
+        input_attribute_value = {camel_to_snake(key): value for key, value in input_attribute_value.items()}
+
+    return input_attribute_value
@@ -0,0 +1,236 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from typing import Dict, List, Tuple
+from unittest import mock
+
+from balticlsc.scheme import dispatcher as dispatcher_module
+from balticlsc.scheme.dispatcher import TokenDispatcher, _get_input_pin_attribute
+from balticlsc.scheme.executor import QueueFull
+from balticlsc.scheme.job_rest_client_test import LocalBatchManager
+from balticlsc.scheme.journal import TokenJournal
+from balticlsc.scheme.pin import Pin, PinAttribute
+from balticlsc.scheme.processing import ProcessingInterface
+
+
+class _FailingProcessing(ProcessingInterface):
+    def process(self, msg_uid: str, input_pin: Pin, output_pin_name_to_value: Dict[str, Pin]) -> None:
+        raise RuntimeError('broken input')
+
+
+class _AckingProcessing(ProcessingInterface):
+    def process(self, msg_uid: str, input_pin: Pin, output_pin_name_to_value: Dict[str, Pin]) -> None:
+        self._rest_client.send_ack_token(msg_uids=[msg_uid], is_final=True)
+
+
+class _NotSetUpProcessing(_AckingProcessing):
+    def setup(self) -> None:
+        raise RuntimeError('missing model')
+
+
+class _SetUpOnRetryProcessing(_AckingProcessing):
+    attempts = 0
+
+    def setup(self) -> None:
+        _SetUpOnRetryProcessing.attempts += 1
+
+        if _SetUpOnRetryProcessing.attempts == 1:
+            raise RuntimeError('model not downloaded yet')
+
+
+class _OwnInitProcessing(ProcessingInterface):
+    # a module written for the constructor taking only the output pins
+    def __init__(self, output_pin_name_to_value: Dict[str, Pin]):
+        super().__init__(output_pin_name_to_value)
+        self.model = 'model'
+
+    def process(self, msg_uid: str, input_pin: Pin, output_pin_name_to_value: Dict[str, Pin]) -> None:
+        raise RuntimeError('broken input of ' + self.model)
+
+
+class _JoiningProcessing(ProcessingInterface):
+    def process_joined(self, inputs: Dict[str, List[Tuple[str, Pin]]],
+                       output_pin_name_to_value: Dict[str, Pin]) -> None:
+        msg_uids = sorted(msg_uid for tokens in inputs.values() for msg_uid, _ in tokens)
+        # acks with different notes are not merged
+        self._rest_client.send_ack_token(msg_uids=msg_uids, is_final=True, note=', '.join(msg_uids))
+
+    def process(self, msg_uid: str, input_pin: Pin, output_pin_name_to_value: Dict[str, Pin]) -> None:
+        pass
+
+
+def _wait_for_status(dispatcher: TokenDispatcher, status: str) -> Dict:
+    for _ in range(50):
+        snapshot = dispatcher.get_status()
+
+        if snapshot['Status'] == status:
+            break
+
+        time.sleep(0.1)
+
+    return snapshot
+
+
+class TestTokenDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.batch_manager = LocalBatchManager()
+        self.addCleanup(self.batch_manager.close)
+
+    def _create_dispatcher(self, processing, journal_path: str = '', input_pin_names=('Input',)) -> TokenDispatcher:
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as config_file:
+            json.dump([{'PinName': pin_name, 'PinType': 'input', 'AccessType': 'ftp'} for pin_name in input_pin_names]
+                      + [{'PinName': 'Output', 'PinType': 'output', 'AccessType': 'ftp'}], config_file)
+
+        try:
+            # the journal is replayed by the tests, the setup of the only worker is retried at once
+            with mock.patch.multiple(dispatcher_module, SYS_EXECUTOR_WORKERS=1,
+                                     SYS_BATCH_MANAGER_TOKEN_ENDPOINT=self.batch_manager.url + '/token',
+                                     SYS_BATCH_MANAGER_ACK_ENDPOINT=self.batch_manager.url + '/ack',
+                                     SYS_TOKEN_JOURNAL_REPLAY_DELAY=3600.0,
+                                     SYS_SETUP_RETRY_DELAY=0.05):
+                dispatcher = TokenDispatcher(processing, asynchronous=True, pin_config_file_path=config_file.name,
+                                             journal_path=journal_path)
+        finally:
+            os.remove(config_file.name)
+
+        self.addCleanup(dispatcher.shutdown)
+        return dispatcher
+
+    def _get_acks(self, dispatcher: TokenDispatcher) -> List[Tuple[List[str], bool]]:
+        self.assertTrue(dispatcher.rest_client.flush(timeout=5))
+        return [(message['MsgUids'], message['IsFailed'])
+                for path, message in self.batch_manager.messages if path == '/ack']
+
+    def test_failed_processing_is_acked(self):
+        dispatcher = self._create_dispatcher(_FailingProcessing)
+        result = dispatcher.dispatch(json.dumps({'MsgUid': '1', 'PinName': 'Input', 'Values': '{}'}))
+        self.assertEqual(result.status, 200)
+        status = _wait_for_status(dispatcher, 'Failed')
+        self.assertEqual(status['Status'], 'Failed')
+        self.assertEqual(status['Counts'].get('Failed'), 1)
+        self.assertEqual(self._get_acks(dispatcher), [(['1'], True)])
+
+    def test_invalid_token_is_acked(self):
+        dispatcher = self._create_dispatcher(_AckingProcessing)
+        result = dispatcher.dispatch('not a token')
+        self.assertEqual(result.status, 200)
+        self.assertFalse(json.loads(result.body)['success'])
+        self.assertEqual(self._get_acks(dispatcher), [(['empty'], True)])
+        # not a job of the module
+        self.assertEqual(dispatcher.get_status()['Counts'], {})
+
+    def test_rejects_token_when_queue_is_full(self):
+        dispatcher = self._create_dispatcher(_AckingProcessing)
+
+        with mock.patch.object(dispatcher.executor, 'submit', side_effect=QueueFull(0)):
+            result = dispatcher.dispatch(json.dumps({'MsgUid': '1', 'PinName': 'Input', 'Values': '{}'}))
+
+        self.assertEqual(result.status, 503)
+        self.assertEqual(result.headers, {'Retry-After': '1'})
+        self.assertEqual(dispatcher.get_status()['Counts'], {'Rejected': 1})
+        # the batch manager sends the token again
+        self.assertEqual(dispatcher.dispatch(json.dumps({'MsgUid': '1', 'PinName': 'Input', 'Values': '{}'})).status,
+                         200)
+        self.assertEqual(_wait_for_status(dispatcher, 'Completed')['Counts'], {'Rejected': 1, 'Completed': 1})
+
+    def test_processing_with_own_init_is_acked(self):
+        dispatcher = self._create_dispatcher(_OwnInitProcessing)
+        dispatcher.dispatch(json.dumps({'MsgUid': '1', 'PinName': 'Input', 'Values': '{}'}))
+        status = _wait_for_status(dispatcher, 'Failed')
+        self.assertTrue(status['Ready'])
+        self.assertEqual(self._get_acks(dispatcher), [(['1'], True)])
+
+    def test_retries_failed_setup(self):
+        _SetUpOnRetryProcessing.attempts = 0
+        dispatcher = self._create_dispatcher(_SetUpOnRetryProcessing)
+        result = dispatcher.dispatch(json.dumps({'MsgUid': '1', 'PinName': 'Input', 'Values': '{}'}))
+        self.assertEqual(result.status, 200)
+        status = _wait_for_status(dispatcher, 'Completed')
+        self.assertTrue(status['Ready'])
+        self.assertEqual(self._get_acks(dispatcher), [(['1'], False)])
+
+    def test_tokens_fail_when_shut_down_before_setup(self):
+        dispatcher = self._create_dispatcher(_NotSetUpProcessing)
+        dispatcher.dispatch(json.dumps({'MsgUid': '1', 'PinName': 'Input', 'Values': '{}'}))
+        self.assertFalse(dispatcher.is_ready())
+        dispatcher.shutdown()
+        self.assertEqual(dispatcher.get_status()['Status'], 'Failed')
+        self.assertEqual(self._get_acks(dispatcher), [(['1'], True)])
+
+    def test_resent_token_is_counted_once(self):
+        dispatcher = self._create_dispatcher(_AckingProcessing)
+        token = json.dumps({'MsgUid': '1', 'PinName': 'Input', 'Values': '{}'})
+        dispatcher.dispatch(token)
+        _wait_for_status(dispatcher, 'Completed')
+
+        for _ in range(2):
+            self.assertEqual(dispatcher.dispatch(token).status, 200)
+
+        status = dispatcher.get_status()
+        self.assertEqual(status['Status'], 'Completed')
+        self.assertEqual(status['Counts'], {'Completed': 1})
+        # the ack is sent again for every resent token (merged within the ack window)
+        acked = [msg_uid for msg_uids, is_failed in self._get_acks(dispatcher) for msg_uid in msg_uids]
+        self.assertEqual(acked, ['1'] * 3)
+
+    def test_joins_pairs_of_single_tokens(self):
+        dispatcher = self._create_dispatcher(_JoiningProcessing, input_pin_names=('Image', 'Model'))
+
+        # the second image arrives before the model of the first one
+        for msg_uid, pin_name in [('image 1', 'Image'), ('image 2', 'Image'), ('model 1', 'Model'),
+                                  ('model 2', 'Model')]:
+            token = json.dumps({'MsgUid': msg_uid, 'PinName': pin_name, 'Values': '{}'})
+            self.assertEqual(dispatcher.dispatch(token).status, 200)
+
+        self.assertEqual(_wait_for_status(dispatcher, 'Completed')['Counts'], {'Completed': 4})
+        self.assertTrue(dispatcher.rest_client.flush(timeout=5))
+        notes = sorted(message['Note'] for path, message in self.batch_manager.messages if path == '/ack')
+        self.assertEqual(notes, ['image 1, model 1', 'image 2, model 2'])
+
+    def test_replays_journal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tokens.db')
+            # unfinished tokens of the previous run
+            journal = TokenJournal(path)
+            journal.add('1', json.dumps({'MsgUid': '1', 'PinName': 'Input', 'Values': '{}'}))
+            journal.add('2', json.dumps({'MsgUid': '2', 'PinName': 'Removed', 'Values': '{}'}))
+            journal.add('3', 'not a token')
+            journal.close()
+
+            dispatcher = self._create_dispatcher(_AckingProcessing, path)
+            dispatcher.replay_journal()
+            # the worker finishes the accepted token
+            dispatcher.shutdown()
+            # the token which can not be parsed is failed as any invalid token
+            self.assertEqual(sorted(self._get_acks(dispatcher)), [(['1'], False), (['empty'], True)])
+            # the processed token is removed by its final ack, the invalid ones when replayed
+            self.assertEqual(dispatcher.journal.get_unfinished(), [])
+            dispatcher.journal.close()
+
+    def test_rejected_token_is_not_journaled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dispatcher = self._create_dispatcher(_FailingProcessing, os.path.join(directory, 'tokens.db'))
+            result = dispatcher.dispatch(json.dumps({'MsgUid': '1', 'PinName': 'Other', 'Values': '{}'}))
+            self.assertEqual(result.status, 400)
+            self.assertEqual(dispatcher.journal.get_unfinished(), [])
+            dispatcher.shutdown()
+            dispatcher.journal.close()
+
+
+class TestGetInputPinAttribute(unittest.TestCase):
+    def test_dict_values_are_snake_cased_copies(self):
+        credential = {'Host': 'input_host'}
+        pin = Pin({PinAttribute.NAME: 'Input', PinAttribute.TYPE: 'input', PinAttribute.ACCESS_CREDENTIAL: credential})
+        value = _get_input_pin_attribute(pin, PinAttribute.ACCESS_CREDENTIAL, None)
+        self.assertEqual(value, {'host': 'input_host'})
+        value['host'] = 'other_host'
+        # the configured pin is not changed by a token
+        self.assertEqual(credential, {'Host': 'input_host'})
+        self.assertEqual(_get_input_pin_attribute(pin, PinAttribute.ACCESS_PATH, {'ResourcePath': '/in'}),
+                         {'resource_path': '/in'})
+
+
+if __name__ == '__main__':
+    unittest.main()
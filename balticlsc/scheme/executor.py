@@ -0,0 +1,429 @@
+import pickle
+import queue
+import threading
+import time
+from typing import Callable, Dict, Type, Any, Union, Tuple, List, TYPE_CHECKING
+
+from balticlsc.scheme import metrics
+from balticlsc.scheme.logger import logger
+from balticlsc.scheme.pin import Pin, _override_pin
+from balticlsc.scheme.processing import ProcessingInterface
+
+if TYPE_CHECKING:
+    import multiprocessing
+    from balticlsc.scheme.job_rest_client import JobRestClient
+
+
+_queue_wait = metrics.histogram('balticlsc_token_queue_wait_seconds', 'Time tokens wait for a free worker.')
+_processing_time = metrics.histogram('balticlsc_token_processing_seconds', 'Time of processing a token.', ['result'])
+
+
+class ExecutorType:
+    THREAD = 'thread'
+    PROCESS = 'process'
+
+
+class QueueFull(Exception):
+    """Exception raised when the executor cannot admit any more tasks.
+
+    Attributes:
+        max_queue_size -- the size of the executor queue
+    """
+
+    def __init__(self, max_queue_size: int):
+        self._message = f'executor queue is full, max queue size = {max_queue_size}'
+        super().__init__(self._message)
+
+    def __str__(self):
+        return self._message
+
+
+class TokenExecutor:
+    """Fixed size pool of worker threads fed from a bounded queue.
+
+    Tasks exceeding the queue capacity are rejected with `QueueFull`
+    instead of spawning new threads, so a burst of tokens is absorbed
+    by the queue and the API can answer with a backpressure response.
+    Every worker runs `initializer` before its first task and `finalizer`
+    on shutdown, a worker is ready when its initializer did not fail.
+    A failed initializer is run again after `retry_delay` seconds, the
+    tasks wait in the queue meanwhile (or run without it after shutdown).
+    """
+
+    def __init__(self, workers: int = 1, max_queue_size: int = 16, initializer: Union[Callable, None] = None,
+                 initargs: tuple = (), finalizer: Union[Callable, None] = None, retry_delay: float = 10.0):
+        if workers < 1:
+            raise ValueError(f'executor needs at least one worker, got {workers}')
+
+        if max_queue_size < 0:
+            raise ValueError(f'executor queue size can not be negative, got {max_queue_size}')
+
+        self._workers = workers
+        self._max_queue_size = max_queue_size
+        # the queue itself is unbounded, the admission is controlled by the counter below
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._ready_workers = 0
+        self._initializer = initializer
+        self._initargs = initargs
+        self._finalizer = finalizer
+        self._retry_delay = retry_delay
+        self._stopped = threading.Event()
+        self._threads = []
+
+        for index in range(workers):
+            thread = threading.Thread(target=self._work, name=f'token worker {index}')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, name: str, target: Callable, *args) -> None:
+        with self._lock:
+            if self._queued + self._in_flight >= self._workers + self._max_queue_size:
+                raise QueueFull(self._max_queue_size)
+
+            self._queued += 1
+
+        self._queue.put((name, target, time.time(), args))
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'workers': self._workers,
+                'max_queue_size': self._max_queue_size,
+                'queue_depth': self._queued,
+                'in_flight': self._in_flight,
+            }
+
+    def is_ready(self) -> bool:
+        return self._ready_workers == self._workers
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._stopped.set()
+
+        for _ in self._threads:
+            self._queue.put(None)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self) -> None:
+        self._initialize()
+
+        while True:
+            task = self._queue.get()
+
+            if task is None:
+                if self._finalizer is not None:
+                    self._finalizer()
+
+                return
+
+            with self._lock:
+                self._queued -= 1
+                self._in_flight += 1
+
+            try:
+                _observe_task(_run_task(*task))
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+    def _initialize(self) -> None:
+        while self._initializer is not None:
+            try:
+                self._initializer(*self._initargs)
+                break
+            except BaseException as exception:
+                logger.error('initializing a worker failed, retrying in %s seconds: %s', self._retry_delay, exception)
+
+                if self._stopped.wait(self._retry_delay):
+                    return
+
+        with self._lock:
+            self._ready_workers += 1
+
+
+# returns the time spent in the queue, the time of running and if the task succeeded
+def _run_task(name: str, target: Callable, submitted_at: float, args: tuple) -> Tuple[float, float, bool]:
+    started_at = time.time()
+
+    try:
+        target(*args)
+        succeeded = True
+    except BaseException as exception:
+        logger.error('task "%s" failed: %s', name, exception)
+        succeeded = False
+
+    return started_at - submitted_at, time.time() - started_at, succeeded
+
+
+def _observe_task(timing: Tuple[float, float, bool]) -> None:
+    wait, duration, succeeded = timing
+    _queue_wait.observe(wait)
+    _processing_time.observe(duration, result='success' if succeeded else 'failure')
+
+
+# START # State of a worker thread or process # START #
+# the processing instance of the worker, set up once and used for all its tokens
+_worker = threading.local()
+# message of a worker process which finished its setup
+_WORKER_READY = '_worker_ready'
+# rest client of a worker process
+_worker_rest_client: Union['JobRestClient', None] = None
+
+
+def set_up_worker(processing: Type[ProcessingInterface], output_pin_name_to_value: Dict[str, Pin],
+                  rest_client: 'JobRestClient') -> None:
+    """Build and set up the processing instance of the calling worker thread or process."""
+    _worker.processing = None
+    _worker.setup_error = None
+    _worker.rest_client = rest_client
+
+    try:
+        _worker.processing = processing(output_pin_name_to_value)
+        _worker.processing.set_rest_client(rest_client)
+        _worker.processing.setup()
+    except BaseException as exception:
+        logger.error('setup of the processing failed: %s', exception)
+        _worker.setup_error = exception
+        raise
+
+
+def tear_down_worker() -> None:
+    """Tear down the processing instance of the calling worker thread or process."""
+    if _worker.processing is None:
+        return
+
+    try:
+        _worker.processing.teardown()
+    except BaseException as exception:
+        logger.error('teardown of the processing failed: %s', exception)
+
+
+def _get_worker_processing(msg_uids: List[str]) -> ProcessingInterface:
+    # the tokens of a worker whose setup did not succeed until the shutdown fail
+    if _worker.setup_error is not None:
+        error_msg = f'setup of the processing failed: {str(_worker.setup_error)}'
+        _worker.rest_client.send_ack_token(
+            msg_uids=msg_uids,
+            is_final=True,
+            is_failed=True,
+            note=error_msg,
+        )
+        raise RuntimeError(error_msg)
+
+    return _worker.processing
+
+
+def run_in_processing_thread(msg_uid: str, input_pin: Pin) -> None:
+    _get_worker_processing([msg_uid]).run(msg_uid, input_pin)
+
+
+def run_joined_in_processing_thread(inputs: Dict[str, List[Tuple[str, Pin]]]) -> None:
+    _get_worker_processing([msg_uid for tokens in inputs.values() for msg_uid, _ in tokens]).run_joined(inputs)
+
+
+def run_batch_in_processing_thread(tokens: List[Tuple[str, Pin]]) -> None:
+    _get_worker_processing([msg_uid for msg_uid, _ in tokens]).run_batch(tokens)
+
+
+def _init_processing_worker(processing_pickle: bytes, input_pin_name_to_value: Dict[str, Pin],
+                            output_pin_name_to_value: Dict[str, Pin], rest_client: 'JobRestClient',
+                            forward_queue: 'multiprocessing.Queue', stopped: 'multiprocessing.Event',
+                            retry_delay: float) -> None:
+    global _worker_rest_client
+    # tokens and acks are passed to the parent process and sent from there
+    rest_client.forward_to(forward_queue)
+    _worker_rest_client = rest_client
+    _worker.input_pin_name_to_value = input_pin_name_to_value
+
+    # the tasks wait in the queue of the pool meanwhile, an initializer raising would be started again at once
+    while True:
+        try:
+            _set_up_processing_worker(processing_pickle, output_pin_name_to_value, rest_client)
+            break
+        except BaseException:
+            logger.error('setting up the worker process failed, retrying in %s seconds', retry_delay)
+
+            if stopped.wait(retry_delay):
+                return
+
+    import multiprocessing.util
+    # run when the worker process exits after the pool is closed
+    multiprocessing.util.Finalize(None, tear_down_worker, exitpriority=10)
+    forward_queue.put((_WORKER_READY, {}))
+
+
+def _set_up_processing_worker(processing_pickle: bytes, output_pin_name_to_value: Dict[str, Pin],
+                              rest_client: 'JobRestClient') -> None:
+    try:
+        # imports the module of the processing class, its init_baltic_api returns the rest client of the worker
+        processing = pickle.loads(processing_pickle)
+    except BaseException as exception:
+        logger.error('importing the processing failed: %s', exception)
+        _worker.processing, _worker.setup_error, _worker.rest_client = None, exception, rest_client
+        raise
+
+    set_up_worker(processing, output_pin_name_to_value, rest_client)
+
+
+def get_worker_rest_client() -> Union['JobRestClient', None]:
+    """Rest client forwarding to the parent process inside a worker process, None in other processes."""
+    return _worker_rest_client
+
+
+def run_in_processing_worker(msg_uid: str, pin_name: str, pin_overrides: Dict[str, Any]) -> None:
+    input_pin = _override_pin(_worker.input_pin_name_to_value[pin_name], pin_overrides)
+    _get_worker_processing([msg_uid]).run(msg_uid, input_pin)
+
+
+def run_joined_in_processing_worker(inputs: Dict[str, List[Tuple[str, str, Dict[str, Any]]]]) -> None:
+    msg_uids = [msg_uid for tokens in inputs.values() for msg_uid, *_ in tokens]
+    _get_worker_processing(msg_uids).run_joined({
+        input_pin_name: [(msg_uid, _override_pin(_worker.input_pin_name_to_value[pin_name], pin_overrides))
+                         for msg_uid, pin_name, pin_overrides in tokens]
+        for input_pin_name, tokens in inputs.items()})
+
+
+def run_batch_in_processing_worker(tokens: List[Tuple[str, str, Dict[str, Any]]]) -> None:
+    _get_worker_processing([msg_uid for msg_uid, *_ in tokens]).run_batch([
+        (msg_uid, _override_pin(_worker.input_pin_name_to_value[pin_name], pin_overrides))
+        for msg_uid, pin_name, pin_overrides in tokens])
+# STOP # State of a worker thread or process # STOP #
+
+
+class ProcessTokenExecutor:
+    """Fixed size pool of warm worker processes for CPU-bound processing.
+
+    Each worker builds its `ProcessingInterface` instance and runs its
+    `setup` once, then reuses it for every token. Tasks carry only the message uid, the input pin
+    name and the pin attributes taken from the token, the configured pins
+    are sent to every worker once. Messages sent by the workers
+    through `JobRestClient` are forwarded to the parent process.
+
+    The workers are started by `start` or on the first submitted task,
+    from a fork server (or spawned), not forked from the threads of the
+    api process. They import the module of the processing class again,
+    `init_baltic_api` returns the forwarding rest client there. A failed
+    setup is retried after `retry_delay` seconds.
+    """
+
+    def __init__(self, processing: Type[ProcessingInterface], input_pin_name_to_value: Dict[str, Pin],
+                 output_pin_name_to_value: Dict[str, Pin], rest_client: 'JobRestClient',
+                 workers: int = 1, max_queue_size: int = 16, retry_delay: float = 10.0):
+        if workers < 1:
+            raise ValueError(f'executor needs at least one worker, got {workers}')
+
+        if max_queue_size < 0:
+            raise ValueError(f'executor queue size can not be negative, got {max_queue_size}')
+
+        self._processing = processing
+        self._input_pin_name_to_value = input_pin_name_to_value
+        self._output_pin_name_to_value = output_pin_name_to_value
+        self._rest_client = rest_client
+        self._workers = workers
+        self._max_queue_size = max_queue_size
+        self._retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._ready_workers = 0
+        self._pool = None
+        self._forward_queue = None
+        self._stopped = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._pool is None:
+                self._start()
+
+    def submit(self, name: str, target: Callable, *args) -> None:
+        with self._lock:
+            if self._pending >= self._workers + self._max_queue_size:
+                raise QueueFull(self._max_queue_size)
+
+            if self._pool is None:
+                self._start()
+
+            self._pending += 1
+
+        def on_error(exception: BaseException):
+            logger.error('task "%s" failed: %s', name, exception)
+            self._on_done(None)
+
+        self._pool.apply_async(_run_task, (name, target, time.time(), args),
+                               callback=self._on_done, error_callback=on_error)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = min(self._pending, self._workers)
+            return {
+                'workers': self._workers,
+                'max_queue_size': self._max_queue_size,
+                'queue_depth': self._pending - in_flight,
+                'in_flight': in_flight,
+            }
+
+    def is_ready(self) -> bool:
+        # a worker started again by the pool reports again
+        return self._ready_workers >= self._workers
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._pool is None:
+                return
+
+            # the workers still setting up fail their tokens
+            self._stopped.set()
+            self._pool.close()
+
+        if wait:
+            self._pool.join()
+
+        self._forward_queue.put(None)
+
+    def _start(self) -> None:
+        # multiprocessing is imported only by the modules processing tokens in processes
+        import multiprocessing
+        # a forked worker would inherit the locks held by the threads of the api process
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(start_method)
+        self._forward_queue = context.Queue()
+        self._stopped = context.Event()
+        forward_thread = threading.Thread(target=self._forward, name='worker messages forwarder')
+        forward_thread.daemon = True
+        forward_thread.start()
+        self._pool = context.Pool(
+            processes=self._workers,
+            initializer=_init_processing_worker,
+            initargs=(pickle.dumps(self._processing), self._input_pin_name_to_value, self._output_pin_name_to_value,
+                      self._rest_client, self._forward_queue, self._stopped, self._retry_delay))
+        logger.info('started %d processing worker processes (%s)', self._workers, start_method)
+
+    def _on_done(self, timing: Union[Tuple[float, float, bool], None]) -> None:
+        if timing is not None:
+            _observe_task(timing)
+
+        with self._lock:
+            self._pending -= 1
+
+    def _forward(self) -> None:
+        while True:
+            message = self._forward_queue.get()
+
+            if message is None:
+                return
+
+            method_name, kwargs = message
+
+            if method_name == _WORKER_READY:
+                self._ready_workers += 1
+                continue
+
+            try:
+                getattr(self._rest_client, method_name)(**kwargs)
+            except BaseException as exception:
+                logger.error('forwarding "%s" from a worker process failed: %s', method_name, exception)
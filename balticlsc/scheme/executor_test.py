@@ -0,0 +1,147 @@
+import json
+import threading
+import unittest
+from typing import Dict
+from unittest import mock
+
+from balticlsc.scheme.executor import TokenExecutor, ProcessTokenExecutor, QueueFull, run_in_processing_worker
+from balticlsc.scheme.job_rest_client import JobRestClient
+from balticlsc.scheme.pin import Pin, PinAttribute
+from balticlsc.scheme.processing import ProcessingInterface
+
+
+class _Processing(ProcessingInterface):
+    def process(self, msg_uid: str, input_pin: Pin, output_pin_name_to_value: Dict[str, Pin]) -> None:
+        self._rest_client.send_ack_token(msg_uids=[msg_uid], is_final=True, note=input_pin.getattr(PinAttribute.ACCESS_PATH))
+
+
+class _NotSetUpProcessing(_Processing):
+    def setup(self) -> None:
+        raise RuntimeError('missing model')
+
+
+class TestTokenExecutor(unittest.TestCase):
+    def test_rejects_when_queue_is_full(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        executor = TokenExecutor(workers=1, max_queue_size=1)
+        executor.submit('first', block)
+        started.wait(1)
+        executor.submit('second', block)
+
+        with self.assertRaises(QueueFull):
+            executor.submit('third', block)
+
+        stats = executor.get_stats()
+        self.assertEqual(stats['in_flight'], 1)
+        self.assertEqual(stats['queue_depth'], 1)
+        release.set()
+        executor.shutdown()
+        self.assertEqual(executor.get_stats()['in_flight'], 0)
+
+    def test_runs_all_tasks(self):
+        results = []
+        executor = TokenExecutor(workers=2, max_queue_size=10)
+
+        for index in range(10):
+            executor.submit(str(index), results.append, index)
+
+        executor.shutdown()
+        self.assertEqual(sorted(results), list(range(10)))
+
+    def test_initializes_every_worker_once(self):
+        initialized = []
+        finalized = []
+        executor = TokenExecutor(workers=2, max_queue_size=10, initializer=initialized.append, initargs=('worker',),
+                                 finalizer=lambda: finalized.append('worker'))
+
+        for index in range(10):
+            executor.submit(str(index), lambda: None)
+
+        executor.shutdown()
+        self.assertTrue(executor.is_ready())
+        self.assertEqual(initialized, ['worker', 'worker'])
+        self.assertEqual(finalized, ['worker', 'worker'])
+
+    def test_retries_failed_initializer(self):
+        attempts = []
+
+        def fail_once():
+            attempts.append('attempt')
+
+            if len(attempts) == 1:
+                raise RuntimeError('no model')
+
+        done = threading.Event()
+        executor = TokenExecutor(workers=1, max_queue_size=1, initializer=fail_once, retry_delay=0.01)
+        # waits in the queue until the worker is initialized
+        executor.submit('task', done.set)
+        self.assertTrue(done.wait(5))
+        executor.shutdown()
+        self.assertTrue(executor.is_ready())
+        self.assertEqual(len(attempts), 2)
+
+    def test_not_ready_when_initializer_fails(self):
+        def fail():
+            raise RuntimeError('no model')
+
+        results = []
+        executor = TokenExecutor(workers=1, max_queue_size=1, initializer=fail, retry_delay=3600.0)
+        executor.submit('task', results.append, 'done')
+        # the retries stop, the queued tasks run without the initializer
+        executor.shutdown()
+        self.assertFalse(executor.is_ready())
+        self.assertEqual(results, ['done'])
+
+
+class TestProcessTokenExecutor(unittest.TestCase):
+    def test_forwards_acks_from_workers(self):
+        sent = []
+        acked = threading.Event()
+
+        def send(token, url):
+            sent.append((url, json.loads(token.to_json())))
+            acked.set()
+
+        rest_client = JobRestClient('/token', '/ack', 'module_uid', asynchronous=False)
+        input_pin = Pin({PinAttribute.NAME: 'Input', PinAttribute.TYPE: 'input'})
+
+        with mock.patch.object(rest_client, '_JobRestClient__send_msg_to_batch_manager', send):
+            executor = ProcessTokenExecutor(_Processing, {'Input': input_pin}, {}, rest_client, workers=1)
+            executor.submit('token', run_in_processing_worker, '1', 'Input', {PinAttribute.ACCESS_PATH: '/in'})
+            self.assertTrue(acked.wait(10))
+            executor.shutdown()
+
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0][0], '/ack')
+        self.assertEqual(sent[0][1]['MsgUids'], ['1'])
+        self.assertEqual(sent[0][1]['Note'], '/in')
+        self.assertTrue(sent[0][1]['IsFinal'])
+
+    def test_tokens_fail_when_shut_down_before_setup(self):
+        sent = []
+
+        def send(token, url):
+            sent.append((url, json.loads(token.to_json())))
+
+        rest_client = JobRestClient('/token', '/ack', 'module_uid', asynchronous=False)
+        input_pin = Pin({PinAttribute.NAME: 'Input', PinAttribute.TYPE: 'input'})
+
+        with mock.patch.object(rest_client, '_JobRestClient__send_msg_to_batch_manager', send):
+            executor = ProcessTokenExecutor(_NotSetUpProcessing, {'Input': input_pin}, {}, rest_client, workers=1,
+                                            retry_delay=3600.0)
+            executor.submit('token', run_in_processing_worker, '1', 'Input', {})
+            executor.shutdown()
+
+        self.assertFalse(executor.is_ready())
+        self.assertEqual([(url, message['MsgUids'], message['IsFailed']) for url, message in sent],
+                         [('/ack', ['1'], True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,50 +1,251 @@
-from typing import List
-
-import requests
-import json
+import queue
+import threading
+import time
+from typing import List, Dict, Tuple, Callable, TYPE_CHECKING
 
+from balticlsc.scheme import metrics
 from balticlsc.scheme.logger import logger
-from balticlsc.scheme.status import JobStatus, ComputationStatus
+from balticlsc.scheme.status import JobStatus, ComputationStatus, JobTracker
 from balticlsc.scheme.token import AckToken, OutputToken, Token
-from balticlsc.scheme.utils import snake_to_camel
+from balticlsc.scheme.tracing import current_msg_uid
+from balticlsc.scheme.utils import snake_to_camel, dumps
+
+if TYPE_CHECKING:
+    import requests
+
+_request_time = metrics.histogram('balticlsc_batch_manager_request_seconds',
+                                  'Time of requests to the batch manager.', ['endpoint'])
+_request_failures = metrics.counter('balticlsc_batch_manager_failures_total',
+                                    'Failed requests to the batch manager.', ['endpoint'])
+
+
+def _create_session(retries: int, pool_size: int) -> 'requests.Session':
+    # requests is imported with the first message, not on the module start
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry_kwargs = dict(total=retries, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+
+    try:
+        # batch manager messages are POSTs, they have to be retried as well
+        retry = Retry(allowed_methods=None, **retry_kwargs)
+    except TypeError:
+        retry = Retry(method_whitelist=False, **retry_kwargs)
+
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'content-type': 'application/json'})
+    return session
 
 
 class JobRestClient:
-    def __init__(self, url_token: str, url_ack: str, sender_uid: str):
+    """Client of the batch manager.
+
+    Messages are posted through a keep-alive session, created with the
+    first message. In the asynchronous mode (default) they are queued and
+    sent by a background thread, so the processing does not wait for the
+    batch manager. Acks queued within
+    `ack_window` seconds of each other and sharing the same flags and note
+    are sent as one `AckToken` with several `msg_uids`.
+    """
+
+    def __init__(self, url_token: str, url_ack: str, sender_uid: str, timeout: float = 10.0, retries: int = 3,
+                 ack_window: float = 0.05, asynchronous: bool = True):
         self._url_token = url_token
         self._url_ack = url_ack
         self._sender_uid = sender_uid
-        self._module_status = JobStatus()
+        self._job_tracker = JobTracker()
+        self._ack_listeners: List[Callable[[List[str], bool, bool], None]] = []
+        self._output_listeners: List[Callable[[str, dict, str, bool], None]] = []
+        self._forward_queue = None
+        self._timeout = timeout
+        self._ack_window = ack_window
+        self._asynchronous = asynchronous
+        self._retries = retries
+        self._session = None
+        self._outbox = queue.Queue()
+        self._sender_lock = threading.Lock()
+        self._sender = None
+
+    def __reduce__(self):
+        # sent to the worker processes without the queued messages, the listeners and the session
+        return JobRestClient, (self._url_token, self._url_ack, self._sender_uid, self._timeout, self._retries,
+                               self._ack_window, self._asynchronous)
+
+    # forward all the messages to the given queue instead of sending them, used inside worker processes
+    def forward_to(self, forward_queue) -> None:
+        self._forward_queue = forward_queue
+
+    # the listener is called with the msg_uids, is_final and is_failed of every ack sent by the module
+    def add_ack_listener(self, listener: Callable[[List[str], bool, bool], None]) -> None:
+        self._ack_listeners.append(listener)
+
+    # the listener is called with the base_msg_uid, values, output_pin_name and is_final of every output token
+    def add_output_listener(self, listener: Callable[[str, dict, str, bool], None]) -> None:
+        self._output_listeners.append(listener)
+
+    # a replayed message (e.g. of a resent token which is already processed) does not notify the listeners
+    def send_output_token(self, base_msg_uid: str, values: dict, output_pin_name, is_final=True, replayed=False):
+        if self._forward_queue is not None:
+            self._forward_queue.put(('send_output_token', {
+                'base_msg_uid': base_msg_uid, 'values': values, 'output_pin_name': output_pin_name,
+                'is_final': is_final, 'replayed': replayed}))
+            return
+
+        if not replayed:
+            self.__notify(self._output_listeners, base_msg_uid, values, output_pin_name, is_final)
 
-    def send_output_token(self, base_msg_uid: str, values: dict, output_pin_name, is_final=True):
         msg = OutputToken(
             pin_name=output_pin_name,
             sender_uid=self._sender_uid,
-            values=json.dumps({snake_to_camel(key): value for key, value in values.items()}),
+            values=dumps({snake_to_camel(key): value for key, value in values.items()}),
             base_msg_uid=base_msg_uid,
             is_final=is_final)
-        JobRestClient.__send_msg_to_batch_manager(msg, self._url_token)
 
-    def send_ack_token(self, msg_uids: List[str], is_final=False, is_failed=False, note=''):
+        if self._asynchronous:
+            self.__enqueue(('output', msg))
+        else:
+            self.__send_msg_to_batch_manager(msg, self._url_token)
+
+    # a replayed ack does not change the job status and does not notify the listeners
+    def send_ack_token(self, msg_uids: List[str], is_final=False, is_failed=False, note='', replayed=False):
+        if self._forward_queue is not None:
+            self._forward_queue.put(('send_ack_token', {
+                'msg_uids': msg_uids, 'is_final': is_final, 'is_failed': is_failed, 'note': note,
+                'replayed': replayed}))
+            return
+
+        if not replayed:
+            if is_final:
+                for msg_uid in msg_uids:
+                    self._job_tracker.finish(msg_uid, failed=is_failed)
+
+            self.__notify(self._ack_listeners, msg_uids, is_final, is_failed)
+
+        if self._asynchronous:
+            self.__enqueue(('ack', (list(msg_uids), is_final, is_failed, note)))
+        else:
+            self.__send_ack(msg_uids, is_final, is_failed, note)
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until all the queued messages are sent, returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while self._outbox.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+
+            time.sleep(0.01)
+
+        return True
+
+    def get_job_status(self) -> JobStatus:
+        return self._job_tracker.get_job_status()
+
+    def get_job_tracker(self) -> JobTracker:
+        return self._job_tracker
+
+    def get_computation_status(self) -> ComputationStatus:
+        return self._job_tracker.get_job_status().get_computation_status()
+
+    # the status of the token processed in the current thread, or of all the working tokens outside of processing
+    def update_status(self, status: ComputationStatus = ComputationStatus.Working, job_progress: float = 0.0,
+                      msg_uid: str = None):
+        if msg_uid is None:
+            msg_uid = current_msg_uid()
+
+        if self._forward_queue is not None:
+            self._forward_queue.put(('update_status', {'status': status, 'job_progress': job_progress,
+                                                       'msg_uid': msg_uid}))
+            return
+
+        self._job_tracker.update(msg_uid, status, job_progress)
+
+    @staticmethod
+    def __notify(listeners: List[Callable], *args) -> None:
+        for listener in listeners:
+            try:
+                listener(*args)
+            except BaseException as exception:
+                logger.error('listener of the batch manager messages failed: %s', exception)
+
+    def __enqueue(self, message: Tuple[str, object]) -> None:
+        if self._sender is None:
+            with self._sender_lock:
+                if self._sender is None:
+                    sender = threading.Thread(target=self.__send_messages, name='batch manager sender')
+                    sender.daemon = True
+                    sender.start()
+                    self._sender = sender
+
+        self._outbox.put(message)
+
+    def __send_messages(self) -> None:
+        while True:
+            messages = [self._outbox.get()]
+            deadline = time.monotonic() + self._ack_window
+
+            # collect the messages arriving shortly after the first one
+            while True:
+                remaining = deadline - time.monotonic()
+
+                if remaining <= 0:
+                    break
+
+                try:
+                    messages.append(self._outbox.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            ack_key_to_msg_uids: Dict[Tuple[bool, bool, str], List[str]] = {}
+
+            for kind, message in messages:
+                if kind == 'output':
+                    self.__send_msg_to_batch_manager(message, self._url_token)
+                else:
+                    msg_uids, is_final, is_failed, note = message
+                    ack_key_to_msg_uids.setdefault((is_final, is_failed, note), []).extend(msg_uids)
+
+            for (is_final, is_failed, note), msg_uids in ack_key_to_msg_uids.items():
+                self.__send_ack(msg_uids, is_final, is_failed, note)
+
+            for _ in messages:
+                self._outbox.task_done()
+
+    def __send_ack(self, msg_uids: List[str], is_final: bool, is_failed: bool, note: str) -> None:
         msg = AckToken(
             sender_uid=self._sender_uid,
             msg_uids=msg_uids,
             is_final=is_final,
             is_failed=is_failed,
             note=note)
-        JobRestClient.__send_msg_to_batch_manager(msg, self._url_ack)
+        self.__send_msg_to_batch_manager(msg, self._url_ack)
 
-    def get_job_status(self) -> JobStatus:
-        return self._module_status
+    def __get_session(self) -> 'requests.Session':
+        if self._session is None:
+            with self._sender_lock:
+                if self._session is None:
+                    self._session = _create_session(self._retries, pool_size=4)
 
-    def get_computation_status(self) -> ComputationStatus:
-        return self._module_status.get_computation_status()
+        return self._session
 
-    def update_status(self, status: ComputationStatus = ComputationStatus.Working, job_progress: float = 0.0):
-        self._module_status.update(status, job_progress)
+    def __send_msg_to_batch_manager(self, token: Token, url) -> None:
+        import requests
 
-    @staticmethod
-    def __send_msg_to_batch_manager(token: Token, url):
+        session = self.__get_session()
         token_json = token.to_json()
-        logger.info(f'sending message to batch manager, url={url}, message={token_json}')
-        requests.post(url, data=token_json, headers={'content-type': 'application/json'})
+        logger.debug('sending message to batch manager, url=%s, message=%s', url, token_json)
+        endpoint = 'ack' if url == self._url_ack else 'token'
+        started_at = time.monotonic()
+
+        try:
+            response = session.post(url, data=token_json, timeout=self._timeout)
+            response.raise_for_status()
+        except requests.RequestException as exception:
+            _request_failures.inc(endpoint=endpoint)
+            logger.error('sending message to batch manager failed, url=%s, error: %s', url, exception)
+        finally:
+            _request_time.observe(time.monotonic() - started_at, endpoint=endpoint)
@@ -0,0 +1,150 @@
+import json
+import pickle
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Tuple
+
+from balticlsc.scheme.job_rest_client import JobRestClient
+
+
+class LocalBatchManager:
+    """Local HTTP stub of the batch manager recording the posted messages."""
+
+    def __init__(self):
+        self.messages: List[Tuple[str, dict]] = []
+        # statuses of the next responses, 200 when empty
+        self.statuses: List[int] = []
+        self.release = threading.Event()
+        self.release.set()
+        batch_manager = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                batch_manager.release.wait(5)
+                status = batch_manager.statuses.pop(0) if batch_manager.statuses else 200
+
+                if status == 200:
+                    batch_manager.messages.append((self.path, json.loads(body)))
+
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), name='batch manager')
+        self._thread.daemon = True
+        self._thread.start()
+        self.url = f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def close(self) -> None:
+        self.release.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TestJobRestClient(unittest.TestCase):
+    def setUp(self):
+        self.batch_manager = LocalBatchManager()
+
+    def tearDown(self):
+        self.batch_manager.close()
+
+    def _create_client(self, **kwargs) -> JobRestClient:
+        return JobRestClient(url_token=self.batch_manager.url + '/token', url_ack=self.batch_manager.url + '/ack',
+                             sender_uid='module', timeout=5.0, **kwargs)
+
+    def _get_acks(self) -> List[Tuple[List[str], bool, bool, str]]:
+        return sorted((message['MsgUids'], message['IsFinal'], message['IsFailed'], message['Note'])
+                      for path, message in self.batch_manager.messages if path == '/ack')
+
+    def test_coalesces_acks_within_window(self):
+        client = self._create_client(ack_window=0.2)
+
+        for msg_uid in ['1', '2', '3']:
+            client.send_ack_token(msg_uids=[msg_uid], is_final=True)
+
+        self.assertTrue(client.flush(timeout=5))
+        self.assertEqual(self._get_acks(), [(['1', '2', '3'], True, False, '')])
+
+    def test_does_not_merge_acks_with_different_flags_or_notes(self):
+        client = self._create_client(ack_window=0.2)
+        client.send_ack_token(msg_uids=['1'], is_final=True)
+        client.send_ack_token(msg_uids=['2'], is_final=True, is_failed=True, note='broken input')
+        client.send_ack_token(msg_uids=['3'], is_final=True, is_failed=True, note='missing model')
+        client.send_ack_token(msg_uids=['4'], is_final=False)
+        client.send_ack_token(msg_uids=['5'], is_final=True)
+
+        self.assertTrue(client.flush(timeout=5))
+        self.assertEqual(self._get_acks(), [
+            (['1', '5'], True, False, ''),
+            (['2'], True, True, 'broken input'),
+            (['3'], True, True, 'missing model'),
+            (['4'], False, False, ''),
+        ])
+
+    def test_flush_drains_outbox(self):
+        self.batch_manager.release.clear()
+        client = self._create_client(ack_window=0.0)
+        client.send_output_token(base_msg_uid='1', values={'resource_path': '/out'}, output_pin_name='Output')
+        client.send_ack_token(msg_uids=['1'], is_final=True)
+
+        # the batch manager does not answer yet
+        self.assertFalse(client.flush(timeout=0.1))
+        self.batch_manager.release.set()
+        self.assertTrue(client.flush(timeout=5))
+        self.assertEqual(self.batch_manager.messages, [
+            ('/token', {'PinName': 'Output', 'SenderUid': 'module', 'Values': '{"ResourcePath":"/out"}',
+                        'BaseMsgUid': '1', 'IsFinal': True}),
+            ('/ack', {'SenderUid': 'module', 'MsgUids': ['1'], 'Note': '', 'IsFinal': True, 'IsFailed': False}),
+        ])
+
+    def test_sends_in_background(self):
+        self.batch_manager.release.clear()
+        client = self._create_client()
+        sent = threading.Event()
+        # the caller is not blocked by the batch manager
+        sender = threading.Thread(target=lambda: (client.send_ack_token(msg_uids=['1'], is_final=True), sent.set()))
+        sender.start()
+
+        self.assertTrue(sent.wait(1))
+        self.assertEqual(self.batch_manager.messages, [])
+        self.batch_manager.release.set()
+        self.assertTrue(client.flush(timeout=5))
+        self.assertEqual(self._get_acks(), [(['1'], True, False, '')])
+        sender.join()
+
+    def test_retries_unavailable_batch_manager(self):
+        self.batch_manager.statuses = [503, 502]
+        client = self._create_client(retries=3, asynchronous=False)
+        client.send_ack_token(msg_uids=['1'], is_final=True)
+
+        self.assertEqual(self.batch_manager.statuses, [])
+        self.assertEqual(self._get_acks(), [(['1'], True, False, '')])
+
+    def test_tracks_final_acks(self):
+        client = self._create_client(asynchronous=False)
+        client.get_job_tracker().start('1')
+        client.get_job_tracker().start('2')
+        client.send_ack_token(msg_uids=['1'], is_final=True)
+        client.send_ack_token(msg_uids=['2'], is_final=True, is_failed=True)
+
+        self.assertEqual(client.get_job_tracker().get_snapshot()['Counts'], {'Completed': 1, 'Failed': 1})
+
+    def test_pickled_client_sends_to_same_batch_manager(self):
+        client = self._create_client(asynchronous=False)
+        client.add_ack_listener(lambda msg_uids, is_final, is_failed: None)
+        # as sent to the worker processes
+        copy = pickle.loads(pickle.dumps(client))
+        copy.send_ack_token(msg_uids=['1'], is_final=True)
+
+        self.assertEqual(self._get_acks(), [(['1'], True, False, '')])
+        self.assertEqual(client.get_job_tracker().get_snapshot()['Counts'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from balticlsc.scheme.logger import logger
+from balticlsc.scheme.pin import Pin, PinAttribute
+from balticlsc.scheme.token import XSeqToken
+
+SeqStack = Union[List[XSeqToken], None]
+
+
+class Multiplicity:
+    SINGLE = 'single'
+    MULTIPLE = 'multiple'
+
+
+class JoinEntry:
+    """Tokens of the input pins sharing one join key."""
+
+    def __init__(self, key: Tuple[str, ...]):
+        self.key = key
+        self.created_at = time.monotonic()
+        # pin name -> items and seq stacks of its tokens
+        self.pin_name_to_items: Dict[str, List[Tuple[Any, SeqStack]]] = defaultdict(list)
+
+    def get_inputs(self) -> Dict[str, List[Any]]:
+        return {pin_name: [item for item, _ in items] for pin_name, items in self.pin_name_to_items.items()}
+
+    def get_items(self) -> List[Any]:
+        return [item for items in self.pin_name_to_items.values() for item, _ in items]
+
+
+def _is_sequence_complete(seq_stacks: List[SeqStack]) -> bool:
+    # a token without a sequence is a whole sequence on its own
+    if not all(seq_stacks):
+        return True
+
+    seq_tokens = [seq_stack[-1] for seq_stack in seq_stacks]
+    final_nos = [seq_token.get_no() for seq_token in seq_tokens if seq_token.is_final()]
+
+    if not final_nos:
+        return False
+
+    nos = {seq_token.get_no() for seq_token in seq_tokens}
+    # tokens of a sequence are numbered from 0 or 1
+    return nos == set(range(final_nos[0] + 1)) or nos == set(range(1, final_nos[0] + 1))
+
+
+def _get_innermost_seq_uid(seq_stack: SeqStack) -> Union[str, None]:
+    return seq_stack[-1].get_seq_uid() if seq_stack else None
+
+
+class JoinTable:
+    """Buffers the tokens of the input pins until the inputs of one processing are complete.
+
+    Tokens are joined by the seq_uids of their seq stack. A pin with the
+    `TokenMultiplicity` "multiple" takes all the tokens of its innermost
+    sequence (so that sequence is not a part of the key) and is complete
+    when its final token and all the tokens before it arrived, a pin with
+    the "single" multiplicity takes one token, another token of it with
+    the same key is rejected with `ValueError`. Tokens without an outer
+    sequence (the empty key) are joined in the order of their arrival,
+    another token of a pin starts the next entry. Entries not completed
+    within `timeout` seconds are dropped by a background thread and
+    passed to `on_expired`.
+    """
+
+    def __init__(self, input_pin_name_to_value: Dict[str, Pin], timeout: float,
+                 on_expired: Callable[[JoinEntry], None]):
+        if timeout <= 0:
+            raise ValueError(f'join timeout has to be positive, got {timeout}')
+
+        self._input_pin_names = sorted(input_pin_name_to_value)
+        self._multiple_pin_names = {
+            pin_name for pin_name, pin in input_pin_name_to_value.items()
+            if pin.getattr(PinAttribute.TOKEN_MULTIPLICITY) == Multiplicity.MULTIPLE}
+        self._timeout = timeout
+        self._on_expired = on_expired
+        self._lock = threading.Lock()
+        # more entries of the empty key wait in the order of their arrival
+        self._key_to_entries: Dict[Tuple[str, ...], List[JoinEntry]] = {}
+        self._sweeper = None
+
+    def add(self, pin_name: str, seq_stack: SeqStack, item: Any) -> Union[JoinEntry, None]:
+        """Add the item of a token, returns the entry (removed from the table) when its inputs are complete."""
+        key = self._get_key(pin_name, seq_stack)
+
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep, name='join sweeper')
+                self._sweeper.daemon = True
+                self._sweeper.start()
+
+            entries = self._key_to_entries.setdefault(key, [])
+            entry = self._get_entry(entries, pin_name, seq_stack)
+
+            if entry is None:
+                entry = JoinEntry(key)
+                entries.append(entry)
+
+            entry.pin_name_to_items[pin_name].append((item, seq_stack))
+
+            if not self._is_complete(entry):
+                return None
+
+            entries.remove(entry)
+
+            if not entries:
+                del self._key_to_entries[key]
+
+            return entry
+
+    def restore(self, entry: JoinEntry, rejected_item: Any) -> None:
+        """Put back the entry which could not be processed, without the item of the rejected token."""
+        with self._lock:
+            for pin_name, items in entry.pin_name_to_items.items():
+                entry.pin_name_to_items[pin_name] = [(item, stack) for item, stack in items if item is not rejected_item]
+
+            entries = self._key_to_entries.setdefault(entry.key, [])
+
+            if entry.key and entries:
+                # tokens of the same sequences arrived meanwhile
+                for pin_name, items in entry.pin_name_to_items.items():
+                    entries[0].pin_name_to_items[pin_name].extend(items)
+            else:
+                # the oldest one
+                entries.insert(0, entry)
+
+    def pop_expired(self) -> List[JoinEntry]:
+        deadline = time.monotonic() - self._timeout
+
+        with self._lock:
+            expired = []
+
+            for key, entries in list(self._key_to_entries.items()):
+                expired.extend(entry for entry in entries if entry.created_at < deadline)
+                entries[:] = [entry for entry in entries if entry.created_at >= deadline]
+
+                if not entries:
+                    del self._key_to_entries[key]
+
+            return expired
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._key_to_entries.values())
+
+    def _sweep(self) -> None:
+        # the entries expire even when no more tokens arrive
+        while True:
+            time.sleep(min(self._timeout, 1.0))
+
+            for entry in self.pop_expired():
+                try:
+                    self._on_expired(entry)
+                except BaseException as exception:
+                    logger.error('handling an expired join failed: %s', exception)
+
+    def _is_complete(self, entry: JoinEntry) -> bool:
+        for pin_name in self._input_pin_names:
+            items = entry.pin_name_to_items.get(pin_name)
+
+            if not items:
+                return False
+
+            if pin_name in self._multiple_pin_names and not _is_sequence_complete([stack for _, stack in items]):
+                return False
+
+        return True
+
+    def _get_entry(self, entries: List[JoinEntry], pin_name: str, seq_stack: SeqStack) -> Union[JoinEntry, None]:
+        for entry in entries:
+            items = entry.pin_name_to_items.get(pin_name)
+
+            if not items:
+                return entry
+
+            if entry.key:
+                if pin_name not in self._multiple_pin_names:
+                    raise ValueError(f'pin {pin_name} takes a single token, it already got one with the seq_uids '
+                                     f'{entry.key}')
+
+                return entry
+
+            # the other tokens of the same innermost sequence
+            seq_uid = _get_innermost_seq_uid(seq_stack)
+
+            if pin_name in self._multiple_pin_names and seq_uid is not None \
+                    and _get_innermost_seq_uid(items[0][1]) == seq_uid:
+                return entry
+
+        return None
+
+    def _get_key(self, pin_name: str, seq_stack: SeqStack) -> Tuple[str, ...]:
+        seq_uids = tuple(seq_token.get_seq_uid() for seq_token in seq_stack or [])
+
+        if pin_name in self._multiple_pin_names and seq_stack:
+            return seq_uids[:-1]
+
+        return seq_uids
@@ -0,0 +1,80 @@
+import threading
+import unittest
+
+from balticlsc.scheme.join import JoinTable
+from balticlsc.scheme.pin import Pin, PinAttribute, PinType
+from balticlsc.scheme.token import XSeqToken
+
+
+def _pin(name: str, token_multiplicity: str) -> Pin:
+    return Pin({PinAttribute.NAME: name, PinAttribute.TYPE: PinType.INPUT,
+                PinAttribute.TOKEN_MULTIPLICITY: token_multiplicity})
+
+
+class TestJoinTable(unittest.TestCase):
+    def setUp(self):
+        self.table = JoinTable({'Images': _pin('Images', 'multiple'), 'Model': _pin('Model', 'single')}, 60.0,
+                               lambda entry: None)
+        self.job = XSeqToken(seq_uid='job', no=0, is_final=True)
+
+    def test_joins_sequence_with_single_token(self):
+        self.assertIsNone(self.table.add('Images', [self.job, XSeqToken('images', 1, False)], 'image 1'))
+        self.assertIsNone(self.table.add('Model', [self.job], 'model'))
+        self.assertIsNone(self.table.add('Images', [self.job, XSeqToken('images', 0, False)], 'image 0'))
+        entry = self.table.add('Images', [self.job, XSeqToken('images', 2, True)], 'image 2')
+
+        self.assertEqual(entry.get_inputs(), {'Images': ['image 1', 'image 0', 'image 2'], 'Model': ['model']})
+        self.assertEqual(len(self.table), 0)
+
+    def test_restore_without_rejected_token(self):
+        self.table.add('Images', [self.job, XSeqToken('images', 0, True)], 'image 0')
+        entry = self.table.add('Model', [self.job], 'model')
+        self.table.restore(entry, 'model')
+
+        self.assertEqual(len(self.table), 1)
+        self.assertEqual(self.table.add('Model', [self.job], 'model').get_inputs(),
+                         {'Images': ['image 0'], 'Model': ['model']})
+
+    def test_rejects_second_token_of_single_pin(self):
+        self.table.add('Model', [self.job], 'model')
+
+        with self.assertRaises(ValueError):
+            self.table.add('Model', [self.job], 'other model')
+
+        entry = self.table.add('Images', [self.job, XSeqToken('images', 0, True)], 'image 0')
+        self.assertEqual(entry.get_inputs(), {'Images': ['image 0'], 'Model': ['model']})
+
+    def test_joins_tokens_without_sequence_in_order(self):
+        table = JoinTable({'Image': _pin('Image', 'single'), 'Model': _pin('Model', 'single')}, 60.0,
+                          lambda entry: None)
+        self.assertIsNone(table.add('Image', None, 'image 1'))
+        self.assertIsNone(table.add('Image', None, 'image 2'))
+        self.assertEqual(len(table), 2)
+
+        self.assertEqual(table.add('Model', None, 'model 1').get_inputs(), {'Image': ['image 1'], 'Model': ['model 1']})
+        self.assertEqual(table.add('Model', None, 'model 2').get_inputs(), {'Image': ['image 2'], 'Model': ['model 2']})
+        self.assertEqual(len(table), 0)
+
+    def test_joins_sequences_without_outer_sequence_in_order(self):
+        self.table.add('Model', None, 'model 1')
+        self.table.add('Model', None, 'model 2')
+        self.assertIsNone(self.table.add('Images', [XSeqToken('first', 0, False)], 'first 0'))
+        entry = self.table.add('Images', [XSeqToken('second', 0, True)], 'second 0')
+        self.assertEqual(entry.get_inputs(), {'Images': ['second 0'], 'Model': ['model 2']})
+        entry = self.table.add('Images', [XSeqToken('first', 1, True)], 'first 1')
+
+        self.assertEqual(entry.get_inputs(), {'Images': ['first 0', 'first 1'], 'Model': ['model 1']})
+        self.assertEqual(len(self.table), 0)
+
+    def test_expires_without_new_tokens(self):
+        expired = threading.Event()
+        table = JoinTable({'Images': _pin('Images', 'multiple'), 'Model': _pin('Model', 'single')}, 0.05,
+                          lambda entry: expired.set() if entry.get_items() == ['model'] else None)
+        table.add('Model', [self.job], 'model')
+
+        self.assertTrue(expired.wait(5))
+        self.assertEqual(len(table), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import sqlite3
+import threading
+import time
+from typing import List, Iterable, Tuple
+
+
+class TokenJournal:
+    """Accepted input tokens stored in a SQLite database (WAL mode).
+
+    A token is added before it is handed to the executor and removed when
+    its final ack is sent, so the tokens left in the journal after a
+    restart are the unfinished ones. When the journal gets empty, the WAL
+    file is truncated.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # a committed token can be lost only on a power failure, not when the process dies
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS tokens ('
+                                 'msg_uid TEXT PRIMARY KEY, token TEXT NOT NULL, accepted_at REAL NOT NULL)')
+
+    def add(self, msg_uid: str, token: str) -> None:
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO tokens (msg_uid, token, accepted_at) VALUES (?, ?, ?)',
+                                     (msg_uid, token, time.time()))
+
+    def remove(self, msg_uids: Iterable[str]) -> None:
+        with self._lock:
+            deleted = self._connection.executemany('DELETE FROM tokens WHERE msg_uid = ?',
+                                                   [(msg_uid,) for msg_uid in msg_uids]).rowcount
+
+            if deleted and self._connection.execute('SELECT 1 FROM tokens LIMIT 1').fetchone() is None:
+                self._connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def get_unfinished(self) -> List[Tuple[str, str]]:
+        """The msg_uid and the token of the unfinished tokens, in the order they were accepted."""
+        with self._lock:
+            return self._connection.execute('SELECT msg_uid, token FROM tokens ORDER BY accepted_at').fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+
+from balticlsc.scheme.journal import TokenJournal
+
+
+class TestTokenJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'tokens.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unfinished_tokens_survive_reopening(self):
+        journal = TokenJournal(self.path)
+        journal.add('1', '{"MsgUid": "1"}')
+        journal.add('2', '{"MsgUid": "2"}')
+        journal.add('3', '{"MsgUid": "3"}')
+        journal.remove(['2'])
+        journal.close()
+
+        journal = TokenJournal(self.path)
+        self.assertEqual(journal.get_unfinished(), [('1', '{"MsgUid": "1"}'), ('3', '{"MsgUid": "3"}')])
+        journal.remove(['1', '3'])
+        self.assertEqual(journal.get_unfinished(), [])
+        journal.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,128 @@
+import atexit
+import copy
+import json
 import logging
 import os
+import queue
+import re
+from logging.handlers import QueueHandler, QueueListener
+from typing import Union
 
 SYS_MODULE_NAME = os.getenv('SYS_MODULE_NAME', 'BalticLSC module')
-logging.basicConfig(level=logging.DEBUG, format='## '+SYS_MODULE_NAME+' ## %(asctime)s.%(msecs)03d ## %(levelname)s|%(name)s: %(message)s', datefmt='%d.%m.%Y %H:%M:%S')
+SYS_LOG_LEVEL = os.getenv('SYS_LOG_LEVEL', 'INFO').upper()
+# text or json
+SYS_LOG_FORMAT = os.getenv('SYS_LOG_FORMAT', 'text').lower()
+
+_TEXT_FORMAT = '## ' + SYS_MODULE_NAME + ' ## %(asctime)s.%(msecs)03d ## %(levelname)s|%(name)s: %(message)s'
+_DATE_FORMAT = '%d.%m.%Y %H:%M:%S'
+# passwords in dicts and json, keyword arguments and urls
+_SECRETS = [
+    (re.compile(r'''(['"]password['"]\s*:\s*['"])[^'"]*''', re.IGNORECASE), r'\1***'),
+    (re.compile(r'''(password=)['"]?[^'",)\s]*['"]?''', re.IGNORECASE), r'\1***'),
+    (re.compile(r'(\w+://[^:/@\s]+:)[^@\s]+@'), r'\1***@'),
+]
+
+
+def redact(message: str) -> str:
+    for pattern, replacement in _SECRETS:
+        message = pattern.sub(replacement, message)
+
+    return message
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, _DATE_FORMAT) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'module': SYS_MODULE_NAME,
+            'message': redact(record.getMessage()),
+        }
+
+        if getattr(record, 'msg_uid', None) is not None:
+            entry['msg_uid'] = record.msg_uid
+
+        if record.exc_info:
+            entry['exception'] = redact(self.formatException(record.exc_info))
+        elif record.exc_text:
+            # formatted by the logging thread
+            entry['exception'] = redact(record.exc_text)
+
+        return json.dumps(entry)
+
+
+class _MsgUidFilter(logging.Filter):
+    """Adds the msg_uid of the token processed by the logging thread to the record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # imported here, tracing logs with this module
+        from balticlsc.scheme.tracing import current_msg_uid
+        record.msg_uid = current_msg_uid()
+        return True
+
+
+class _LazyQueueHandler(QueueHandler):
+    # the message and the exception are formatted by the logging thread, the arguments may change afterwards,
+    # the rest (time, level, json, redacting) by the listener thread
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+_exception_formatter = logging.Formatter()
+
+
+def _create_stream_handler() -> logging.Handler:
+    handler = logging.StreamHandler()
+    handler.setFormatter(_JsonFormatter() if SYS_LOG_FORMAT == 'json' else _TextFormatter(_TEXT_FORMAT, _DATE_FORMAT))
+    return handler
+
+
+_handler = _LazyQueueHandler(queue.SimpleQueue())
+_handler.addFilter(_MsgUidFilter())
+_listener: Union[QueueListener, None] = None
+
+
+def _start_listener() -> None:
+    global _listener
+    # a forked process gets a new queue, the lock of the old one may be held by a thread which is not copied
+    _handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_handler.queue, _create_stream_handler(), respect_handler_level=False)
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def _init_logging() -> None:
+    root = logging.getLogger()
+    root.setLevel(SYS_LOG_LEVEL)
+
+    # the logging configured by the module is not replaced
+    if not root.handlers:
+        root.addHandler(_handler)
+        _start_listener()
+        atexit.register(_stop_listener)
+
+        if hasattr(os, 'register_at_fork'):
+            # the listener thread does not exist in the forked worker processes
+            os.register_at_fork(after_in_child=_start_listener)
+
+
+_init_logging()
 logger = logging.getLogger('api')
@@ -0,0 +1,181 @@
+import abc
+import threading
+from typing import Dict, Tuple, List, Sequence, Callable
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple[str, ...], extra: str = '') -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+
+    if extra:
+        labels.append(extra)
+
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(metaclass=abc.ABCMeta):
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _get_label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'metric {self.name} expects labels {self.label_names}, got {tuple(labels)}')
+
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}'] + self._samples()
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """Sample lines of the metric in the text exposition format."""
+        pass
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._get_label_values(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._get_label_values(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+
+        return [f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}' for key, value in values]
+
+
+class Gauge(_Metric):
+    """Gauge read from the callback when the metrics are rendered."""
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._callback = callback
+
+    def _samples(self) -> List[str]:
+        return [f'{self.name} {_format_value(self._callback())}']
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self._buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # label values -> (counts per bucket, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._get_label_values(labels)
+
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self._buckets), 0.0))
+
+            for index, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+
+            self._values[key] = (counts, total + value)
+
+    def get_count(self, **labels: str) -> int:
+        counts, _ = self._values.get(self._get_label_values(labels), ([0], 0.0))
+        return sum(counts)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        samples = []
+
+        for key, counts, total in values:
+            cumulative = 0
+
+            for bound, count in zip(self._buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                samples.append(f'{self.name}_bucket{labels} {cumulative}')
+
+            labels = _format_labels(self.label_names, key)
+            samples.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            samples.append(f'{self.name}_count{labels} {cumulative}')
+
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'metric {metric.name} is already registered')
+
+            self._metrics[metric.name] = metric
+
+        return metric
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, label_names))
+
+
+def histogram(name: str, documentation: str, label_names: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, label_names, buckets))
+
+
+def gauge(name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+    # a gauge of a previous api instance is replaced
+    REGISTRY.unregister(name)
+    return REGISTRY.register(Gauge(name, documentation, callback))
@@ -0,0 +1,35 @@
+import unittest
+
+from balticlsc.scheme.metrics import Registry, Counter, Histogram, Gauge
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        registry = Registry()
+        tokens = registry.register(Counter('tokens_total', 'Tokens.', ['pin']))
+        duration = registry.register(Histogram('duration_seconds', 'Duration.', buckets=(0.1, 1.0)))
+        registry.register(Gauge('queue_depth', 'Queue depth.', lambda: 3))
+        tokens.inc(pin='Input')
+        tokens.inc(2, pin='Input')
+        duration.observe(0.05)
+        duration.observe(0.5)
+        duration.observe(5)
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE tokens_total counter', lines)
+        self.assertIn('tokens_total{pin="Input"} 3', lines)
+        self.assertIn('duration_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('duration_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('duration_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn('duration_seconds_sum 5.55', lines)
+        self.assertIn('duration_seconds_count 3', lines)
+        self.assertIn('queue_depth 3', lines)
+
+    def test_wrong_labels(self):
+        tokens = Counter('tokens_total', 'Tokens.', ['pin'])
+
+        with self.assertRaises(ValueError):
+            tokens.inc(other='Input')
+
+
+if __name__ == '__main__':
+    unittest.main()
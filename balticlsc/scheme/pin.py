@@ -1,9 +1,11 @@
 import json
+import os
+import pickle
 from collections import defaultdict
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Union
 
 from balticlsc.scheme.logger import logger
-from balticlsc.scheme.utils import JsonRepr, camel_to_snake
+from balticlsc.scheme.utils import JsonRepr, camel_to_snake, register_keys
 
 
 class PinType:
@@ -13,6 +15,7 @@ class PinType:
 
 class AccessType:
     FTP = 'ftp'
+    LOCAL = 'local'
 
 
 class PinAttribute:
@@ -30,6 +33,10 @@ class ValuesAttribute:
     RESOURCE_PATH = 'resource_path'
 
 
+register_keys(value for name, value in vars(PinAttribute).items() if not name.startswith('__'))
+register_keys([ValuesAttribute.RESOURCE_PATH])
+
+
 class Pin(JsonRepr):
     __required_attributes = [
         PinAttribute.NAME,
@@ -43,6 +50,7 @@ class Pin(JsonRepr):
         PinAttribute.DATA_MULTIPLICITY,
         PinAttribute.VALUES,
     ]
+    __slots__ = tuple('_' + attribute_name for attribute_name in __required_attributes + __optional_attributes)
 
     def __init__(self, attributes: Dict[str, Any]):
         for attribute_name in Pin.__required_attributes:
@@ -62,13 +70,13 @@ class Pin(JsonRepr):
             elif attribute_name in self.__optional_attributes:
                 self.__setattr__('_' + attribute_name, attribute_value)
             else:
-                logger.warning(f'unknown attribute "{attribute_name}" in the config file, omitting')
+                logger.warning('unknown attribute "%s" in the config file, omitting', attribute_name)
 
     def getattr(self, name: str) -> Any:
         try:
             return self.__getattribute__('_' + name)
         except AttributeError:
-            logger.info(f'pin {self.__repr__()} do not have attribute "{name}"')
+            logger.debug('pin "%s" do not have attribute "%s"', getattr(self, '_' + PinAttribute.NAME, None), name)
             return None
 
     # set value of an optional attribute
@@ -92,6 +100,22 @@ class Pins:
         return {pin.getattr(PinAttribute.NAME): pin for pin in self._type_to_pins[pin_type]}
 
 
+def _override_pin(pin: Pin, overrides: Dict[str, Any]) -> Pin:
+    # shallow copy, the attributes which are not overridden are shared with the configured pin
+    overridden_pin = Pin.__new__(Pin)
+
+    for slot in Pin.__slots__:
+        try:
+            setattr(overridden_pin, slot, getattr(pin, slot))
+        except AttributeError:
+            pass
+
+    for attribute_name, attribute_value in overrides.items():
+        overridden_pin.set_opt_attr(attribute_name, attribute_value)
+
+    return overridden_pin
+
+
 def _load_pin(pin_json: dict) -> Pin:
     try:
         pin_meta_data = Pin({camel_to_snake(key): value for key, value in pin_json.items()})
@@ -102,14 +126,65 @@ def _load_pin(pin_json: dict) -> Pin:
     return pin_meta_data
 
 
-def _load_pins(config_file_path: str) -> Pins:
+# version of the cached pins format, changed with the Pin attributes
+_PINS_CACHE_VERSION = 4
+
+# path, modification time and size of the config file
+_ConfigKey = Tuple[str, int, int]
+
+
+def _load_pins(config_file_path: str, cache_path: str = '') -> Pins:
+    """Pins of the config file, with a cache path the validated pins are reused while the config is the same."""
+    if cache_path:
+        # the config is not read while its modification time and size do not change
+        stat = os.stat(config_file_path)
+        config_key = (config_file_path, stat.st_mtime_ns, stat.st_size)
+        pins = _read_pins_cache(cache_path, config_key)
+
+        if pins is not None:
+            return pins
+
     with open(config_file_path) as json_file:
         try:
-            return _load_pins_from_json(json.load(json_file))
+            pins = _load_pins_from_json(json.load(json_file))
         except BaseException as exception:
             error_msg = 'error while loading config from ' + config_file_path + ': ' + str(exception)
             raise ValueError(error_msg) from exception
 
+    if cache_path:
+        _write_pins_cache(cache_path, config_key, pins)
+
+    return pins
+
+
+def _read_pins_cache(cache_path: str, config_key: _ConfigKey) -> Union[Pins, None]:
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            version, cached_config_key, pins = pickle.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except BaseException as exception:
+        logger.warning('ignoring the pins cache %s: %s', cache_path, exception)
+        return None
+
+    if version != _PINS_CACHE_VERSION or cached_config_key != config_key:
+        return None
+
+    return pins
+
+
+def _write_pins_cache(cache_path: str, config_key: _ConfigKey, pins: Pins) -> None:
+    temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+
+    try:
+        with open(temporary_path, 'wb') as cache_file:
+            pickle.dump((_PINS_CACHE_VERSION, config_key, pins), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # replaced at once, a module starting at the same time reads the old or the new cache
+        os.replace(temporary_path, cache_path)
+    except OSError as exception:
+        logger.warning('writing the pins cache %s failed: %s', cache_path, exception)
+
 
 def _load_pins_from_json(config: List[dict]) -> Pins:
     pins = Pins()
@@ -1,7 +1,13 @@
+import json as json_module
+import os
+import pickle
+import tempfile
 import unittest
 from typing import List
+from unittest import mock
 
-from balticlsc.scheme.pin import _load_pins_from_json, PinType
+from balticlsc.scheme import pin as pin_module
+from balticlsc.scheme.pin import _load_pins, _load_pins_from_json, _override_pin, PinType, PinAttribute
 
 
 class TestLoadPinsFromJson(unittest.TestCase):
@@ -62,5 +68,70 @@ class TestLoadPinsFromJson(unittest.TestCase):
         self.assertEqual(len(pins.get_name_to_pin(PinType.OUTPUT)), 1)
 
 
+class TestLoadPins(unittest.TestCase):
+    def test_cached_pins_are_reused_while_config_is_the_same(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, 'pins.json')
+            cache_path = os.path.join(directory, 'pins.cache')
+
+            def write_config(pin_name: str):
+                with open(config_path, 'w') as config_file:
+                    json_module.dump([{'PinName': pin_name, 'PinType': 'input', 'AccessType': 'ftp'}], config_file)
+
+            write_config('Input')
+            self.assertIn('Input', _load_pins(config_path, cache_path).get_name_to_pin(PinType.INPUT))
+            self.assertTrue(os.path.exists(cache_path))
+
+            # the config is not parsed again
+            with mock.patch.object(pin_module, 'json') as json_mock:
+                cached_pin = _load_pins(config_path, cache_path).get_name_to_pin(PinType.INPUT)['Input']
+
+            json_mock.load.assert_not_called()
+            self.assertEqual(cached_pin.getattr(PinAttribute.ACCESS_TYPE), 'ftp')
+
+            write_config('Changed')
+            self.assertIn('Changed', _load_pins(config_path, cache_path).get_name_to_pin(PinType.INPUT))
+
+
+class TestOverridePin(unittest.TestCase):
+    def test_override_does_not_change_configured_pin(self):
+        json: List[dict] = [
+            {
+                'PinName': 'Input',
+                'PinType': 'input',
+                'AccessType': 'ftp',
+                'AccessCredential': {'host': 'input_host'},
+            },
+        ]
+        pin = _load_pins_from_json(json).get_name_to_pin(PinType.INPUT)['Input']
+        overridden_pin = _override_pin(pin, {PinAttribute.ACCESS_PATH: '/data', PinAttribute.ACCESS_TYPE: 'local'})
+
+        self.assertEqual(overridden_pin.getattr(PinAttribute.ACCESS_PATH), '/data')
+        self.assertEqual(overridden_pin.getattr(PinAttribute.ACCESS_TYPE), 'local')
+        self.assertIs(overridden_pin.getattr(PinAttribute.ACCESS_CREDENTIAL), pin.getattr(PinAttribute.ACCESS_CREDENTIAL))
+        self.assertIsNone(pin.getattr(PinAttribute.ACCESS_PATH))
+        self.assertEqual(pin.getattr(PinAttribute.ACCESS_TYPE), 'ftp')
+        self.assertFalse(hasattr(overridden_pin, '__dict__'))
+        self.assertEqual(overridden_pin.to_dict()['AccessPath'], '/data')
+
+    def test_configured_dict_values_keep_keys(self):
+        json: List[dict] = [
+            {
+                'PinName': 'Input',
+                'PinType': 'input',
+                'AccessType': 'ftp',
+                'AccessCredential': {'Host': 'input_host', 'User': 'user'},
+            },
+        ]
+        pin = _load_pins_from_json(json).get_name_to_pin(PinType.INPUT)['Input']
+        credential = pin.getattr(PinAttribute.ACCESS_CREDENTIAL)
+
+        self.assertEqual(credential, {'Host': 'input_host', 'User': 'user'})
+        credential['Host'] = 'other_host'
+        self.assertEqual(pin.getattr(PinAttribute.ACCESS_CREDENTIAL)['Host'], 'other_host')
+        self.assertEqual(pickle.loads(pickle.dumps(pin)).getattr(PinAttribute.ACCESS_CREDENTIAL), credential)
+        self.assertEqual(json_module.loads(pin.to_json())['AccessCredential'], credential)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,12 @@
 import abc
-from typing import Dict
+from typing import Dict, List, Union, Tuple, TYPE_CHECKING
 
+from balticlsc.scheme.logger import logger
 from balticlsc.scheme.pin import Pin
+from balticlsc.scheme.tracing import trace_token
+
+if TYPE_CHECKING:
+    from balticlsc.scheme.job_rest_client import JobRestClient
 
 
 class ProcessingInterface(metaclass=abc.ABCMeta):
@@ -13,9 +18,101 @@ class ProcessingInterface(metaclass=abc.ABCMeta):
 
     def __init__(self, output_pin_name_to_value: Dict[str, Pin]):
         self._output_pin_name_to_value = output_pin_name_to_value
+        self._rest_client = None
+
+    def set_rest_client(self, rest_client: 'JobRestClient') -> None:
+        """Set by the worker after building the processing, sends the final failed acks of the tokens which raised."""
+        self._rest_client = rest_client
+
+    def setup(self) -> None:
+        """Load the models and resources used by the processing, e.g. a detector.
+
+        Every worker thread or process builds one processing instance and sets it up once,
+        before its first token. The module is ready (`/ready`) when all the workers are set up.
+        """
+        pass
+
+    def teardown(self) -> None:
+        """Release what `setup` acquired, called when the worker is shut down."""
+        pass
+
+    @classmethod
+    def get_input_checksums(cls, input_pin: Pin) -> Union[List[str], None]:
+        """Checksums of the input data, enabling the result cache (SYS_RESULT_CACHE_SIZE) for the pin.
+
+        Called when the token is accepted, so it should be cheap, e.g. sizes and modification
+        times of the input files. A token with the same input pin, access path and checksums
+        as an already processed one gets its outputs without processing. None disables caching.
+        """
+        return None
 
     def run(self, msg_uid: str, input_pin: Pin):
-        self.process(msg_uid, input_pin, self._output_pin_name_to_value)
+        # phases marked with balticlsc.scheme.tracing.span inside the process are traced per token
+        with trace_token(msg_uid):
+            try:
+                self.process(msg_uid, input_pin, self._output_pin_name_to_value)
+            except BaseException as exception:
+                self._fail([msg_uid], exception)
+                raise
+
+    def run_batch(self, tokens: List[Tuple[str, Pin]]):
+        if type(self).process_batch is ProcessingInterface.process_batch:
+            for msg_uid, input_pin in tokens:
+                try:
+                    self.run(msg_uid, input_pin)
+                except Exception:
+                    # already acked as failed, the other tokens of the batch are still processed
+                    pass
+        else:
+            # the batch is traced as its first token
+            with trace_token(tokens[0][0]):
+                try:
+                    self.process_batch(tokens, self._output_pin_name_to_value)
+                except BaseException as exception:
+                    self._fail([msg_uid for msg_uid, _ in tokens], exception)
+                    raise
+
+    def process_batch(self, tokens: List[Tuple[str, Pin]], output_pin_name_to_value: Dict[str, Pin]) -> None:
+        """Process the (msg_uid, input pin) of several tokens of one sequence at once, e.g. vectorized.
+
+        Used when SYS_BATCH_SIZE > 1, the outputs and final acks are still sent per token.
+        By default every token is processed on its own.
+        """
+        for msg_uid, input_pin in tokens:
+            self.process(msg_uid, input_pin, output_pin_name_to_value)
+
+    def run_joined(self, inputs: Dict[str, List[Tuple[str, Pin]]]):
+        # the joined tokens are traced as the first of them
+        with trace_token(next(iter(inputs.values()))[0][0]):
+            try:
+                self.process_joined(inputs, self._output_pin_name_to_value)
+            except BaseException as exception:
+                self._fail([msg_uid for tokens in inputs.values() for msg_uid, _ in tokens], exception)
+                raise
+
+    def _fail(self, msg_uids: List[str], exception: BaseException) -> None:
+        error_msg = f'processing data error: {str(exception)}'
+        logger.error(error_msg)
+
+        if self._rest_client is not None:
+            self._rest_client.send_ack_token(
+                msg_uids=msg_uids,
+                is_final=True,
+                is_failed=True,
+                note=error_msg,
+            )
+
+    def process_joined(self, inputs: Dict[str, List[Tuple[str, Pin]]],
+                       output_pin_name_to_value: Dict[str, Pin]) -> None:
+        """Process the complete inputs of all the input pins at once, (msg_uid, input pin) of the tokens per pin.
+
+        When a processing overrides it, the tokens are buffered until every input pin got its tokens
+        of one sequence, according to the TokenMultiplicity of the pins. The outputs and final acks
+        are still sent per token. By default every token is processed on its own.
+        """
+        for tokens in inputs.values():
+            for msg_uid, input_pin in tokens:
+                self.process(msg_uid, input_pin, output_pin_name_to_value)
 
     @abc.abstractmethod
     def process(self, msg_uid: str, input_pin: Pin, output_pin_name_to_value: Dict[str, Pin]) -> None:
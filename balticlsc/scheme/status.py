@@ -1,6 +1,8 @@
+import threading
 from enum import Enum
+from typing import Dict, Any, Union
 
-from balticlsc.scheme.utils import JsonRepr
+from balticlsc.scheme.utils import JsonRepr, register_keys
 
 
 class ComputationStatus(Enum):
@@ -29,3 +31,97 @@ class JobStatus(JsonRepr):
 
         if job_progress != 0.0:
             self._job_progress = job_progress
+
+
+class JobTracker:
+    """Status of the jobs (tokens) of the module tracked per msg_uid.
+
+    A job is Working from `start` until it gets a final status, e.g. when
+    its final ack is sent. The aggregate status (Working while any job is,
+    otherwise the status of the last finished job), the mean progress of
+    the working jobs and the number of jobs per status are published as
+    an immutable snapshot on every change, so reading it takes no lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._msg_uid_to_progress: Dict[str, float] = {}
+        self._progress_sum = 0.0
+        self._finished_counts: Dict[ComputationStatus, int] = {}
+        self._last_status = ComputationStatus.Idle
+        self._snapshot = self._build_snapshot()
+
+    # returns False when the job is already working
+    def start(self, msg_uid: str) -> bool:
+        with self._lock:
+            if msg_uid in self._msg_uid_to_progress:
+                return False
+
+            self._msg_uid_to_progress[msg_uid] = 0.0
+            self._snapshot = self._build_snapshot()
+            return True
+
+    # stop tracking the job without counting it
+    def forget(self, msg_uid: str) -> None:
+        with self._lock:
+            if msg_uid in self._msg_uid_to_progress:
+                self._progress_sum -= self._msg_uid_to_progress.pop(msg_uid)
+                self._snapshot = self._build_snapshot()
+
+    def update(self, msg_uid: Union[str, None], status: ComputationStatus, job_progress: float = 0.0) -> None:
+        """Update the job, without msg_uid all the working jobs are updated."""
+        with self._lock:
+            msg_uids = list(self._msg_uid_to_progress) if msg_uid is None else [msg_uid]
+
+            for job_msg_uid in msg_uids:
+                if status in _FINAL_STATUSES:
+                    self._finish(job_msg_uid, status)
+                elif job_progress != 0.0 and job_msg_uid in self._msg_uid_to_progress:
+                    self._progress_sum += job_progress - self._msg_uid_to_progress[job_msg_uid]
+                    self._msg_uid_to_progress[job_msg_uid] = job_progress
+
+            self._snapshot = self._build_snapshot()
+
+    def finish(self, msg_uid: str, failed: bool = False) -> None:
+        self.update(msg_uid, ComputationStatus.Failed if failed else ComputationStatus.Completed)
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        return self._snapshot
+
+    def get_job_status(self) -> JobStatus:
+        snapshot = self._snapshot
+        return JobStatus(ComputationStatus[snapshot['Status']], snapshot['JobProgress'])
+
+    def _finish(self, msg_uid: str, status: ComputationStatus) -> None:
+        # unknown (e.g. 'empty' of an invalid token) or already finished, e.g. a second final ack
+        if msg_uid not in self._msg_uid_to_progress:
+            return
+
+        self._progress_sum -= self._msg_uid_to_progress.pop(msg_uid)
+
+        if not self._msg_uid_to_progress:
+            # no rounding errors left behind
+            self._progress_sum = 0.0
+
+        self._finished_counts[status] = self._finished_counts.get(status, 0) + 1
+        self._last_status = status
+
+    def _build_snapshot(self) -> Dict[str, Any]:
+        working = len(self._msg_uid_to_progress)
+        counts = {status.name: count for status, count in self._finished_counts.items()}
+
+        if working:
+            counts[ComputationStatus.Working.name] = working
+
+        return {
+            'Status': (ComputationStatus.Working if working else self._last_status).name,
+            'JobProgress': self._progress_sum / working if working else 0.0,
+            'WorkingJobs': working,
+            'Counts': counts,
+        }
+
+
+_FINAL_STATUSES = frozenset([ComputationStatus.Completed, ComputationStatus.Failed, ComputationStatus.Rejected,
+                             ComputationStatus.Aborted, ComputationStatus.Neglected])
+
+register_keys(['status', 'job_progress'])
@@ -0,0 +1,55 @@
+import unittest
+
+from balticlsc.scheme.status import JobTracker, ComputationStatus
+
+
+class TestJobTracker(unittest.TestCase):
+    def test_aggregates_working_jobs(self):
+        tracker = JobTracker()
+        tracker.start('1')
+        tracker.start('2')
+        tracker.update('1', ComputationStatus.Working, 0.5)
+        tracker.update('2', ComputationStatus.Working, 0.25)
+
+        snapshot = tracker.get_snapshot()
+        self.assertEqual(snapshot['Status'], 'Working')
+        self.assertAlmostEqual(snapshot['JobProgress'], 0.375)
+        self.assertEqual(snapshot['Counts'], {'Working': 2})
+
+    def test_final_statuses(self):
+        tracker = JobTracker()
+        self.assertEqual(tracker.get_snapshot()['Status'], 'Idle')
+        tracker.start('1')
+        tracker.start('2')
+        tracker.finish('1')
+        self.assertEqual(tracker.get_snapshot()['Counts'], {'Completed': 1, 'Working': 1})
+        tracker.finish('2', failed=True)
+
+        snapshot = tracker.get_snapshot()
+        self.assertEqual(snapshot['Status'], 'Failed')
+        self.assertEqual(snapshot['JobProgress'], 0.0)
+        self.assertEqual(snapshot['Counts'], {'Completed': 1, 'Failed': 1})
+        self.assertEqual(tracker.get_job_status().get_computation_status(), ComputationStatus.Failed)
+
+    def test_update_without_msg_uid_applies_to_all_jobs(self):
+        tracker = JobTracker()
+        tracker.start('1')
+        tracker.start('2')
+        tracker.update(None, ComputationStatus.Completed)
+        self.assertEqual(tracker.get_snapshot()['Counts'], {'Completed': 2})
+
+    def test_only_started_jobs_are_finished(self):
+        tracker = JobTracker()
+        tracker.start('1')
+        tracker.finish('1')
+        # a second final ack of the same token and an ack of an unknown token
+        tracker.finish('1', failed=True)
+        tracker.finish('empty', failed=True)
+
+        snapshot = tracker.get_snapshot()
+        self.assertEqual(snapshot['Status'], 'Completed')
+        self.assertEqual(snapshot['Counts'], {'Completed': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,24 @@
-from typing import List
+from typing import List, Dict, Any, Tuple, Union
 
-from balticlsc.scheme.utils import JsonRepr
+from balticlsc.scheme.utils import JsonRepr, register_keys, camel_to_snake, snake_to_camel, loads, _get_slot_names
 
 
 class Token(JsonRepr):
-    pass
+    __slots__ = ()
+    # (attribute name, json key) of the serialized fields, computed once per class
+    _schema: Tuple[Tuple[str, str], ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._schema = tuple((name, snake_to_camel(name)) for name in _get_slot_names(cls))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: getattr(self, name) for name, key in self._schema}
 
 
 class InputToken(Token):
+    __slots__ = ('_msg_uid', '_pin_name', '_values', '_access_type', '_seq_stack')
+
     def __init__(self, msg_uid: str, pin_name: str, values: str,
                  access_type: dict = None, token_seq_stack: List[dict] = None):
         self._msg_uid = msg_uid
@@ -21,21 +32,40 @@ class InputToken(Token):
             seq_stack = []
 
             for seq_token in token_seq_stack:
-                seq_stack.append(XSeqToken(**seq_token))
+                seq_stack.append(XSeqToken(**{camel_to_snake(key): value for key, value in seq_token.items()}))
 
             self._seq_stack = seq_stack
 
+    # parse the json posted by the batch manager, raises ValueError on malformed json and TypeError on wrong fields
+    @classmethod
+    def from_json(cls, data: Union[str, bytes]) -> 'InputToken':
+        token_dict = loads(data)
+
+        if not isinstance(token_dict, dict):
+            raise TypeError('input token has to be a json object')
+
+        return cls(**{camel_to_snake(key): value for key, value in token_dict.items()})
+
     def get_values(self) -> str:
         return self._values
 
+    # values with the snake cased keys
+    def get_values_dict(self) -> Dict[str, Any]:
+        return {camel_to_snake(key): value for key, value in loads(self._values).items()}
+
     def get_pin_name(self) -> str:
         return self._pin_name
 
     def get_msg_uid(self) -> str:
         return self._msg_uid
 
+    def get_seq_stack(self) -> Union[List['XSeqToken'], None]:
+        return self._seq_stack
+
 
 class OutputToken(Token):
+    __slots__ = ('_pin_name', '_sender_uid', '_values', '_base_msg_uid', '_is_final')
+
     def __init__(self, pin_name: str, sender_uid: str, values: str, base_msg_uid: str, is_final: bool):
         self._pin_name = pin_name
         self._sender_uid = sender_uid
@@ -45,16 +75,33 @@ class OutputToken(Token):
 
 
 class XSeqToken(Token):
+    __slots__ = ('_seq_uid', '_no', '_is_final')
+
     def __init__(self, seq_uid: str, no: int, is_final: bool):
         self._seq_uid = seq_uid
         self._no = no
         self._is_final = is_final
 
+    def get_seq_uid(self) -> str:
+        return self._seq_uid
+
+    def get_no(self) -> int:
+        return self._no
+
+    def is_final(self) -> bool:
+        return self._is_final
+
 
 class AckToken(Token):
+    __slots__ = ('_sender_uid', '_msg_uids', '_note', '_is_final', '_is_failed')
+
     def __init__(self, sender_uid: str, msg_uids: List[str], note: str, is_final: bool, is_failed: bool = False):
         self._sender_uid = sender_uid
         self._msg_uids = msg_uids
         self._note = note
         self._is_final = is_final
         self._is_failed = is_failed
+
+
+register_keys(['msg_uid', 'pin_name', 'values', 'access_type', 'token_seq_stack', 'seq_stack', 'seq_uid', 'no',
+               'is_final', 'is_failed', 'sender_uid', 'base_msg_uid', 'msg_uids', 'note'])
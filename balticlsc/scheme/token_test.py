@@ -1,6 +1,8 @@
 import unittest
 
-from balticlsc.scheme.token import InputToken
+import json
+
+from balticlsc.scheme.token import InputToken, AckToken
 from balticlsc.scheme.utils import camel_to_snake
 
 
@@ -29,6 +31,28 @@ class TestInputToken(unittest.TestCase):
         except BaseException as exception:
             print(exception)
 
+    def test_from_json(self):
+        input_token = InputToken.from_json(json.dumps({
+            'MsgUid': '3',
+            'PinName': 'Input',
+            'Values': '{\"ResourcePath\": \"/files/recogniser/in\"}',
+            'TokenSeqStack': [{'SeqUid': 's1', 'No': 0, 'IsFinal': False}]
+        }))
+        self.assertEqual(input_token.get_msg_uid(), '3')
+        self.assertEqual(input_token.get_values_dict(), {'resource_path': '/files/recogniser/in'})
+
+    def test_from_json_with_unknown_field(self):
+        with self.assertRaises(TypeError):
+            InputToken.from_json('{"MsgUid": "4", "PinName": "Input", "Values": "{}", "SthElse": ""}')
+
+
+class TestAckToken(unittest.TestCase):
+    def test_to_json(self):
+        ack_token = AckToken(sender_uid='module', msg_uids=['1', '2'], note='', is_final=True)
+        self.assertEqual(json.loads(ack_token.to_json()), {
+            'SenderUid': 'module', 'MsgUids': ['1', '2'], 'Note': '', 'IsFinal': True, 'IsFailed': False})
+        self.assertTrue(repr(ack_token).startswith('AckToken(SenderUid='))
+
 
 if __name__ == '__main__':
     unittest.main()
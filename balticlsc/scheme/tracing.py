@@ -0,0 +1,135 @@
+import cProfile
+import functools
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Union, Callable, Iterator, Dict, Any
+
+from balticlsc.scheme import metrics
+from balticlsc.scheme.logger import logger
+
+SYS_TRACING = os.getenv('SYS_TRACING', 'true').lower() == 'true'
+SYS_PROFILE_SAMPLE_RATE = float(os.getenv('SYS_PROFILE_SAMPLE_RATE', 0.0))
+SYS_PROFILE_DIR = os.getenv('SYS_PROFILE_DIR', '/tmp/balticlsc_profiles')
+
+_phase_time = metrics.histogram('balticlsc_phase_seconds', 'Time of the phases marked in the processing.', ['phase'])
+
+
+class Span:
+    def __init__(self, name: str):
+        self.name = name
+        self.children: List[Span] = []
+        self._started_at = time.perf_counter()
+        self._duration: Union[float, None] = None
+
+    def finish(self) -> None:
+        self._duration = time.perf_counter() - self._started_at
+
+    def get_duration(self) -> float:
+        return self._duration if self._duration is not None else time.perf_counter() - self._started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        span_dict: Dict[str, Any] = {'name': self.name, 'ms': round(self.get_duration() * 1000, 3)}
+
+        if self.children:
+            span_dict['children'] = [child.to_dict() for child in self.children]
+
+        return span_dict
+
+
+_current_msg_uid: ContextVar[Union[str, None]] = ContextVar('current_msg_uid', default=None)
+_current_span: ContextVar[Union[Span, None]] = ContextVar('current_span', default=None)
+
+
+def current_msg_uid() -> Union[str, None]:
+    """Message uid of the token processed in the current thread (or task)."""
+    return _current_msg_uid.get()
+
+
+@contextmanager
+def trace_token(msg_uid: str) -> Iterator[Span]:
+    """Root span of the processing of a token, the span tree is logged at the end.
+
+    A fraction (SYS_PROFILE_SAMPLE_RATE) of tokens is profiled with cProfile,
+    the profile is dumped in the pstats format to SYS_PROFILE_DIR/<msg_uid>.prof.
+    """
+    root = Span('token')
+    msg_uid_token = _current_msg_uid.set(msg_uid)
+    span_token = _current_span.set(root)
+    profile = _start_profile() if SYS_PROFILE_SAMPLE_RATE > 0.0 else None
+
+    try:
+        yield root
+    finally:
+        root.finish()
+
+        if profile is not None:
+            _dump_profile(profile, msg_uid)
+
+        if SYS_TRACING and logger.isEnabledFor(logging.INFO):
+            logger.info('trace %s', json.dumps({'msg_uid': msg_uid, 'span': root.to_dict()}))
+
+        _current_span.reset(span_token)
+        _current_msg_uid.reset(msg_uid_token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[Union[Span, None]]:
+    """Mark a phase of the processing, e.g. `with span('detection'): ...`."""
+    parent = _current_span.get()
+    child = Span(name)
+
+    if parent is not None:
+        parent.children.append(child)
+
+    span_token = _current_span.set(child)
+
+    try:
+        yield child
+    finally:
+        child.finish()
+        _current_span.reset(span_token)
+        _phase_time.observe(child.get_duration(), phase=name)
+
+
+def traced(name: Union[str, None] = None) -> Callable:
+    """Decorator marking every call of the function as a phase."""
+    def decorator(function: Callable) -> Callable:
+        phase_name = function.__qualname__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(phase_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _start_profile() -> Union[cProfile.Profile, None]:
+    if random.random() >= SYS_PROFILE_SAMPLE_RATE:
+        return None
+
+    profile = cProfile.Profile()
+
+    try:
+        profile.enable()
+    except ValueError:
+        # another token is being profiled at the moment
+        return None
+
+    return profile
+
+
+def _dump_profile(profile: cProfile.Profile, msg_uid: str) -> None:
+    profile.disable()
+    os.makedirs(SYS_PROFILE_DIR, exist_ok=True)
+    path = os.path.join(SYS_PROFILE_DIR, re.sub(r'[^\w.-]', '_', msg_uid) + '.prof')
+    profile.dump_stats(path)
+    logger.info('profile of the token %s saved to %s', msg_uid, path)
@@ -0,0 +1,34 @@
+import unittest
+
+from balticlsc.scheme.tracing import trace_token, span, traced, current_msg_uid
+
+
+@traced('decode')
+def _decode():
+    return current_msg_uid()
+
+
+class TestTracing(unittest.TestCase):
+    def test_span_tree(self):
+        with trace_token('1') as root:
+            with span('download'):
+                pass
+
+            with span('detection'):
+                self.assertEqual(_decode(), '1')
+
+        self.assertIsNone(current_msg_uid())
+        tree = root.to_dict()
+        self.assertEqual(tree['name'], 'token')
+        self.assertEqual([child['name'] for child in tree['children']], ['download', 'detection'])
+        self.assertEqual(tree['children'][1]['children'][0]['name'], 'decode')
+
+    def test_span_outside_of_token(self):
+        with span('download') as download:
+            pass
+
+        self.assertGreaterEqual(download.get_duration(), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
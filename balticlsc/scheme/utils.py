@@ -1,24 +1,103 @@
 import json
 import re
+from enum import Enum
+from functools import lru_cache
 from hashlib import md5
 from time import localtime
+from typing import Dict, Any, Tuple, Iterable, Union
+
+try:
+    import orjson
+except ImportError:
+    # optional, the standard json module is used without it
+    orjson = None
+
+_CAMEL_CASE_BOUNDARY = re.compile(r'(?<!^)(?=[A-Z])')
+# conversions of the keys of the known schemas (tokens, pins), filled with register_keys
+_camel_to_snake_keys: Dict[str, str] = {}
+_snake_to_camel_keys: Dict[str, str] = {}
 
 
 class JsonRepr:
+    # empty slots, so that the subclasses defining __slots__ do not get a __dict__
+    __slots__ = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {snake_to_camel(key): value.name if isinstance(value, Enum) else value
+                for key, value in _get_fields(self).items()}
+
     def to_json(self) -> str:
-        camel_dict = {snake_to_camel(key): value for key, value in self.__dict__.items()}
-        return json.dumps(camel_dict, default=lambda o: o.__dict__, indent=3)
+        return dumps(self.to_dict())
 
+    # cheap, the object is not serialized to json
     def __repr__(self) -> str:
-        return self.to_json()
+        return type(self).__name__ + '(' + ', '.join(f'{key}={value!r}' for key, value in self.to_dict().items()) + ')'
+
+
+def dumps(o: Any) -> str:
+    """Compact json, serialized with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(o, default=_to_serializable).decode('utf-8')
+
+    return json.dumps(o, default=_to_serializable, separators=(',', ':'))
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _to_serializable(o):
+    if isinstance(o, Enum):
+        return o.name
+
+    if isinstance(o, JsonRepr):
+        return o.to_dict()
+
+    return _get_fields(o)
+
+
+def _get_fields(o) -> Dict[str, Any]:
+    if hasattr(o, '__dict__'):
+        return o.__dict__
+
+    return {name: getattr(o, name) for name in _get_slot_names(type(o)) if hasattr(o, name)}
+
+
+@lru_cache(maxsize=None)
+def _get_slot_names(cls: type) -> Tuple[str, ...]:
+    return tuple(name for klass in reversed(cls.__mro__) for name in klass.__dict__.get('__slots__', ()))
 
 
 def camel_to_snake(name: str) -> str:
-    pattern = re.compile(r'(?<!^)(?=[A-Z])')
-    return pattern.sub('_', name).lower()
+    try:
+        return _camel_to_snake_keys[name]
+    except KeyError:
+        return _camel_to_snake(name)
 
 
 def snake_to_camel(name: str) -> str:
+    try:
+        return _snake_to_camel_keys[name]
+    except KeyError:
+        return _snake_to_camel(name)
+
+
+def register_keys(snake_names: Iterable[str]) -> None:
+    """Precompute the conversions of the keys, including the "_" prefixed attribute names."""
+    for snake_name in snake_names:
+        camel_name = _snake_to_camel(snake_name)
+        _snake_to_camel_keys[snake_name] = camel_name
+        _snake_to_camel_keys['_' + snake_name] = camel_name
+        _camel_to_snake_keys[camel_name] = _camel_to_snake(camel_name)
+
+
+@lru_cache(maxsize=1024)
+def _camel_to_snake(name: str) -> str:
+    return _CAMEL_CASE_BOUNDARY.sub('_', name).lower()
+
+
+@lru_cache(maxsize=1024)
+def _snake_to_camel(name: str) -> str:
     return ''.join(word.title() for word in name.split('_'))
 
 
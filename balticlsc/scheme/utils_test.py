@@ -0,0 +1,24 @@
+import unittest
+
+from balticlsc.scheme.utils import camel_to_snake, snake_to_camel, register_keys
+
+
+class TestKeyConversion(unittest.TestCase):
+    def test_camel_to_snake(self):
+        self.assertEqual(camel_to_snake('AccessCredential'), 'access_credential')
+        self.assertEqual(camel_to_snake('accessCredential'), 'access_credential')
+        self.assertEqual(camel_to_snake('host'), 'host')
+
+    def test_snake_to_camel(self):
+        self.assertEqual(snake_to_camel('base_msg_uid'), 'BaseMsgUid')
+        self.assertEqual(snake_to_camel('_base_msg_uid'), 'BaseMsgUid')
+
+    def test_registered_keys(self):
+        register_keys(['some_new_key'])
+        self.assertEqual(snake_to_camel('some_new_key'), 'SomeNewKey')
+        self.assertEqual(snake_to_camel('_some_new_key'), 'SomeNewKey')
+        self.assertEqual(camel_to_snake('SomeNewKey'), 'some_new_key')
+
+
+if __name__ == '__main__':
+    unittest.main()
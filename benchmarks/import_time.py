@@ -0,0 +1,101 @@
+"""Start-up time of a module: importing the api and initializing it, each run in a fresh interpreter.
+
+    python benchmarks/import_time.py --runs 20
+    python benchmarks/import_time.py --top 15  # the slowest imports (python -X importtime)
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+_PINS = [
+    {'PinName': 'Input', 'PinType': 'input', 'AccessType': 'ftp',
+     'AccessCredential': {'Host': '127.0.0.1', 'User': 'user', 'Password': 'password', 'Port': 21}},
+    {'PinName': 'Output', 'PinType': 'output', 'AccessType': 'ftp'},
+]
+
+_PROCESSING = '''
+from balticlsc.scheme.processing import ProcessingInterface
+class Processing(ProcessingInterface):
+    def process(self, msg_uid, input_pin, output_pin_name_to_value):
+        pass
+'''
+
+# name -> code timed in a fresh interpreter
+_SCENARIOS = {
+    'import dispatcher': 'import balticlsc.scheme.dispatcher',
+    'import asgi': 'import balticlsc.scheme.asgi',
+    'import api': 'import balticlsc.scheme.api',
+    'init asgi': 'from balticlsc.scheme.asgi import init_baltic_asgi' + _PROCESSING + 'init_baltic_asgi(Processing)',
+    'init api': 'from balticlsc.scheme.api import init_baltic_api' + _PROCESSING + 'init_baltic_api(Processing)',
+}
+
+_REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TIMED = '''
+import time
+started_at = time.perf_counter()
+{code}
+print(time.perf_counter() - started_at)
+'''
+
+
+def _run(code: str, env: dict) -> float:
+    # run in the repository, python -c imports from the current directory first
+    output = subprocess.run([sys.executable, '-c', _TIMED.format(code=code)], env=env, cwd=_REPOSITORY, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    return float(output.split()[-1])
+
+
+def _print_top_imports(code: str, env: dict, top: int) -> None:
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, cwd=_REPOSITORY, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    imports = []
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        own, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), int(own), name.rstrip()))
+
+    print(f'{"cumulative ms":>14} {"self ms":>8}  module')
+
+    for cumulative, own, name in sorted(imports, reverse=True)[:top]:
+        print(f'{cumulative / 1000:14.1f} {own / 1000:8.1f}  {name}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per scenario')
+    parser.add_argument('--top', type=int, default=0, help='print the slowest imports of "init api" instead')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        pins_path = os.path.join(directory, 'pins.json')
+
+        with open(pins_path, 'w') as pins_file:
+            json.dump(_PINS, pins_file)
+
+        env = dict(os.environ, SYS_PIN_CONFIG_FILE_PATH=pins_path, SYS_LOG_LEVEL='WARNING', SYS_EXECUTOR_WORKERS='1')
+
+        if args.top:
+            _print_top_imports(_SCENARIOS['init api'], env, args.top)
+            return
+
+        cached_env = dict(env, SYS_PIN_CONFIG_CACHE_PATH=os.path.join(directory, 'pins.cache'))
+        print(f'{"scenario":<24} {"median ms":>10} {"min ms":>8}')
+
+        for name, code in _SCENARIOS.items():
+            timings = [_run(code, env) for _ in range(args.runs)]
+            print(f'{name:<24} {statistics.median(timings) * 1000:10.1f} {min(timings) * 1000:8.1f}')
+
+        # the first run writes the pins cache
+        timings = [_run(_SCENARIOS['init api'], cached_env) for _ in range(args.runs + 1)][1:]
+        print(f'{"init api, cached pins":<24} {statistics.median(timings) * 1000:10.1f} {min(timings) * 1000:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
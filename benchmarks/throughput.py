@@ -0,0 +1,352 @@
+"""Throughput, end-to-end latency and memory of a module served by `init_baltic_api`.
+
+The module runs in this process, next to a fake batch manager receiving its tokens and acks
+and, with --ftp, an FTP server (pyftpdlib) holding the input files. Every token downloads its
+file, hashes it and uploads it back. The latency of a token is measured from the time it is
+due to be posted to the time its final ack arrives at the batch manager. The peak memory
+includes the load generator and the stand-ins, they are the same for the compared runs.
+
+    python benchmarks/throughput.py --tokens 2000 --rate 200
+    python benchmarks/throughput.py --ftp --file-size 1048576 --json release.json
+    SYS_EXECUTOR_TYPE=process python benchmarks/throughput.py --baseline release.json
+
+The SYS_* variables of the module are taken from the environment. With --baseline the
+run fails (exit code 1) when it is worse than the baseline by more than --tolerance.
+"""
+import argparse
+import glob
+import hashlib
+import http.client
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any
+
+# the module is imported from this repository, not from an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_INPUT_FOLDER = '/input'
+_OUTPUT_FOLDER = '/output'
+_FTP_USER = 'benchmark'
+_FTP_PASSWORD = 'benchmark'
+
+# (name, bigger is better) of the results compared with the baseline
+_COMPARED = [('tokens_per_sec', True), ('latency_p50_ms', False), ('latency_p99_ms', False),
+             ('peak_rss_mb', False)]
+
+rest_client = None
+
+
+class _BatchManager(BaseHTTPRequestHandler):
+    """Receives the messages of the module, records when the final ack of every token arrived."""
+    protocol_version = 'HTTP/1.1'
+    lock = threading.Lock()
+    acked_at: Dict[str, float] = {}
+    failed: List[str] = []
+    outputs = 0
+    all_acked = threading.Event()
+    expected = 0
+
+    def do_POST(self):
+        message = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        now = time.perf_counter()
+
+        with self.lock:
+            if self.path == '/ack' and message['IsFinal']:
+                for msg_uid in message['MsgUids']:
+                    _BatchManager.acked_at.setdefault(msg_uid, now)
+
+                    if message['IsFailed']:
+                        _BatchManager.failed.append(msg_uid)
+
+                if len(_BatchManager.acked_at) >= _BatchManager.expected:
+                    _BatchManager.all_acked.set()
+            elif self.path == '/token':
+                _BatchManager.outputs += 1
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_batch_manager() -> int:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _BatchManager)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake batch manager', daemon=True).start()
+    return server.server_address[1]
+
+
+def _start_ftp_server(root: str, tokens: int, file_size: int) -> int:
+    try:
+        from pyftpdlib.authorizers import DummyAuthorizer
+        from pyftpdlib.handlers import FTPHandler
+        from pyftpdlib.servers import ThreadedFTPServer
+    except ImportError:
+        sys.exit('--ftp needs pyftpdlib (pip install pyftpdlib)')
+
+    # pyftpdlib logs every command unless its logger already has a handler
+    ftp_logger = logging.getLogger('pyftpdlib')
+    ftp_logger.addHandler(logging.NullHandler())
+    ftp_logger.propagate = False
+    os.makedirs(root + _INPUT_FOLDER)
+    data = os.urandom(file_size)
+
+    for index in range(tokens):
+        with open(f'{root}{_INPUT_FOLDER}/{index}.bin', 'wb') as input_file:
+            input_file.write(data)
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user(_FTP_USER, _FTP_PASSWORD, root, perm='elradfmwMT')
+    handler = type('BenchmarkFTPHandler', (FTPHandler,), {'authorizer': authorizer})
+    server = ThreadedFTPServer(('127.0.0.1', 0), handler)
+    server.max_cons = 256
+    threading.Thread(target=server.serve_forever, name='ftp server', daemon=True).start()
+    return server.address[1]
+
+
+def _write_pins(path: str, ftp_port: int) -> None:
+    input_pin = {'PinName': 'Input', 'PinType': 'input', 'AccessType': 'ftp' if ftp_port else 'local'}
+
+    if ftp_port:
+        input_pin['AccessCredential'] = {'Host': '127.0.0.1', 'Port': ftp_port, 'User': _FTP_USER,
+                                         'Password': _FTP_PASSWORD}
+
+    with open(path, 'w') as pins_file:
+        json.dump([input_pin, {'PinName': 'Output', 'PinType': 'output', 'AccessType': 'ftp'}], pins_file)
+
+
+def _create_processing():
+    from balticlsc.access.ftp import pooled_connection, download_buffer, upload_buffer
+    from balticlsc.configs.credential.ftp import FTPCredential
+    from balticlsc.scheme.pin import PinAttribute, ValuesAttribute
+    from balticlsc.scheme.processing import ProcessingInterface
+
+    class Processing(ProcessingInterface):
+        def process(self, msg_uid, input_pin, output_pin_name_to_value):
+            path = input_pin.getattr(PinAttribute.ACCESS_PATH)
+            credential = input_pin.getattr(PinAttribute.ACCESS_CREDENTIAL)
+
+            if credential is not None:
+                with pooled_connection(FTPCredential(**credential)) as ftp:
+                    data = download_buffer(path, ftp).read()
+                    hashlib.sha256(data).digest()
+                    upload_buffer(os.path.basename(path), _OUTPUT_FOLDER, ftp, data)
+
+            rest_client.send_output_token(base_msg_uid=msg_uid, output_pin_name='Output',
+                                          values={ValuesAttribute.RESOURCE_PATH: _OUTPUT_FOLDER})
+            rest_client.send_ack_token(msg_uids=[msg_uid], is_final=True)
+
+    return Processing
+
+
+def _wait_until_ready(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        connection.request('GET', '/ready')
+
+        if connection.getresponse().status == 200:
+            return
+
+        time.sleep(0.1)
+
+    sys.exit(f'the module was not ready within {timeout} seconds')
+
+
+def _generate_load(port: int, tokens: int, rate: float, concurrency: int) -> Dict[str, Any]:
+    """Posts the tokens, at `rate` tokens/sec or as fast as the module accepts them when 0."""
+    lock = threading.Lock()
+    next_index = [0]
+    due_at: Dict[str, float] = {}
+    rejected = [0]
+    started_at = time.perf_counter()
+
+    def post():
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+
+            if index >= tokens:
+                return
+
+            msg_uid = str(index)
+            due = started_at + index / rate if rate > 0 else time.perf_counter()
+            time.sleep(max(0.0, due - time.perf_counter()))
+            due_at[msg_uid] = due
+            body = json.dumps({'MsgUid': msg_uid, 'PinName': 'Input',
+                               'Values': json.dumps({'ResourcePath': f'{_INPUT_FOLDER}/{index}.bin'})})
+
+            while True:
+                connection.request('POST', '/token', body, {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+
+                if response.status != 503:
+                    break
+
+                with lock:
+                    rejected[0] += 1
+
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=post, name=f'load {index}') for index in range(concurrency)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return {'started_at': started_at, 'due_at': due_at, 'rejected': rejected[0]}
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return float('nan')
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _get_peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    unit = 1 if sys.platform == 'darwin' else 1024
+    # worker processes which exited are counted as children
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss +
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * unit
+    # the running worker processes (SYS_EXECUTOR_TYPE=process) are read from /proc on linux,
+    # they are children of the thread which forked them
+    for children_path in glob.glob(f'/proc/{os.getpid()}/task/*/children'):
+        with open(children_path) as children_file:
+            for pid in children_file.read().split():
+                try:
+                    with open(f'/proc/{pid}/status') as status_file:
+                        peak += sum(int(line.split()[1]) * 1024 for line in status_file if line.startswith('VmHWM:'))
+                except OSError:
+                    pass
+
+    return peak / 2 ** 20
+
+
+def _compare(results: Dict[str, Any], baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    passed = True
+    # the output options do not change the results
+    parameters = {name: value for name, value in results['parameters'].items()
+                  if name not in {'json', 'baseline', 'tolerance'}}
+    different = [name for name, value in parameters.items() if baseline['parameters'].get(name) != value]
+
+    if different:
+        print(f'\nthe parameters differ from the baseline: {", ".join(different)}')
+
+    print(f'\n{"compared to " + baseline_path:<32} {"baseline":>10} {"current":>10} {"change":>8}')
+
+    for name, bigger_is_better in _COMPARED:
+        before, after = baseline['results'][name], results['results'][name]
+        change = (after - before) / before if before else 0.0
+        regressed = change < -tolerance if bigger_is_better else change > tolerance
+        passed = passed and not regressed
+        print(f'{name:<32} {before:10.1f} {after:10.1f} {change:+8.1%}{"  REGRESSION" if regressed else ""}')
+
+    return passed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=1000, help='number of tokens')
+    parser.add_argument('--rate', type=float, default=0.0, help='tokens posted per second, 0 posts them at once')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of connections posting tokens')
+    parser.add_argument('--ftp', action='store_true', help='process input files served by a local FTP server')
+    parser.add_argument('--file-size', type=int, default=64 * 1024, help='size of an input file in bytes')
+    parser.add_argument('--timeout', type=float, default=300.0, help='seconds to wait for all the final acks')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative regression')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='balticlsc_benchmark_')
+    batch_manager_port = _start_batch_manager()
+    ftp_port = _start_ftp_server(os.path.join(directory, 'ftp'), args.tokens, args.file_size) if args.ftp else 0
+    pins_path = os.path.join(directory, 'pins.json')
+    _write_pins(pins_path, ftp_port)
+    # read by the module when it is imported
+    os.environ.update({
+        'SYS_BATCH_MANAGER_TOKEN_ENDPOINT': f'http://127.0.0.1:{batch_manager_port}/token',
+        'SYS_BATCH_MANAGER_ACK_ENDPOINT': f'http://127.0.0.1:{batch_manager_port}/ack',
+        'SYS_PIN_CONFIG_FILE_PATH': pins_path,
+    })
+    os.environ.setdefault('SYS_LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('SYS_TRACING', 'false')
+
+    from werkzeug.serving import make_server
+    from balticlsc.scheme.api import init_baltic_api
+
+    global rest_client
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    app, rest_client = init_baltic_api(_create_processing())
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='module api', daemon=True).start()
+    _wait_until_ready(server.server_port, timeout=60.0)
+
+    _BatchManager.expected = args.tokens
+    load = _generate_load(server.server_port, args.tokens, args.rate, args.concurrency)
+    completed = _BatchManager.all_acked.wait(args.timeout)
+
+    with _BatchManager.lock:
+        acked_at = dict(_BatchManager.acked_at)
+        failed = len(_BatchManager.failed)
+
+    latencies = [(acked_at[msg_uid] - due) * 1000 for msg_uid, due in load['due_at'].items() if msg_uid in acked_at]
+    duration = max(acked_at.values(), default=load['started_at']) - load['started_at']
+    results = {
+        'parameters': {**vars(args), 'env': {key: value for key, value in os.environ.items()
+                                             if key.startswith('SYS_') and 'ENDPOINT' not in key
+                                             and key != 'SYS_PIN_CONFIG_FILE_PATH'}},
+        'python': platform.python_version(),
+        'results': {
+            'completed': len(acked_at),
+            'failed': failed,
+            'rejected_posts': load['rejected'],
+            'duration_sec': duration,
+            'tokens_per_sec': len(acked_at) / duration if duration > 0 else 0.0,
+            'latency_p50_ms': _percentile(latencies, 50),
+            'latency_p99_ms': _percentile(latencies, 99),
+            'peak_rss_mb': _get_peak_rss_mb(),
+        },
+    }
+
+    for name, value in results['results'].items():
+        print(f'{name:<16} {value:10.1f}' if isinstance(value, float) else f'{name:<16} {value:10d}')
+
+    if not completed:
+        print(f'only {len(acked_at)} of {args.tokens} tokens were acked within {args.timeout} seconds')
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+    passed = args.baseline is None or _compare(results, args.baseline, args.tolerance)
+    server.shutdown()
+    shutil.rmtree(directory, ignore_errors=True)
+    sys.exit(0 if completed and passed else 1)
+
+
+if __name__ == '__main__':
+    main()
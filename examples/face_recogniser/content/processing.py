@@ -1,29 +1,92 @@
 import os
+from collections import defaultdict
+from io import BytesIO
 from typing import List, Tuple, Dict
 
-import face_recognition
-
-from matplotlib import pyplot, patches
-
-from PIL import Image
+from PIL import Image, ImageDraw
 
 import numpy as np
 
-from balticlsc.access.ftp import upload_file, get_connection
+from balticlsc.access.pipeline import FTPPipeline
 from balticlsc.configs.credential.ftp import FTPCredential
 from balticlsc.scheme.api import init_baltic_api
 from balticlsc.scheme.logger import logger
 from balticlsc.scheme.pin import Pin, MissingPin, PinAttribute, ValuesAttribute
 from balticlsc.scheme.processing import ProcessingInterface
+from balticlsc.scheme.tracing import span
 from balticlsc.scheme.utils import camel_to_snake, get_random_output_folder
 
 MODULE_VERSION = 'latest'
+# number of images detected together
+BATCH_SIZE = int(os.getenv('FACE_BATCH_SIZE', '16'))
+# hog (cpu) or cnn, only cnn detects a batch of images at once, hog detects them one by one
+DETECTION_MODEL = os.getenv('FACE_DETECTION_MODEL', 'hog')
+
+# top, right, bottom, left
+FaceCoords = Tuple[int, int, int, int]
+# imported by Processing.setup, loading dlib and its models is the slowest part of the start
+face_recognition = None
+
+
+def decode(file) -> Tuple[Image.Image, str]:
+    image = Image.open(file)
+    # the file is closed when the next one is read, so the image is loaded now
+    image.load()
+    return image, image.format
+
+
+def to_array(image: Image.Image) -> np.ndarray:
+    # the detector takes RGB, the image keeps its mode for the output
+    return np.array(image if image.mode == 'RGB' else image.convert('RGB'))
+
+
+def detect(images: List[np.ndarray]) -> List[List[FaceCoords]]:
+    """Face locations of the images, images of the same size are detected as one batch with the cnn model."""
+    faces_coords: List[List[FaceCoords]] = [[] for _ in images]
+    size_to_indexes: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+
+    for index, image in enumerate(images):
+        size_to_indexes[image.shape].append(index)
+
+    for indexes in size_to_indexes.values():
+        if DETECTION_MODEL == 'cnn' and len(indexes) > 1:
+            batch = face_recognition.batch_face_locations([images[index] for index in indexes],
+                                                          batch_size=len(indexes))
+        else:
+            batch = [face_recognition.face_locations(images[index], model=DETECTION_MODEL) for index in indexes]
+
+        for index, coords in zip(indexes, batch):
+            faces_coords[index] = coords
+
+    return faces_coords
+
+
+def mark_faces(image: Image.Image, faces_coords: List[FaceCoords], image_format: str) -> memoryview:
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    # drawn in color, keeping the alpha channel
+    marked = image if image.mode in ('RGB', 'RGBA') else image.convert('RGBA' if has_alpha else 'RGB')
+    draw = ImageDraw.Draw(marked)
+
+    for top, right, bottom, left in faces_coords:
+        draw.rectangle((left, top, right, bottom), outline=(255, 0, 0), width=2)
+
+    # encoded in the mode of the input, palette images keep the colors of the marks
+    if marked.mode != image.mode and image.mode not in ('P', 'PA', '1'):
+        marked = marked.convert(image.mode)
+
+    output = BytesIO()
+    marked.save(output, format=image_format)
+    return output.getbuffer()
 
 
 class Processing(ProcessingInterface):
+    def setup(self) -> None:
+        global face_recognition
+        import face_recognition
+
     def process(self, msg_uid: str, input_pin: Pin,  output_pin_name_to_value: Dict[str, Pin]) -> None:
-        logger.info('module version = ' + MODULE_VERSION)
-        logger.info('starting processing for input pin="' + str(input_pin) + '"')
+        logger.info('module version = %s', MODULE_VERSION)
+        logger.info('starting processing for input pin="%s"', input_pin)
         input_access_credential = input_pin.getattr(PinAttribute.ACCESS_CREDENTIAL)
         input_folder = input_pin.getattr(PinAttribute.ACCESS_PATH)
 
@@ -43,7 +106,7 @@ class Processing(ProcessingInterface):
             raise MissingPin([pin for pin in output_pin_name_to_value.values()], error_msg)
 
         output_pin = output_pin_name_to_value[output_pin_name]
-        logger.info('loading output pin=' + str(output_pin))
+        logger.info('loading output pin=%s', output_pin)
         output_access_credential = output_pin.getattr(PinAttribute.ACCESS_CREDENTIAL)
 
         if output_access_credential is None:
@@ -73,77 +136,35 @@ class Processing(ProcessingInterface):
                 output_folder = get_random_output_folder(input_folder)
             else:
                 output_folder = output_access_path['resource_path']
-                logger.info('setting output folder based on output pin config "resource_path"=' + output_folder)
+                logger.info('setting output folder based on output pin config "resource_path"=%s', output_folder)
         # STOP # Establish output credentials and folder # STOP #
-        logger.info('connecting to input ftp server: ' + input_ftp_credential.host)
-        input_ftp = get_connection(input_ftp_credential)
-
-        if output_ftp_credential != input_ftp_credential:
-            logger.info('connecting to output ftp server: ' + output_ftp_credential.host)
-            output_ftp = get_connection(output_ftp_credential)
-        else:
-            logger.info('using the same connection as output ftp')
-            output_ftp = input_ftp
         # START # process and send files # START #
-        logger.info('changing ftp working directory to "' + input_folder + '"')
-        input_ftp.cwd(input_folder)
-        logger.info('working directory changed')
-        logger.info('listing files in the working directory ...')
-        filenames: List[str] = input_ftp.nlst()
-        logger.info('handling ' + str(len(filenames)) + ' files')
-        os.makedirs('tmp', exist_ok=True)
-
-        for filename in filenames:
-            if not filename.lower().endswith(('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')):
-                logger.warning('wrong format of the file "' + filename + '", omitting')
-                continue
-
-            logger.info('downloading file "' + filename + '"')
-            filepath = 'tmp/' + filename
-            # Save the image locally
-            with open(filepath, 'wb') as file:
-                input_ftp.retrbinary("RETR " + filename, file.write)
-            # Mark faces and save the image
-            image = np.array(Image.open(filepath))
-            im = Image.fromarray(image)
-            im.save(filepath)
-            height: int = image.shape[0]
-            width: int = image.shape[1]
-            dpi: int = 100
-            faces_coords: List[Tuple[int]] = face_recognition.face_locations(image)
-            figure = pyplot.figure(frameon=False, dpi=dpi)
-            figure.set_size_inches(width / dpi, height / dpi)
-            ax = pyplot.Axes(figure, [0., 0., 1., 1.])
-            ax.set_axis_off()
-            figure.add_axes(ax)
-            ax.imshow(image)
-            logger.info('adding ' + str(len(faces_coords)) + ' faces to image "' + filename + '"')
-            fig = pyplot.gcf()
-            fig.savefig(fname=filepath, dpi=dpi, bbox_inches='tight')
-
-            for index in range(len(faces_coords)):
-                x_start = faces_coords[index][3]
-                y_start = faces_coords[index][0]
-                x_width = (faces_coords[index][1] - faces_coords[index][3])
-                y_height = (faces_coords[index][2] - faces_coords[index][0])
-                rect = patches.Rectangle((x_start, y_start), x_width, y_height,
-                                         edgecolor='r', facecolor="none")
-                ax.add_patch(rect)
-
-            pyplot.savefig(fname=filepath, dpi=dpi, bbox_inches='tight')
-            pyplot.close()
-            # Send file to ftp
-            with open(filepath, 'rb') as file:
-                logger.info('uploading file "' + filename + '" into ' + output_folder)
-                upload_file(filename, output_folder, output_ftp, file)
-                file.close()  # close file and FTP
+        with FTPPipeline(input_ftp_credential, input_folder, output_ftp_credential, output_folder) as pipeline:
+            logger.info('listing files in "%s" ...', input_folder)
+            filenames: List[str] = []
 
-            input_ftp.cwd(input_folder)
-        # STOP # process and send files # STOP #
-        input_ftp.quit()
+            for filename in pipeline.list():
+                if not filename.lower().endswith(('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')):
+                    logger.warning('wrong format of the file "%s", omitting', filename)
+                else:
+                    filenames.append(filename)
+
+            logger.info('handling %d files', len(filenames))
+
+            # the next files are downloaded and the previous ones uploaded while detecting the current batch
+            batch: List[Tuple[str, Image.Image, str]] = []
 
-        if output_ftp_credential != input_ftp_credential:
-            output_ftp.quit()
+            for filename, file in pipeline.files(filenames):
+                with span('decode'):
+                    batch.append((filename, *decode(file)))
+
+                if len(batch) >= BATCH_SIZE:
+                    self.handle_batch(pipeline, batch)
+                    batch = []
+
+            if batch:
+                self.handle_batch(pipeline, batch)
+        # STOP # process and send files # STOP #
 
         rest_client.send_output_token(
             base_msg_uid=msg_uid,
@@ -157,5 +178,19 @@ class Processing(ProcessingInterface):
             is_failed=False,
         )
 
+    @staticmethod
+    def handle_batch(pipeline: FTPPipeline, batch: List[Tuple[str, Image.Image, str]]) -> None:
+        with span('detection'):
+            faces_coords = detect([to_array(image) for _, image, _ in batch])
+
+        for (filename, image, image_format), coords in zip(batch, faces_coords):
+            logger.info('adding %d faces to image "%s"', len(coords), filename)
+
+            with span('render'):
+                data = mark_faces(image, coords, image_format)
+
+            # Send file to ftp
+            pipeline.upload(filename, data)
+
 
 app, rest_client = init_baltic_api(Processing)